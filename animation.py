@@ -0,0 +1,111 @@
+"""
+Frame-capped color animation.
+
+An Effect describes brightness over one cycle. Its frame table is computed
+once for the animation's frame rate, and each color is looked up in a ramp
+precomputed per base color, so a frame costs two integer indexes rather
+than float math, and nothing at all between frames.
+"""
+
+import time
+from array import array
+
+
+def color_ramp(color, steps=32, floor=0.075):
+    """``steps`` colors from ``floor`` times ``color`` up to ``color`` itself."""
+    r = color >> 16 & 0xFF
+    g = color >> 8 & 0xFF
+    b = color & 0xFF
+    ramp = array("L", [0] * steps)
+    for k in range(steps):
+        intensity = floor + (1 - floor) * k / (steps - 1)
+        ramp[k] = int(intensity*r) << 16 | int(intensity*g) << 8 | int(intensity*b)
+    return ramp
+
+
+class Effect:
+
+    loop = True
+
+    def __init__(self, period=4):
+        self.period = period
+
+    # Brightness from 0 to 1 at ``phase`` (0 to 1) through the cycle
+    def level(self, phase):
+        return 1
+
+    def table(self, fps, steps):
+        """Ramp index for each frame of one cycle. Effects that don't loop get
+        a final entry to hold once the cycle is over."""
+        frames = max(1, int(self.period * fps + 0.5))
+        n = frames if self.loop else frames + 1
+        return bytes([int(self.level(f / frames) * (steps - 1) + 0.5) for f in range(n)])
+
+
+class Breathe(Effect):
+
+    def level(self, phase):
+        return 1 - abs(1 - 2*phase)
+
+
+class Blink(Effect):
+
+    def __init__(self, period=1, duty=0.5):
+        super().__init__(period)
+        self.duty = duty
+
+    def level(self, phase):
+        return 1 if phase < self.duty else 0
+
+
+class FadeIn(Effect):
+
+    loop = False
+
+    def __init__(self, period=1):
+        super().__init__(period)
+
+    def level(self, phase):
+        return phase
+
+
+EFFECTS = {"breathe": Breathe, "blink": Blink, "fadein": FadeIn}
+
+
+class ColorAnimation:
+
+    def __init__(self, fps=20, steps=32):
+        self.fps = fps
+        self.steps = steps
+        self._ramp = None
+        self._table = b"\x00"
+        self._loop = True
+        self.restart()
+
+    def set_effect(self, effect):
+        self._table = effect.table(self.fps, self.steps)
+        self._loop = effect.loop
+        self.restart()
+
+    def set_ramp(self, ramp):
+        self._ramp = ramp
+        self.restart()
+
+    def restart(self, now=None):
+        self._start = time.monotonic() if now is None else now
+        self._frame = -1
+        self._level = -1
+
+    def step(self, now):
+        """The color to show if it changed since the last call, else None.
+        Does nothing until the next frame is due."""
+        frame = int((now - self._start) * self.fps)
+        if frame == self._frame or self._ramp is None:
+            return None
+        self._frame = frame
+        n = len(self._table)
+        level = self._table[frame % n if self._loop else min(frame, n - 1)]
+        if level == self._level:
+            return None
+        self._level = level
+        return self._ramp[level]
@@ -0,0 +1,80 @@
+"""
+Reader for fonts compiled by scripts/compile_font.py.
+
+All values are big-endian:
+
+  header    4s "FNT1", B version, 4 x b bounding box (width, height,
+            x offset, y offset), H glyph count
+  glyphs    count x (I codepoint, B width, B height, b dx, b dy,
+            b shift_x, b shift_y), sorted by codepoint
+  bitmaps   each glyph's rows in the same order, one bit a pixel, every
+            row padded to a whole byte as in BDF
+
+The file is read into RAM in one go and every glyph is made into a Bitmap
+there and then, so there's no text to parse and nothing left to load when
+the first frame is drawn. The result is used like an adafruit_bitmap_font
+font.
+
+load_font() takes the path of the BDF the font was compiled from, uses the
+.fnt beside it if there is one and the BDF if not, and hands out the same
+font object to every mode that asks for it.
+"""
+
+import os
+import struct
+import displayio
+from adafruit_bitmap_font import bitmap_font
+from adafruit_bitmap_font.glyph_cache import Glyph
+
+_fonts = {}
+
+
+def load_font(path):
+    font = _fonts.get(path)
+    if font is None:
+        try:
+            font = BinaryFont(path.rsplit(".", 1)[0] + ".fnt")
+        except OSError:
+            print("No compiled font for {}".format(path))
+            font = bitmap_font.load_font(path)
+        _fonts[path] = font
+    return font
+
+
+class BinaryFont:
+
+    def __init__(self, path):
+        data = bytearray(os.stat(path)[6])
+        with open(path, "rb") as f:
+            f.readinto(data)
+        if len(data) < 11 or data[:4] != b"FNT1":
+            raise ValueError("{} is not a compiled font".format(path))
+        self._box = struct.unpack_from(">bbbb", data, 5)
+        count = struct.unpack_from(">H", data, 9)[0]
+        self._glyphs = {}
+        p = 11 + 10 * count
+        for n in range(count):
+            cp, width, height, dx, dy, shift_x, shift_y = struct.unpack_from(
+                ">IBBbbbb", data, 11 + 10 * n)
+            bitmap = displayio.Bitmap(max(1, width), max(1, height), 2)
+            stride = (width + 7) // 8
+            for y in range(height):
+                for i in range(stride):
+                    b = data[p + i]
+                    # Bitmaps start out zeroed, so blank bytes are skipped
+                    if b:
+                        for x in range(8 * i, min(width, 8 * i + 8)):
+                            if b & 0x80 >> (x & 7):
+                                bitmap[x, y] = 1
+                p += stride
+            self._glyphs[cp] = Glyph(bitmap, 0, width, height, dx, dy, shift_x, shift_y)
+
+    def get_bounding_box(self):
+        return self._box
+
+    # Every glyph is loaded already
+    def load_glyphs(self, code_points):
+        pass
+
+    def get_glyph(self, code_point):
+        return self._glyphs.get(code_point)
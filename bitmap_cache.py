@@ -0,0 +1,170 @@
+"""
+Decoded bitmaps kept in RAM, so pictures that come round again are shown
+without going back to flash.
+
+load_bmp() reads a palettised BMP into a displayio.Bitmap and Palette.
+BitmapCache holds ready-made TileGrids keyed by picture path (or any other
+key) and evicts the least recently used ones once they exceed a byte budget
+taken as a fraction of gc.mem_free(), or whenever free memory runs low.
+
+load_image() keeps the Bitmap and Palette of each file in one such cache
+shared by all the modes, so the wings AirMode shows for two submodes, a
+weather icon that comes back, or a picture a message shares with them is
+read once. Each user wraps the pair in a TileGrid of its own, as a TileGrid
+can only be in one group at a time. forget_image() drops a file that has
+been replaced.
+"""
+
+import gc
+import struct
+import displayio
+
+
+def read_header(f, path):
+    """(offset, header size, width, height, bits, colors) of the palettised
+    BMP open as ``f``; raises ValueError if it isn't one."""
+    header = f.read(50)
+    if len(header) < 50 or header[:2] != b"BM":
+        raise ValueError("{} is not a BMP file".format(path))
+    offset = struct.unpack_from("<I", header, 10)[0]
+    header_size, width, height, _, bits = struct.unpack_from("<IiiHH", header, 14)
+    if bits > 8:
+        raise ValueError("{} is not palettised".format(path))
+    colors = struct.unpack_from("<I", header, 46)[0] or 1 << bits
+    return offset, header_size, width, height, bits, colors
+
+
+def load_bmp(path):
+    """Read a 1, 4 or 8-bit BMP into a new (Bitmap, Palette) pair."""
+    with open(path, "rb") as f:
+        offset, header_size, width, height, bits, colors = read_header(f, path)
+
+        f.seek(14 + header_size)
+        raw = f.read(4 * colors)
+        palette = displayio.Palette(colors)
+        for c in range(colors):
+            palette[c] = raw[4*c + 2] << 16 | raw[4*c + 1] << 8 | raw[4*c]
+
+        rows = abs(height)
+        bitmap = displayio.Bitmap(width, rows, 1 << bits)
+        row = bytearray((width * bits + 31) // 32 * 4)
+        mask = (1 << bits) - 1
+        per_byte = 8 // bits
+        f.seek(offset)
+        for i in range(rows):
+            f.readinto(row)
+            # Rows are stored bottom-up unless the height is negative
+            p = width * (rows - 1 - i if height > 0 else i)
+            for x in range(width):
+                shift = 8 - bits * (x % per_byte + 1)
+                v = row[x // per_byte] >> shift & mask
+                # Bitmaps start out zeroed, so only non-zero pixels are written
+                if v:
+                    bitmap[p + x] = v
+    return bitmap, palette
+
+
+def bitmap_bytes(bitmap, palette=None):
+    """Approximate heap used by a Bitmap (rows are 32-bit aligned) and Palette."""
+    bits = 1
+    while 1 << bits < len(palette or ()):
+        bits <<= 1
+    size = (bitmap.width * bits + 31) // 32 * 4 * bitmap.height
+    if palette is not None:
+        size += 8 * len(palette)
+    return size
+
+
+class BitmapCache:
+
+    def __init__(self, fraction=0.25, reserve=8192):
+        """
+        :param fraction: share of the currently free heap the cache may use
+        :param reserve: free heap below which entries are evicted regardless
+
+        """
+        self.budget = int(gc.mem_free() * fraction)
+        self.reserve = reserve
+        self.used = 0
+        self._entries = {}
+        self._tick = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The cached TileGrid for ``key``, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._tick += 1
+        entry[2] = self._tick
+        return entry[0]
+
+    def put(self, key, tile_grid, size):
+        if key in self._entries:
+            self.used -= self._entries.pop(key)[1]
+        self._tick += 1
+        self._entries[key] = [tile_grid, size, self._tick]
+        self.used += size
+        self.trim(keep=key)
+
+    def _evict_oldest(self, keep):
+        oldest = None
+        for key, entry in self._entries.items():
+            if key == keep:
+                continue
+            if oldest is None or entry[2] < self._entries[oldest][2]:
+                oldest = key
+        if oldest is None:
+            return False
+        self.used -= self._entries.pop(oldest)[1]
+        return True
+
+    def trim(self, keep=None):
+        """Evict least recently used entries while over budget or while free
+        memory is below the reserve."""
+        evicted = False
+        while self.used > self.budget and self._evict_oldest(keep):
+            evicted = True
+        if self._entries and gc.mem_free() < self.reserve:
+            gc.collect()
+            while gc.mem_free() < self.reserve and self._evict_oldest(keep):
+                evicted = True
+                gc.collect()
+        return evicted
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.used -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.used = 0
+
+
+# (Bitmap, Palette) pairs by path, made on the first load_image()
+_images = None
+
+
+def load_image(path):
+    """The shared (Bitmap, Palette) for a palettised BMP, read from flash the
+    first time. Raises ValueError if the file isn't palettised."""
+    global _images
+    if _images is None:
+        _images = BitmapCache(fraction=0.1)
+    image = _images.get(path)
+    if image is None:
+        image = load_bmp(path)
+        _images.put(path, image, bitmap_bytes(*image))
+    return image
+
+
+def forget_image(path):
+    """Drop ``path`` from load_image()'s cache, as the file has changed."""
+    if _images is not None:
+        _images.remove(path)
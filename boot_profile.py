@@ -0,0 +1,56 @@
+"""
+Where the time and memory go between power on and the first frame.
+
+code.py calls BootProfile.phase() as it finishes each stage of startup, and
+ModeMachine does the same when it builds a mode the first time it's needed.
+Each phase records the seconds since the previous one and how much the free
+heap shrank over it, after a collection so garbage doesn't count, and is
+printed as it ends. report() sums up once the sign is up and copies the
+phases to the log file, which modes built later are written to as well.
+"""
+
+import gc
+import time
+
+
+class BootProfile:
+
+    def __init__(self):
+        gc.collect()
+        self.start = time.monotonic()
+        self.phases = []        # (name, seconds, heap bytes)
+        self._time = self.start
+        self._free = gc.mem_free()
+        self.file = None
+
+    def mark(self):
+        """Start a phase here, leaving out the time since the last one."""
+        gc.collect()
+        self._time = time.monotonic()
+        self._free = gc.mem_free()
+
+    def phase(self, name):
+        """End the phase running since the last call, naming it ``name``."""
+        now = time.monotonic()
+        gc.collect()
+        free = gc.mem_free()
+        self.phases.append((name, now - self._time, self._free - free))
+        self._write("Boot phase {}: {:.2f} s, {} B".format(*self.phases[-1]))
+        # The collection is charged to the next phase
+        self._time = now
+        self._free = free
+
+    def report(self, file=None):
+        """Sum up, and from now on also write phases to ``file``; the ones
+        so far go there first."""
+        self.file = file
+        if file:
+            for phase in self.phases:
+                file.write("Boot phase {}: {:.2f} s, {} B\n".format(*phase))
+        self._write("Boot took {:.2f} s, {} B free".format(self._time - self.start, self._free))
+
+    def _write(self, line):
+        print(line)
+        if self.file:
+            self.file.write(line)
+            self.file.write("\n")
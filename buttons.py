@@ -0,0 +1,105 @@
+"""
+Debounced, non-blocking button events.
+
+Buttons.poll() samples every pin once and queues events for whatever edges
+it finds; the display modes take events off the queue instead of reading
+pins and spinning until a button is released. Events are small ints,
+``button << 3 | kind``, so polling and queueing allocate nothing.
+"""
+
+import time
+from array import array
+
+PRESS = 0
+RELEASE = 1
+CLICK = 2         # released before it became a long press
+LONG_PRESS = 3    # still held after long_press seconds; sent once per press
+DOUBLE_PRESS = 4  # pressed again within double_press seconds of a click;
+                  # sent as well as its PRESS, and its release still CLICKs
+
+
+def event(button, kind):
+    return button << 3 | kind
+
+
+class Buttons:
+
+    def __init__(self, pins, *, debounce=0.02, long_press=1.0, double_press=0.4, queue_size=8):
+        """
+        :param pins: active-low DigitalInOuts; a button is its index in here
+        :param debounce: seconds a level must hold before it counts
+        :param long_press: seconds held before a LONG_PRESS
+        :param double_press: seconds after a click in which a press is a DOUBLE_PRESS
+        :param queue_size: events kept before the oldest are dropped
+
+        """
+        self.pins = pins
+        self.debounce = debounce
+        self.long_press = long_press
+        self.double_press = double_press
+        n = len(pins)
+        self._pressed = bytearray(n)  # debounced state
+        self._raw = bytearray(n)      # last raw reading
+        self._long = bytearray(n)     # LONG_PRESS already sent for this press
+        self._double = bytearray(n)   # this press was a DOUBLE_PRESS
+        self._changed = [0.0] * n     # when the raw reading last changed
+        self._down_at = [0.0] * n
+        self._clicked_at = [-double_press] * n
+        self._queue = array("B", [0] * queue_size)
+        self._head = 0
+        self._count = 0
+
+    def _put(self, button, kind):
+        size = len(self._queue)
+        if self._count == size:
+            # Full; drop the oldest
+            self._head = (self._head + 1) % size
+            self._count -= 1
+        self._queue[(self._head + self._count) % size] = button << 3 | kind
+        self._count += 1
+
+    def poll(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        for b in range(len(self.pins)):
+            raw = 0 if self.pins[b].value else 1
+            if raw != self._raw[b]:
+                self._raw[b] = raw
+                self._changed[b] = now
+            elif raw != self._pressed[b] and now - self._changed[b] >= self.debounce:
+                self._pressed[b] = raw
+                if raw:
+                    self._down_at[b] = now
+                    self._long[b] = 0
+                    self._put(b, PRESS)
+                    self._double[b] = now - self._clicked_at[b] < self.double_press
+                    if self._double[b]:
+                        self._put(b, DOUBLE_PRESS)
+                else:
+                    self._put(b, RELEASE)
+                    if not self._long[b]:
+                        # A third quick press doesn't make another double
+                        self._clicked_at[b] = -self.double_press if self._double[b] else now
+                        self._put(b, CLICK)
+            if self._pressed[b] and not self._long[b] and now - self._down_at[b] >= self.long_press:
+                self._long[b] = 1
+                self._put(b, LONG_PRESS)
+
+    def is_pressed(self, button):
+        return bool(self._pressed[button])
+
+    # True while there are queued events
+    def __len__(self):
+        return self._count
+
+    def get(self):
+        """Oldest queued event, or None."""
+        if not self._count:
+            return None
+        e = self._queue[self._head]
+        self._head = (self._head + 1) % len(self._queue)
+        self._count -= 1
+        return e
+
+    def clear(self):
+        self._count = 0
@@ -1,36 +1,92 @@
+# Startup is staged so the panel lights up first: a status screen goes up
+# before the heavy imports, the network comes up between frames, and each
+# mode is only built when it's first needed. Each phase is timed.
 import gc
+import time
+from boot_profile import BootProfile
+
+profile = BootProfile()
+
+import board
+import framebufferio
+import rgbmatrix
+from displayio import release_displays, Group
+from terminalio import FONT
+from adafruit_display_text.label import Label
+from screen import Screen
+
+# --- Display setup ---
+release_displays()
+matrix = rgbmatrix.RGBMatrix(
+    width=64, bit_depth=5,
+    rgb_pins=[board.MTX_R1, board.MTX_G1, board.MTX_B1,
+              board.MTX_R2, board.MTX_G2, board.MTX_B2],
+    addr_pins=[board.MTX_ADDRA, board.MTX_ADDRB,
+               board.MTX_ADDRC, board.MTX_ADDRD],
+    clock_pin=board.MTX_CLK,
+    latch_pin=board.MTX_LAT,
+    output_enable_pin=board.MTX_OE
+)
+display = framebufferio.FramebufferDisplay(matrix)
+# Rotate display if needed
+display.rotation = 180
+# Refreshed by hand, and only when something on it changed
+screen = Screen(display)
+
+# Shown until the first mode takes over
+status = Group(max_size=1)
+status_label = Label(FONT, text="Starting", max_glyphs=12, color=0x303030,
+                     anchored_position=(32, 16), anchor_point=(0.5, 0.5))
+status.append(status_label)
+screen.show(status)
+screen.refresh()
+
+def show_status(text):
+    print(text)
+    screen.text(status_label, text)
+    screen.refresh()
+
+profile.phase("display")
+
+import os
 import sys
+import json
+import rtc
 from digitalio import DigitalInOut, Direction, Pull
 import busio
 import adafruit_requests as requests
-import framebufferio
-import rgbmatrix
-from displayio import release_displays
 import adafruit_minimqtt.adafruit_minimqtt as MQTT
 import neopixel
 from adafruit_esp32spi import adafruit_esp32spi
 from adafruit_esp32spi import adafruit_esp32spi_wifimanager
 import adafruit_esp32spi.adafruit_esp32spi_socket as socket
-import time
-import board
 
-from file_handler import FileHandler
+from file_handler import RingFileHandler
 import adafruit_logging as logging
 
 gc.collect()
 
-from display_modes import AirMode, WeatherMode, MessageMode, up_button
+from display_modes import AirMode, WeatherMode, MessageMode, up_button, buttons
+from mode_machine import ModeMachine
+import message_store
+import image_store
+from scheduler import Scheduler
+from telemetry import Telemetry
+from connection import ConnectionSupervisor, STATES, UP, MQTT as MQTT_STATE
+
+profile.phase("imports")
 
 led = DigitalInOut(board.L)
 led.direction = Direction.OUTPUT
 led.value = False
 
+# Flash is only writable if boot.py remounted it, with UP held at reset.
+# Lines gather in RAM and are written out in batches.
 if not up_button.value:
-    error_file = open("error_log.txt", "w")
-    print("Opened log file.",file=error_file)
-    error_file.flush()
+    log = RingFileHandler("error_log.txt")
+    log.write("Opened log file.\n")
 else:
-    error_file = None
+    log = None
 
 gc.collect()
 
@@ -41,21 +97,12 @@ except ImportError:
     print("WiFi secrets are kept in secrets.py, please add them there!")
     raise
 
-# --- Display setup ---
-release_displays()
-matrix = rgbmatrix.RGBMatrix(
-    width=64, bit_depth=5,
-    rgb_pins=[board.MTX_R1, board.MTX_G1, board.MTX_B1,
-              board.MTX_R2, board.MTX_G2, board.MTX_B2],
-    addr_pins=[board.MTX_ADDRA, board.MTX_ADDRB,
-               board.MTX_ADDRC, board.MTX_ADDRD],
-    clock_pin=board.MTX_CLK,
-    latch_pin=board.MTX_LAT,
-    output_enable_pin=board.MTX_OE
-)
-display = framebufferio.FramebufferDisplay(matrix)
-# Rotate display if needed
-display.rotation = 180
+# Loop, MQTT, weather, mode and gc timings, published every stats_interval seconds
+telemetry = Telemetry(secrets.get("stats_interval", 300))
+# Times to get the link back, in ms
+RECOVERY_BOUNDS = (1000, 2000, 5000, 10000, 30000, 60000, 120000, 300000)
+# The last weather response, kept to show straight after a reset
+WEATHER_CACHE = "weather_cache.json"
 
 # --- Network Setup ---
 # If you are using a board with pre-defined ESP32 Pins:
@@ -70,41 +117,74 @@ status_light = neopixel.NeoPixel(
     board.NEOPIXEL, 1, brightness=0.2
 )
 requests = adafruit_esp32spi_wifimanager.ESPSPI_WiFiManager(esp, secrets, status_light)
-requests.connect()
 
-gc.collect()
+# The time of day, once the ESP32 has it over NTP; the RTC starts at 2000
+clock_set = False
 
-print(f"Free memory after network connect: {gc.mem_free()}")
+def wall_clock():
+    return time.time() if clock_set else None
+
+def set_clock():
+    global clock_set
+    try:
+        if not esp.is_connected:
+            return
+        now = esp.get_time()[0]
+    except (ValueError, RuntimeError, OSError):
+        # NTP hasn't answered yet
+        return
+    rtc.RTC().datetime = time.localtime(now)
+    clock_set = True
+    print("Clock set to", now)
+    scheduler.remove("clock")
+    # Messages read back at boot start counting down to their expiry
+    if modes.built("messages"):
+        modes.message_mode.store.sync()
 
-air_mode = AirMode()
-message_mode = MessageMode()
-weather_mode = WeatherMode(network=requests,
-                           location=secrets["openweather_location"],
-                           token=secrets["openweather_token"])
-current_mode = weather_mode
+# Each mode is built the first time it's shown or sent something
+modes = ModeMachine(screen, profile=profile, telemetry=telemetry,
+                    air_mode=lambda: AirMode(screen=screen),
+                    air_submodes=AirMode.SUBMODES,
+                    weather_mode=lambda: WeatherMode(network=requests,
+                                                     location=secrets["openweather_location"],
+                                                     token=secrets["openweather_token"],
+                                                     cache=WEATHER_CACHE,
+                                                     screen=screen),
+                    message_mode=lambda: MessageMode(screen=screen, clock=wall_clock))
 
 # Handle mqtt message to set display mode: On/Off Air, Messages, Weather
 def display_mode(mqtt_client, topic, message):
-    global current_mode
     print(f"New message on topic {topic}: {message}")
-    if message in air_mode.submodes:
-        air_mode.set_submode(message)
-        current_mode = air_mode
-    elif message == "Messages" and message_mode:
-        message_mode.display_timestamp = 0
-        message_mode.current_message = None
-        message_mode.persist = True
-        current_mode = message_mode
-    elif message == "Weather":
-        weather_mode.display_timestamp = time.monotonic()
-        current_mode = weather_mode
-        message_mode.persist = False
-    # current_mode.update()
-    display.show(current_mode)
+    modes.command(message)
 
 # Handle display/message messages to add new message
 def display_message(mqtt_client, topic, message):
-    message_mode.json_message(mqtt_client, topic, message)
+    modes.message_mode.json_message(mqtt_client, topic, message)
+
+def update_message(mqtt_client, topic, message):
+    modes.message_mode.update_message(mqtt_client, topic, message)
+
+def delete_message(mqtt_client, topic, message):
+    modes.message_mode.delete_message(mqtt_client, topic, message)
+
+# Tell the sender how a batch went: {"added": n, "updated": n, ...}
+batch_result_topic = "display/{}/message/batch/result".format(secrets['matrix_subtopic'])
+
+def batch_messages(mqtt_client, topic, message):
+    counts = modes.message_mode.batch_messages(mqtt_client, topic, message)
+    mqtt_client.publish(batch_result_topic, json.dumps(dict(zip(message_store.RESULTS, counts))))
+
+# Tell the sender how a picture went: {"id": ..., "result": "saved"}
+image_result_topic = "display/{}/image/result".format(secrets['matrix_subtopic'])
+
+def report_image(id, result):
+    mqtt_client.publish(image_result_topic,
+                        json.dumps({"id": id, "result": image_store.RESULTS[result]}))
+
+def image_chunk(mqtt_client, topic, message):
+    done = modes.message_mode.image_chunk(mqtt_client, topic, message)
+    if done is not None:
+        report_image(*done)
 
 # ========= Set up MQTT ============
 
@@ -123,18 +203,8 @@ mqtt_client = MQTT.MQTT(
 )
 
 mqtt_client.enable_logger(logging,log_level=logging.INFO)
-if error_file:
-    mqtt_client.logger.addHandler(FileHandler(error_file))
-
-print(f"Attempting to connect to {mqtt_client.broker}")
-mqtt_client.connect(clean_session=False)
-if error_file:
-    print("Connected at %s\n" % time.monotonic())
-    error_file.write("Connected at %s\n" % time.monotonic())
-    error_file.flush()
-
-print("Subscribing to topics.")
-mqtt_client.subscribe("display/#", qos=1)
+if log:
+    mqtt_client.logger.addHandler(log)
 
 # Dispatch to function for changing overall mode
 mqtt_client.add_topic_callback("display/{}/mode".format(secrets['matrix_subtopic']), display_mode)
@@ -144,83 +214,126 @@ mqtt_client.add_topic_callback("display/mode", display_mode)
 mqtt_client.add_topic_callback("display/{}/message".format(secrets['matrix_subtopic']), display_message)
 mqtt_client.add_topic_callback("display/message", display_message)
 
+# Change or delete a stored message by its id
+mqtt_client.add_topic_callback("display/{}/message/update".format(secrets['matrix_subtopic']), update_message)
+mqtt_client.add_topic_callback("display/message/update", update_message)
+mqtt_client.add_topic_callback("display/{}/message/delete".format(secrets['matrix_subtopic']), delete_message)
+mqtt_client.add_topic_callback("display/message/delete", delete_message)
+
+# Many messages at once, as a JSON array or one per line
+mqtt_client.add_topic_callback("display/{}/message/batch".format(secrets['matrix_subtopic']), batch_messages)
+mqtt_client.add_topic_callback("display/message/batch", batch_messages)
+
+# Pictures for messages, a chunk at a time
+mqtt_client.add_topic_callback("display/{}/image".format(secrets['matrix_subtopic']), image_chunk)
+mqtt_client.add_topic_callback("display/image", image_chunk)
+
 gc.collect()
 
-if current_mode:
-    display.show(current_mode)
-    gc.collect()
+profile.phase("setup")
+
+# ========= Tasks ============
+
+def poll_buttons():
+    buttons.poll()
+
+def housekeeping():
+    if modes.built("messages"):
+        modes.message_mode.prefetch()
+        stalled = modes.message_mode.images.expire()
+        if stalled is not None and connection.up:
+            report_image(*stalled)
+    telemetry.collect()
+
+stats_topic = "display/{}/stats".format(secrets['matrix_subtopic'])
+
+def stats():
+    telemetry.sample_heap()
+    # Held back while MQTT is down
+    if connection.up and telemetry.due(time.monotonic()):
+        mqtt_client.publish(stats_topic, telemetry.summary())
+
+# ========= Connection ============
+
+def start_modes():
+    modes.start()
+    modes.weather_mode.service.histogram = telemetry.histogram("weather")
+    scheduler.add("weather", refresh_weather, 1)
+    scheduler.add("render", modes.tick, 1/30)
+    scheduler.add("housekeeping", housekeeping, 5)
+    profile.phase("first frame")
 
-print(f"Free memory after show: {gc.mem_free()}")
+# Fetches wait while WiFi is down: the WiFi manager would block rejoining
+# by itself, and rejoining is the supervisor's job
+def refresh_weather():
+    modes.weather_mode.refresh(online=esp.is_connected)
+
+booted = False
+
+def connection_changed(state):
+    global booted
+    print("Connection:", STATES[state])
+    led.value = state > UP
+    if modes.current is None:
+        if state in (MQTT_STATE, UP):
+            profile.phase("wifi")
+            start_modes()
+        else:
+            show_status(STATES[state] + "...")
+    if state == MQTT_STATE:
+        print(f"Attempting to connect to {mqtt_client.broker}")
+    elif state == UP:
+        if log:
+            log.write("Connected at {}\n".format(time.monotonic()))
+        print("Subscribing to topics.")
+        mqtt_client.subscribe("display/#", qos=1)
+        if not booted:
+            booted = True
+            profile.phase("mqtt")
+            profile.report(log)
+
+# Brings WiFi and MQTT up, and back after a drop, a step at a time between frames
+connection = ConnectionSupervisor(requests, mqtt_client, on_change=connection_changed)
+connection.histogram = telemetry.histogram("recover", RECOVERY_BOUNDS)
+show_status("WiFi...")
+
+scheduler = Scheduler()
+scheduler.histogram = telemetry.histogram("loop")
+scheduler.add("buttons", poll_buttons, 0.01)
+scheduler.add("connection", connection.poll, 0.1)
+scheduler.add("stats", stats, 1)
+scheduler.add("clock", set_clock, 10)
+if log:
+    scheduler.add("log", log.flush, 30)
+# MQTT I/O gets whatever time is left until the next task is due
+scheduler.set_idle("mqtt", connection.loop).histogram = telemetry.histogram("mqtt")
+
+# With weather from before the reset there's better to show than the
+# connection status while WiFi comes up
+try:
+    os.stat(WEATHER_CACHE)
+    cached_weather = True
+except OSError:
+    cached_weather = False
+if cached_weather:
+    start_modes()
 
 while True:
     try:
-        mqtt_client.loop(.01)
-        if not up_button.value:
-            if error_file:
-                error_file.flush()
-        if current_mode:
-            if not current_mode.update():
-                # Current mode returns False if it's "done"
-                if (current_mode == message_mode) and message_mode.persist:
-                    message_mode.display_timestamp = 0
-                    message_mode.current_message = None
-                elif (current_mode != message_mode) and message_mode:
-                    # Switch to messages
-                    current_mode = message_mode
-                    current_mode.update()
-                else:
-                    # Switch to weather
-                    weather_mode.display_timestamp = time.monotonic()
-                    current_mode = weather_mode
-                    current_mode.update()
-                display.show(current_mode)
-                gc.collect()
-        # print(gc.mem_free())
-    except MQTT.MMQTTException as e:
-        led.value = True
-        sys.print_exception(e)
-        if error_file:
-            error_file.write("MMQTT Exception: ")
-            sys.print_exception(e, error_file)
-            error_file.write("Trying to reconnect...")
-            error_file.flush()
-        try:
-            mqtt_client.reconnect(qos=1)
-        except BaseException as e:
-            sys.print_exception(e)
-            if error_file:
-                sys.print_exception(e, error_file)
-                error_file.close()
-            raise e
-    except RuntimeError as e:
-        led.value = True
+        scheduler.run()
+    except (MQTT.MMQTTException, RuntimeError, OSError) as e:
+        # Most likely the network: the supervisor takes it from here, and
+        # the panel keeps going meanwhile
         sys.print_exception(e)
-        if error_file:
-            sys.print_exception(e, error_file)
-            error_file.write("Timestamp: %s\n" % time.monotonic())
-            error_file.write("Time since ping: {}\n".format(time.monotonic() - mqtt_client._timestamp))
-            error_file.write("Trying to reconnect...\n")
-            error_file.flush()
-        try:
-            # Try just reconnecting mqtt_client
-            mqtt_client.reconnect(qos=1)
-            if error_file:
-                error_file.write("Reconnected at %s\n" % time.monotonic())
-                error_file.flush()
-        except BaseException as e:
-            sys.print_exception(e)
-            if error_file:
-                sys.print_exception(e, error_file)
-                error_file.write("Resetting ESP32\n")
-                error_file.flush()
-            # Reset the ESP32
-            requests.reset()
-            requests.connect()
-            mqtt_client.reconnect(qos=1)
+        if log:
+            log.write("Connection error: ")
+            log.write_exception(e)
+        connection.lost(e)
     except BaseException as e:
         led.value = True
         sys.print_exception(e)
-        if error_file:
-            sys.print_exception(e, error_file)
-            error_file.close()
-        raise e
\ No newline at end of file
+        if log:
+            log.write_exception(e)
+            # Whatever is still in RAM, so the crash makes it to flash
+            log.close()
+        raise e
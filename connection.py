@@ -0,0 +1,189 @@
+"""
+Bringing WiFi and MQTT up, and back up after they drop, without stopping
+the panel.
+
+ConnectionSupervisor is a state machine stepped by a scheduler task. Each
+step makes one attempt, with a timeout where the driver takes one, and a
+failed attempt schedules the next with exponential backoff and jitter, so
+rendering and the buttons carry on in between. When the link drops the
+recovery escalates:
+
+  reconnect      a fresh MQTT connection
+  socket reset   close the broken MQTT socket first, and rejoin WiFi if
+                 that has gone too
+  ESP32 reset    reset the WiFi coprocessor and start over
+
+moving on after ``attempts`` failures or ``level_timeout`` seconds at a
+level. ESP32 resets are retried for as long as it takes. Getting connected
+at startup escalates the same way if it keeps failing. The supervisor
+also keeps the numbers for how often the link drops and how long it takes
+to come back.
+"""
+
+import random
+import time
+from adafruit_minimqtt.adafruit_minimqtt import MMQTTException
+
+WIFI = 0
+MQTT = 1
+UP = 2
+RECONNECT = 3
+SOCKET_RESET = 4
+ESP_RESET = 5
+STATES = ("WiFi", "MQTT", "up", "reconnect", "socket reset", "ESP32 reset")
+# Where each state goes after too many failures
+_ESCALATE = (ESP_RESET, SOCKET_RESET, None, SOCKET_RESET, ESP_RESET, None)
+
+
+class ConnectionSupervisor:
+
+    def __init__(self, wifi, mqtt_client, *, on_change=None, attempts=3, level_timeout=60,
+                 connect_timeout=10, retry_min=1, retry_max=60):
+        """
+        :param wifi: the ESPSPI_WiFiManager
+        :param mqtt_client: the MiniMQTT client
+        :param on_change: called with the new state whenever it changes
+        :param attempts: failures at a recovery level before the next one
+        :param level_timeout: seconds at a recovery level before the next one
+        :param connect_timeout: seconds to wait for the access point
+        :param retry_min: first delay after a failed attempt
+        :param retry_max: cap on the delay
+
+        """
+        self.wifi = wifi
+        self.esp = wifi.esp
+        self.mqtt = mqtt_client
+        self.on_change = on_change
+        self.attempts = attempts
+        self.level_timeout = level_timeout
+        self.connect_timeout = connect_timeout
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+
+        self.state = WIFI
+        self.next_attempt = 0
+        self.failures = 0           # since the link was last up
+        self._level_failures = 0
+        self._level_start = time.monotonic()
+        self._down_since = None
+
+        self.outages = 0
+        self.last_recovery = 0.0
+        self.max_recovery = 0.0
+        self.recovered_by = [0] * len(STATES)
+        self.last_error = None
+        self.histogram = None       # of recovery times, for telemetry
+
+    @property
+    def up(self):
+        return self.state == UP
+
+    def status(self):
+        return STATES[self.state]
+
+    def _enter(self, state, now):
+        self.state = state
+        self._level_failures = 0
+        self._level_start = now
+        if self.on_change:
+            self.on_change(state)
+
+    def lost(self, error):
+        """Report that the link failed, e.g. an exception out of an MQTT call.
+        Starts recovery if it was up; otherwise recovery is already going."""
+        if self.state != UP:
+            return
+        now = time.monotonic()
+        self.last_error = repr(error)
+        print("Connection lost: {}".format(self.last_error))
+        self.outages += 1
+        self._down_since = now
+        self.failures = 0
+        self.next_attempt = now
+        self._enter(RECONNECT, now)
+
+    def loop(self, timeout):
+        """Idle task: MQTT I/O while the link is up, otherwise just wait."""
+        if self.state != UP:
+            time.sleep(timeout)
+            return
+        try:
+            self.mqtt.loop(timeout)
+        except (MMQTTException, OSError, RuntimeError) as e:
+            self.lost(e)
+
+    def poll(self):
+        """Make the next attempt if one is due."""
+        if self.state == UP:
+            return
+        now = time.monotonic()
+        if now < self.next_attempt:
+            return
+        state = self.state
+        try:
+            if state == WIFI:
+                self._join()
+                self._enter(MQTT, now)
+                return
+            if state == SOCKET_RESET:
+                self._close_socket()
+                if not self.esp.is_connected:
+                    self._join()
+            elif state == ESP_RESET:
+                self.wifi.reset()
+                self._join()
+            self.mqtt.connect(clean_session=False)
+        except (MMQTTException, OSError, RuntimeError, ValueError) as e:
+            self._failed(e, time.monotonic())
+            return
+        self._connected(state, time.monotonic())
+
+    def _join(self):
+        if not self.esp.is_connected:
+            self.esp.connect_AP(self.wifi.ssid, self.wifi.password,
+                                timeout_s=self.connect_timeout)
+
+    # MiniMQTT can't disconnect once the link is gone, so close its socket
+    def _close_socket(self):
+        try:
+            self.mqtt.disconnect()
+        except Exception:
+            sock = getattr(self.mqtt, "_sock", None)
+            if sock:
+                try:
+                    sock.close()
+                except Exception:
+                    pass
+
+    def _failed(self, error, now):
+        self.last_error = repr(error)
+        self.failures += 1
+        self._level_failures += 1
+        print("{} failed: {}".format(STATES[self.state], self.last_error))
+        delay = min(self.retry_max, self.retry_min * 2 ** (self.failures - 1))
+        self.next_attempt = now + random.uniform(delay / 2, delay)
+        escalate = _ESCALATE[self.state]
+        if escalate is not None and (self._level_failures >= self.attempts
+                                     or now - self._level_start >= self.level_timeout):
+            self._enter(escalate, now)
+
+    def _connected(self, state, now):
+        if self._down_since is not None:
+            recovery = now - self._down_since
+            self._down_since = None
+            self.last_recovery = recovery
+            if recovery > self.max_recovery:
+                self.max_recovery = recovery
+            self.recovered_by[state] += 1
+            if self.histogram is not None:
+                self.histogram.add(recovery)
+        self.failures = 0
+        self._enter(UP, now)
+        if state > UP:
+            print(self)
+
+    def __str__(self):
+        return "connection {}: {} outages, {:.1f} s last recovery, {:.1f} s max, by {}".format(
+            STATES[self.state], self.outages, self.last_recovery, self.max_recovery,
+            ", ".join("{} {}".format(STATES[i], self.recovered_by[i])
+                      for i in range(RECONNECT, len(STATES))))
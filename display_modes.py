@@ -1,13 +1,27 @@
 from adafruit_display_text.label import Label
-from adafruit_bitmap_font import bitmap_font
 import board
 from digitalio import DigitalInOut, Direction, Pull
 import displayio
-import json
 import time
 import gc
 from terminalio import FONT
-import os
+from emoji_atlas import EmojiAtlas, EmojiIndex
+from bitmap_cache import BitmapCache, load_image, forget_image, bitmap_bytes
+from animation import ColorAnimation, Breathe, color_ramp
+from buttons import Buttons, event, CLICK, LONG_PRESS
+from weather import WeatherService, WeatherCache
+import json_stream
+from json_stream import Selector
+import weather_history
+from weather_history import WeatherHistory
+import message_store
+from message_store import MessageStore
+import image_store
+from image_store import ImageStore
+from marquee import Marquee, render
+from layout import FontMetrics, fit
+from binary_font import load_font
+from screen import Screen
 
 down_button = DigitalInOut(board.BUTTON_DOWN)
 down_button.direction = Direction.INPUT
@@ -17,22 +31,56 @@ up_button = DigitalInOut(board.BUTTON_UP)
 up_button.direction = Direction.INPUT
 up_button.pull = Pull.UP
 
+# Shared by all modes; code.py polls it once per pass of the main loop
+UP = 0
+DOWN = 1
+buttons = Buttons((up_button, down_button))
+UP_CLICK = event(UP, CLICK)
+DOWN_CLICK = event(DOWN, CLICK)
+DOWN_LONG_PRESS = event(DOWN, LONG_PRESS)
+
+# A TileGrid of the BMP at ``path`` and the heap its pixels take. It shares
+# the in-RAM copy from bitmap_cache.load_image(); a BMP that isn't palettised
+# is read from flash and converted on every refresh instead.
+def image_tile_grid(path, **kwargs):
+    try:
+        bitmap, palette = load_image(path)
+    except ValueError:
+        return displayio.TileGrid(displayio.OnDiskBitmap(open(path, "rb")),
+            pixel_shader=displayio.ColorConverter(), **kwargs), 0
+    return displayio.TileGrid(bitmap, pixel_shader=palette, **kwargs), \
+        bitmap_bytes(bitmap, palette)
+
+
 class AirMode(displayio.Group):
 
-    def __init__(self,*):
+    # Known without building one, for ModeMachine.command()
+    SUBMODES = ("OnAir","OffAir","NapTime","Recording")
+    COLORS = {"OnAir": 0xFF0000, "OffAir": 0xDD8000, "NapTime": 0x00FF00, "Recording": 0xFF0000}
+
+    def __init__(self,fps=20,*,effect=None,screen=None):
         super().__init__(max_size=3)
+        self.screen = screen or Screen()
 
-        self.submodes = ("OnAir","OffAir","NapTime","Recording")
+        self.submodes = AirMode.SUBMODES
 
         self.mode = None
-        self.R = 0
-        self.G = 0
-        self.B = 0
+        # One precomputed color ramp per submode, shared where colors match
+        ramps = {}
+        self._ramps = {}
+        for mode in self.submodes:
+            color = AirMode.COLORS[mode]
+            if color not in ramps:
+                ramps[color] = color_ramp(color)
+            self._ramps[mode] = ramps[color]
+        self.animation = ColorAnimation(fps)
+        self.animation.set_effect(effect or Breathe())
+        self._lines = ()
         self._bg_group = displayio.Group(max_size=1)
         self._2Lines = displayio.Group(max_size=2)
         self._3Lines = displayio.Group(max_size=3)
 
-        self.font = bitmap_font.load_font("fonts/BellotaText-Bold-21_DJL.bdf")
+        self.font = load_font("fonts/BellotaText-Bold-21_DJL.bdf")
         self.font.load_glyphs(b"ONAIRFNPTE")
         self.Line1 = Label(self.font, max_glyphs=3,anchored_position=(32,8),
             anchor_point = (0.5,0.5))
@@ -40,6 +88,7 @@ class AirMode(displayio.Group):
             anchor_point = (0.5,0.5))
         self._2Lines.append(self.Line1)
         self._2Lines.append(self.Line2)
+        self._two = (self.Line1, self.Line2)
 
         self.LineA = Label(FONT, max_glyphs=10,anchored_position=(32,-1),
             anchor_point = (0.5,0))
@@ -50,6 +99,7 @@ class AirMode(displayio.Group):
         self._3Lines.append(self.LineA)
         self._3Lines.append(self.LineB)
         self._3Lines.append(self.LineC)
+        self._three = (self.LineA, self.LineB, self.LineC)
 
         self.append(self._bg_group)
         self.append(self._2Lines)
@@ -65,67 +115,63 @@ class AirMode(displayio.Group):
             self._bg_group.pop()
             gc.collect()
         if mode == "OnAir":
-            bg_file = open("bmps/Wings_FF0000.bmp","rb")
-            self.R = 0xFF
-            self.G = 0x00
-            self.B = 0x00
-            self._2Lines.hidden = False
-            self._3Lines.hidden = True
-            self.Line1.text = "ON"
-            self.Line2.text = "AIR"
+            bg_path = "bmps/Wings_FF0000.bmp"
+            self._show_lines(self._two, ("ON", "AIR"))
         elif mode == "OffAir":
-            bg_file = open("bmps/Wings_DD8000.bmp","rb")
-            self.R = 0xDD
-            self.G = 0x80
-            self.B = 0x00
-            self._2Lines.hidden = False
-            self._3Lines.hidden = True
-            self.Line1.text = "OFF"
-            self.Line2.text = "AIR"
+            bg_path = "bmps/Wings_DD8000.bmp"
+            self._show_lines(self._two, ("OFF", "AIR"))
         elif mode == "NapTime":
-            bg_file = open("bmps/Wings_DD8000.bmp","rb")
-            self.R = 0x00
-            self.G = 0xFF
-            self.B = 0x00
-            self._2Lines.hidden = False
-            self._3Lines.hidden = True
-            self.Line1.text = "NAP"
-            self.Line2.text = "TIME"
+            bg_path = "bmps/Wings_DD8000.bmp"
+            self._show_lines(self._two, ("NAP", "TIME"))
         elif mode == "Recording":
-            bg_file = open("bmps/Wings_DD8000_mid.bmp","rb")
-            self.R = 0xFF
-            self.G = 0x00
-            self.B = 0x00
-            self._2Lines.hidden = True
-            self._3Lines.hidden = False
-            self.LineA.text = "RECORDING"
-            self.LineB.text = "IN"
-            self.LineC.text = "PROGRESS"
-        if bg_file:
-            self._bg_group.append(displayio.TileGrid(
-                displayio.OnDiskBitmap(bg_file),pixel_shader=displayio.ColorConverter()))
+            bg_path = "bmps/Wings_DD8000_mid.bmp"
+            self._show_lines(self._three, ("RECORDING", "IN", "PROGRESS"))
+        if bg_path:
+            self._bg_group.append(image_tile_grid(bg_path)[0])
+        self.screen.changed()
+        self.animation.set_ramp(self._ramps[mode])
         self.update()
         self.mode = mode
         gc.collect()
 
+    # Show one set of lines, with these texts, and hide the other
+    def _show_lines(self, lines, texts):
+        screen = self.screen
+        screen.hidden(self._2Lines, lines is not self._two)
+        screen.hidden(self._3Lines, lines is not self._three)
+        for i in range(len(lines)):
+            screen.text(lines[i], texts[i])
+        self._lines = lines
+
+    # Swap the pulse for another animation.Effect, e.g. Blink() or FadeIn()
+    def set_effect(self,effect):
+        self.animation.set_effect(effect)
+
     def update(self):
-        if not down_button.value:
-            # Return False if "done" as indicated by down_button
-            while not down_button.value:
-                pass
-            return False
-        intensity = 1 - 0.925*abs(1 - (time.monotonic() % 4)/2)
-        update_color = int(intensity*self.R) << 16 | int(intensity*self.G) << 8 | int(intensity*self.B)
-        self.Line1.color = update_color
-        self.Line2.color = update_color
-        self.LineA.color = update_color
-        self.LineB.color = update_color
-        self.LineC.color = update_color
+        while buttons:
+            if buttons.get() == DOWN_CLICK:
+                # Return False if "done" as indicated by down_button
+                return False
+        # Only recolor the visible lines, and only when a new frame changes the color
+        update_color = self.animation.step(time.monotonic())
+        if update_color is not None:
+            for line in self._lines:
+                line.color = update_color
+            self.screen.changed()
         return True
 
 
 class WeatherMode(displayio.Group):
 
+    # The only parts of the OpenWeather response we keep, in wdata's order
+    FIELDS = (("main","temp"), ("main","pressure"), ("main","humidity"),
+        ("wind","speed"), ("wind","deg"), ("weather",0,"main"), ("weather",0,"icon"), ("dt",))
+    TEMP, PRESSURE, HUMIDITY, WIND_SPEED, WIND_DEG, DESCRIPTION, ICON, DT = range(8)
+
+    # Pressure sparkline, in the middle row
+    SPARK_W = 24
+    SPARK_H = 12
+
     def _temp_color(temp):
         if temp <= -10:
             return 0x2068B0
@@ -143,43 +189,52 @@ class WeatherMode(displayio.Group):
             return 0xFF0000
 
 
-    def __init__(self,*,network=None, location=None,token=None):
+    def __init__(self,*,network=None, location=None,token=None,
+            history="weather_history.bin",cache="weather_cache.json",spark_hours=6,screen=None):
         super().__init__(max_size=3)
+        self.screen = screen or Screen()
 
         self.WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather?q={}&units=metric&appid={}"\
             .format(location,token)
 
         self.network = network
+        # Refetch every 10 minutes; show the data as stale after 30. The
+        # last response is kept on flash to show straight after a reset
+        self.service = WeatherService(network, self.WEATHER_URL,
+            selector=Selector(WeatherMode.FIELDS), interval=600, stale_after=1800,
+            cache=WeatherCache(cache), dt=WeatherMode.DT)
+        self.stale = False
 
         now = time.monotonic()
 
-        self.data_timeout = 600 # 10 minutes
-        self.data_timestamp = 0
-        self.wdata = {}
-        self.pressure = []
-        self.pressure_timestamps = []
-        self.pressure_slope = None
+        self.wdata = None
+        # Readings from past fetches, kept across reboots for the trends
+        self.history = WeatherHistory(path=history)
+        self.pressure_slope = self.history.slope(weather_history.PRESSURE)
+        self.spark_hours = spark_hours
 
         self.font = FONT
 
-        self.symfont = bitmap_font.load_font("fonts/6x10_DJL.bdf")
-        self.symfont.load_glyphs('°Ckph%r↑↗→↘↓↙←↖↥↧\u33A9\u00AD ')
+        self.symfont = load_font("fonts/6x10_DJL.bdf")
+        self.symfont.load_glyphs('°Ckph%r↑↗→↘↓↙←↖↥↧\u33A9\u00AD 0123456789')
 
         bb = self.font.get_bounding_box()
         (f_w,f_h) = bb[0], bb[1]
 
         self._bg_group = displayio.Group(max_size=1)
-        self.weather1 = displayio.Group(max_size=6)
+        self.weather1 = displayio.Group(max_size=7)
 
         UNIT_COLOR = 0x202020
-        TEXT_COLOR = 0x301040
+        self.TEXT_COLOR = 0x301040
+        self.STALE_COLOR = 0x282828
         WIND_COLOR = 0x78E078
         self.WDIR_COLOR = 0xF08070
 
         self.display_timestamp = now
         self.display_timeout = 5
         self.display_mode = 0
-        self.display_modes = 3
+        self.display_modes = 4
+        self._shown = None  # display_mode the middle row was last drawn for
 
         self.temp_l = Label(self.font,max_glyphs=5,color=0x5050F8,
             anchored_position=(64-2*f_w,-3),anchor_point=(1.0,0.0),line_spacing=1.0)
@@ -191,7 +246,7 @@ class WeatherMode(displayio.Group):
             anchored_position=(64-(3*f_w/2)+2,17),anchor_point=(1.0,0.5),line_spacing=1.0)
         self.dir_l = Label(self.symfont,max_glyphs=1,color=self.WDIR_COLOR,
             anchored_position=(64,16),anchor_point=(1.0,0.5),line_spacing=1.0)
-        self.text_l = Label(self.font,max_glyphs=12,color=TEXT_COLOR,
+        self.text_l = Label(self.font,max_glyphs=12,color=self.TEXT_COLOR,
             anchored_position=(1,32),anchor_point=(0.0,1.0),line_spacing=1.0)
         self.weather1.append(self.temp_l)
         self.weather1.append(self.temp_unit_l)
@@ -199,62 +254,102 @@ class WeatherMode(displayio.Group):
         self.weather1.append(self.unit_l)
         self.weather1.append(self.dir_l)
         self.weather1.append(self.text_l)
+
+        self.spark_bitmap = displayio.Bitmap(self.SPARK_W, self.SPARK_H, 2)
+        spark_palette = displayio.Palette(2)
+        spark_palette.make_transparent(0)
+        spark_palette[1] = 0x3050A0
+        self.sparkline = displayio.TileGrid(self.spark_bitmap, pixel_shader=spark_palette,
+            x=64-(4*f_w)+4-self.SPARK_W, y=10)
+        self.sparkline.hidden = True
+        self._draw_sparkline()
+        self.weather1.append(self.sparkline)
         self.append(self._bg_group)
         self.append(self.weather1)
 
-    def update(self):
+        if self.service.data is not None:
+            # From before the reset, and of unknown age until a fetch says
+            self.wdata = self.service.data
+            self.stale = True
+            self._show_data(now)
+
+    # Fetch new weather if what we have is out of date. Run by the
+    # scheduler's weather task rather than from update(). If fetching fails
+    # the last good data stays up, greyed out once it is stale.
+    # online: whether to fetch if one is due; the data still goes stale if not
+    def refresh(self, online=True):
         now = time.monotonic()
-        if not self.data_timestamp or now - self.data_timestamp > self.data_timeout:
-            try:
-                self.wdata = self.network.get(self.WEATHER_URL).json()
+        if online and self.service.due(now) and self.service.fetch(now):
+            self.stale = False
+            if self.service.updated:
+                self.wdata = self.service.data
                 print("Response is", self.wdata)
-                self.data_timestamp = now
-            except Exception as e:
-                print("Some error occurred getting weather! {}\n".format(repr(e)))
-                self.data_timestamp = self.data_timestamp + 30
-                raise e
-            self.temp_l.color = WeatherMode._temp_color(self.wdata["main"]["temp"])
-            self.temp_l.text = u"{: 2.1f}".format(self.wdata["main"]["temp"])
-            self.temp_unit_l.text = "°C"
-            self.text_l.text = self.wdata["weather"][0]["main"]
-
-            self.pressure.append(self.wdata["main"]["pressure"])
-            self.pressure_timestamps.append(now)
-            if len(self.pressure) > 6:
-                self.pressure.pop(0)
-                self.pressure_timestamps.pop(0)
-            if len(self.pressure) >= 2:
-                n = len(self.pressure)
-                mean_press = sum(self.pressure) / n
-                mean_timestamp = sum(self.pressure_timestamps) / n
-                self.pressure_slope = sum([(self.pressure_timestamps[i] - mean_timestamp) \
-                    * (self.pressure[i] - mean_press) for i in range(n)]) * 60 # hPa/hour
+                self._show_data(now)
             else:
-                self.pressure_slope = None
-            print("Pressure readings: {}".format(self.pressure))
-            print("Pressure timestam: {}".format(self.pressure_timestamps))
-            print("Pressure slope: {}".format(self.pressure_slope))
-
-            icon = self.wdata["weather"][0]["icon"]
-            bg_file = open("bmps/weather/{}.bmp".format(icon),"rb")
-            while self._bg_group:
-                self._bg_group.pop()
-                gc.collect()
-            self._bg_group.append(displayio.TileGrid(
-                displayio.OnDiskBitmap(bg_file),x=1,y=1,
-                pixel_shader=displayio.ColorConverter()))
+                # Same reading as before: it's fresh again, nothing else to do
+                print("Weather unchanged since dt {}".format(self.wdata[self.DT]))
+                self._show_colors()
+        elif self.wdata and not self.stale and self.service.stale(now):
+            print("Weather is stale. {}".format(self.service))
+            self.stale = True
+            self._show_colors()
+
+    def _show_colors(self):
+        if self.stale:
+            self.screen.color(self.temp_l, self.STALE_COLOR)
+            self.screen.color(self.text_l, self.STALE_COLOR)
+        else:
+            self.screen.color(self.temp_l, WeatherMode._temp_color(self.wdata[self.TEMP]))
+            self.screen.color(self.text_l, self.TEXT_COLOR)
+
+    def _show_data(self, now):
+        screen = self.screen
+        self._show_colors()
+        screen.text(self.temp_l, u"{: 2.1f}".format(self.wdata[self.TEMP]))
+        screen.text(self.temp_unit_l, "°C")
+        screen.text(self.text_l, self.wdata[self.DESCRIPTION])
+        # Redraw the middle row with the new numbers
+        self._shown = None
+
+        wdata = self.wdata
+        if self.history.add(wdata[self.DT], wdata[self.TEMP], wdata[self.PRESSURE],
+                wdata[self.HUMIDITY], wdata[self.WIND_SPEED]):
+            self.history.save()
+            self.pressure_slope = self.history.slope(weather_history.PRESSURE)
+            self._draw_sparkline()
+        print("Pressure slope: {} hPa/h over {} readings".format(
+            self.pressure_slope, len(self.history)))
+
+        icon = self.wdata[self.ICON]
+        while self._bg_group:
+            self._bg_group.pop()
             gc.collect()
+        try:
+            self._bg_group.append(image_tile_grid("bmps/weather/{}.bmp".format(icon),x=1,y=1)[0])
+        except OSError as e:
+            print("No icon {}: {}".format(icon, e))
+        screen.changed()
+        gc.collect()
 
-        if not down_button.value:
-            # Wait for button release
-            while not down_button.value:
-                pass
-            # Avoid allocating new list?? idk...
-            while self.pressure:
-                self.pressure.pop()
-            self.pressure.append(self.wdata["main"]["pressure"])
-            self.pressure_slope = None
-            gc.collect()
+    def update(self):
+        now = time.monotonic()
+        if not self.wdata:
+            # Nothing to show until the first refresh(); clicks meanwhile
+            # aren't for trends that aren't up. Hand over as often as a full
+            # rotation would, so messages still get shown while fetches fail
+            buttons.clear()
+            if now - self.display_timestamp > self.display_timeout:
+                self.display_timestamp = now
+                return False
+            return True
+        while buttons:
+            if buttons.get() == DOWN_CLICK:
+                # Start the trends over
+                self.history.clear()
+                self.history.save()
+                self.pressure_slope = None
+                self._draw_sparkline()
+                self._shown = None
 
         if now - self.display_timestamp > self.display_timeout:
             self.display_timestamp = now
@@ -262,164 +357,391 @@ class WeatherMode(displayio.Group):
             if self.display_mode == 0:
                 return False
 
+        # The row only changes when it rotates or there's new data
+        if self.display_mode != self._shown:
+            self._shown = self.display_mode
+            self._show_row()
+        return True
+
+    def _show_row(self):
+        screen = self.screen
+        screen.hidden(self.sparkline, self.display_mode != 3)
         if self.display_mode == 0:
-            self.magnitude_l.text = "{:3.0f} ".format(self.wdata["wind"]["speed"]*3.6) # m/s to kph
-            self.unit_l.text = "kph"
-            if self.wdata["wind"]["speed"] > 0:
-                didx = round(float(self.wdata["wind"]["deg"]) / (360/8)) % 8
-                self.dir_l.text = '↓↙←↖↑↗→↘'[didx]
+            screen.text(self.magnitude_l, "{:3.0f} ".format(self.wdata[self.WIND_SPEED]*3.6)) # m/s to kph
+            screen.text(self.unit_l, "kph")
+            if self.wdata[self.WIND_SPEED] > 0:
+                didx = round(float(self.wdata[self.WIND_DEG]) / (360/8)) % 8
+                screen.text(self.dir_l, '↓↙←↖↑↗→↘'[didx])
             else:
-                self.dir_l.text = ""
-            self.dir_l.color = self.WDIR_COLOR
+                screen.text(self.dir_l, "")
+            screen.color(self.dir_l, self.WDIR_COLOR)
         elif self.display_mode == 1:
-            self.magnitude_l.text = "{:2.0f} ".format(self.wdata["main"]["humidity"])
-            self.unit_l.text = "%rh"
-            self.dir_l.text = ""
+            screen.text(self.magnitude_l, "{:2.0f} ".format(self.wdata[self.HUMIDITY]))
+            screen.text(self.unit_l, "%rh")
+            screen.text(self.dir_l, "")
+        elif self.display_mode == 2:
+            screen.text(self.magnitude_l, "{:4.0f}".format(self.wdata[self.PRESSURE]))
+            screen.text(self.unit_l, " h\u33A9")
+            self._show_trend()
         else:
-            self.magnitude_l.text = "{:4.0f}".format(self.wdata["main"]["pressure"])
-            self.unit_l.text = " h\u33A9"
-            if self.pressure_slope is None:
-                self.dir_l.text = ""
-            elif self.pressure_slope > 0.5:
-                self.dir_l.text = "↥"
-                self.dir_l.color = 0x40C000
-            elif self.pressure_slope < -0.5:
-                self.dir_l.text = "↧"
-                self.dir_l.color = 0xC04000
-            else:
-                self.dir_l.text = "\u00AD"
-                self.dir_l.color = 0x444444
-        return True
+            # Pressure over the last spark_hours
+            screen.text(self.magnitude_l, "")
+            screen.text(self.unit_l, "{}h".format(self.spark_hours))
+            self._show_trend()
+
+    def _show_trend(self):
+        screen = self.screen
+        if self.pressure_slope is None:
+            screen.text(self.dir_l, "")
+        elif self.pressure_slope > 0.5:
+            screen.text(self.dir_l, "↥")
+            screen.color(self.dir_l, 0x40C000)
+        elif self.pressure_slope < -0.5:
+            screen.text(self.dir_l, "↧")
+            screen.color(self.dir_l, 0xC04000)
+        else:
+            screen.text(self.dir_l, "\u00AD")
+            screen.color(self.dir_l, 0x444444)
+
+    # Plot pressure over the last spark_hours, scaled to its range but to no
+    # less than 2 hPa so that noise doesn't fill the height
+    def _draw_sparkline(self):
+        bitmap = self.spark_bitmap
+        bitmap.fill(0)
+        self.screen.changed()
+        history = self.history
+        n = len(history)
+        if n < 2:
+            return
+        pressure = weather_history.PRESSURE
+        end = history.time(-1)
+        start = end - self.spark_hours * 3600
+        first = n - 1
+        while first > 0 and history.time(first - 1) >= start:
+            first -= 1
+        lo = hi = history.value(pressure, first)
+        for i in range(first + 1, n):
+            v = history.value(pressure, i)
+            if v < lo:
+                lo = v
+            elif v > hi:
+                hi = v
+        if hi - lo < 2:
+            lo = (lo + hi) / 2 - 1
+            hi = lo + 2
+        w, h = self.SPARK_W, self.SPARK_H
+        last_y = None
+        for i in range(first, n):
+            x = (history.time(i) - start) * (w - 1) // (end - start)
+            y = h - 1 - int((history.value(pressure, i) - lo) * (h - 1) / (hi - lo) + 0.5)
+            # Join each point to the one before so steps don't leave gaps
+            y0 = y if last_y is None else last_y
+            for yy in range(min(y, y0), max(y, y0) + 1):
+                bitmap[x, yy] = 1
+            last_y = y
 
 
 class MessageMode(displayio.Group):
 
-    def _justify(strings):
-        new = "\n".join(["{:>10}".format(s) for s in strings.split('\n')])
-        return new
-
-    def __init__(self,msg_duration=5,*,font=None):
+    def __init__(self,msg_duration=5,*,font=None,emoji_atlas="bmps/emojis.bin",
+            capacity=16,store="messages.log",preempt_priority=2,scroll_speed=24,screen=None,
+            clock=None):
         super().__init__(max_size=2)
+        self.screen = screen or Screen()
         self.msg_duration = msg_duration
         self.persist = False
+        # Messages of this priority or more take over from weather and air modes
+        self.preempt_priority = preempt_priority
+        self.urgent = False
 
-        self.message_list = []
-        self.current_message = None
+        try:
+            self.emoji_atlas = EmojiAtlas(emoji_atlas)
+            self.emoji_index = EmojiIndex(self.emoji_atlas)
+        except (OSError, ValueError) as e:
+            print("No emoji atlas: {}".format(e))
+            self.emoji_atlas = None
+            self.emoji_index = None
+
+        self.bitmap_cache = BitmapCache()
+        self._prefetched = None
+        # Pictures sent over MQTT, shown by giving their id as the picture
+        self.images = ImageStore()
+
+        # Text that doesn't fit the panel scrolls, up to the marquee's limit
+        # Expiries are kept as wall-clock times once clock() tells the time
+        self.store = MessageStore(capacity, path=store, max_text=160, clock=clock)
+        self.current_message = None   # the Message on screen
         self.display_timestamp = time.monotonic()
+        self.duration = msg_duration  # of the message on screen
 
         if not font:
             self.font = FONT
         else:
             self.font = font
+        # Fonts to lay text out in, first choice first. The big font only has
+        # the letters AirMode needs, so it's for short shouty messages; the
+        # last one has everything and is also used for scrolling.
+        self.fonts = (FontMetrics(load_font("fonts/BellotaText-Bold-21_DJL.bdf")),
+                      FontMetrics(self.font, 0.8))
 
+        self.TEXT_COLOR = 0x787878
         self._bg_group = displayio.Group(max_size=1)
-        self._text = Label(
-            font=self.font,
-            max_glyphs=50,
-            anchored_position=(64,32),
-            anchor_point=(1.0,1.0),
-            color=0x787878,
-            line_spacing=0.8
-        )
+        self._text_group = displayio.Group(max_size=1)
+        self.marquee = Marquee(64, scroll_speed)
         self.append(self._bg_group)
-        self.append(self._text)
+        self.append(self._text_group)
 
     # Returns True if there are still messages
     # Returns False otherwise
     def update(self):
-        if not self.message_list: # No messages anyway; just exit
-            return False
         now = time.monotonic()
-        # Get button values, active low
-        up_v = up_button.value
-        down_v = down_button.value
-        if up_v and down_v:
-            # If no buttons are pressed, do this check.
-            if now - self.display_timestamp < self.msg_duration:
-                return bool(self.message_list)
-        if not up_v:
-            # If up button is pressed, wait for press to stop
-            while not up_button.value:
-                pass
+        self.store.expire(now)
+        if not self.store: # No messages anyway; just exit
+            return False
+        if self.current_message is not None and \
+                self.store.get(self.current_message.id) is not self.current_message:
+            # Deleted or expired while on screen; move on now
+            self.current_message = None
+            self.display_timestamp = 0
+        action = None
+        while buttons and action is None:
+            action = buttons.get()
+            if action not in (UP_CLICK, DOWN_CLICK, DOWN_LONG_PRESS):
+                action = None
+        if action is None:
+            # If no buttons were pressed, do this check.
+            if now - self.display_timestamp < self.duration:
+                if self.marquee.step(now):
+                    self.screen.changed()
+                return True
+        if action == UP_CLICK:
             self.persist = False
             self.current_message = None
             self.display_timestamp = 0
             return False
-        # Up and/or down buttons are pressed (active low), or it's time to update
-        if not down_v:
-            # If down button is pressed, wait for press to stop
-            while not down_button.value:
-                pass
-            print("Down button release.")
-            # delete this message and go to previous one.
+        if action == DOWN_LONG_PRESS:
+            print("Clearing all messages.")
+            self.store.clear()
+            self.current_message = None
+            self._prefetched = None
+            self.bitmap_cache.clear()
+            if self._bg_group:
+                self._bg_group.pop()
+            self._show_text(None, now)
+            self.persist = False
+            return False
+        # Down button was clicked, or it's time to update
+        if action == DOWN_CLICK and self.current_message is not None:
+            # delete this message and go on to the next one.
             print("Deleting message {}.".format(self.current_message))
-            self.message_list.pop(self.current_message)
+            self.store.remove(self.current_message.id)
+            self.current_message = None
             if self._bg_group:
                 self._bg_group.pop()
-            if self.message_list:
-                self.current_message = (self.current_message - 1) % len(self.message_list)
-                if self.current_message == len(self.message_list) - 1:
-                    self.current_message = None # Fresh start
-            else:
-                self._text.text = ""
+                self.screen.changed()
+            if not self.store:
+                self._show_text(None, now)
                 self.persist = False
                 return False
         # No buttons pressed if we got here
         self.display_timestamp = now
-        if self.current_message is not None:
-            next_message = (self.current_message + 1) % len(self.message_list)
-            if next_message == 0:
-                self.current_message = None
-                return False
-        else:
-            next_message = 0
-        self.current_message = next_message
-        try:
-            self._text.text = ""
-            self._text.text = MessageMode._justify(self.message_list[self.current_message]['text'])
-        except KeyError:
-            self._text.text = ""
-        try:
-            picture = self.message_list[self.current_message]['picture']
-            if not picture:
-                raise KeyError
-        except KeyError:
-            try:
-                emoji = self.message_list[self.current_message]['emoji']
-                full_emoji = "bmps/emojis/" + "-".join(["{:x}".format(ord(cp)) for cp in emoji]) + ".bmp"
-                try:
-                    os.stat(full_emoji)
-                    picture = full_emoji
-                except OSError:
-                    print("Backing off to simpler emoji.")
-                    picture = "bmps/emojis/{:x}.bmp".format(ord(emoji[0]))
-            except (KeyError,IndexError):
-                picture = None
-        print("Displaying {}, {}, {}.".format(self.current_message,self._text.text,picture))
+        message = self.store.next(now)
+        if message is None:
+            # Every message has had its turn
+            self.current_message = None
+            return False
+        self.current_message = message
+        self.duration = message.duration or self.msg_duration
+        tile_grid, text_tile = self._prepare(message.text, message.picture, message.emoji)
+        print("Displaying {}.".format(message))
         if self._bg_group:
             self._bg_group.pop()
-        gc.collect()
-        if picture:
-            try:
-                bg_file = open(picture,"rb")
-                self._bg_group.append(displayio.TileGrid(
-                    displayio.OnDiskBitmap(bg_file),
-                    pixel_shader=displayio.ColorConverter()))
-            except OSError as e:
-                print(e)
-        gc.collect()
+        if tile_grid:
+            self._bg_group.append(tile_grid)
+        self._show_text(text_tile, now)
         return True
 
-    # True iff there are messages in the list
+    # Laid-out text sits in the bottom right corner; anything wider than the
+    # panel scrolls along the bottom
+    def _show_text(self, tile_grid, now):
+        self.marquee.stop()
+        # The picture has usually changed too
+        self.screen.changed()
+        if self._text_group:
+            self._text_group.pop()
+        if not tile_grid:
+            return
+        tile_grid.y = 32 - tile_grid.bitmap.height
+        self._text_group.append(tile_grid)
+        if tile_grid.bitmap.width <= 64:
+            tile_grid.x = 64 - tile_grid.bitmap.width
+            return
+        self.marquee.start(tile_grid, now)
+        # Stay up for at least one full pass
+        if self.duration < self.marquee.duration():
+            self.duration = self.marquee.duration()
+
+    # The picture's and the text's TileGrids for a message. Both are built
+    # once, when the message arrives, and kept in the bitmap cache, so
+    # showing the message again is just a swap.
+    def _prepare(self, text, picture, emoji):
+        tile_grid = self._tile_grid(picture, emoji)
+        if not text:
+            return tile_grid, None
+        # Keep clear of the picture if there's room
+        reserve = tile_grid.bitmap.width + 1 if tile_grid else 0
+        key = (text, reserve)
+        text_tile = self.bitmap_cache.get(key)
+        if text_tile:
+            return tile_grid, text_tile
+        layout = fit(text, self.fonts, 64, 32, reserve)
+        if layout:
+            text_tile = layout.render(self.TEXT_COLOR)
+        else:
+            text_tile = render(self.fonts[-1], " ".join(text.split("\n")), self.TEXT_COLOR)
+        self.bitmap_cache.put(key, text_tile,
+            bitmap_bytes(text_tile.bitmap, text_tile.pixel_shader))
+        return tile_grid, text_tile
+
+    # Cache key for a message's picture: its path or id, or for an emoji the
+    # closest atlas tile, backing off component by component towards the
+    # base emoji if we don't have the full codepoint sequence.
+    def _picture_key(self, picture, emoji):
+        if picture:
+            return picture
+        if not self.emoji_index or not emoji:
+            return None
+        return self.emoji_index.lookup([ord(cp) for cp in emoji])
+
+    def _tile_grid(self, picture, emoji):
+        key = self._picture_key(picture, emoji)
+        if key is None:
+            return None
+        tile_grid = self.bitmap_cache.get(key)
+        if tile_grid:
+            return tile_grid
+        try:
+            if isinstance(key, str):
+                tile_grid, size = image_tile_grid(
+                    self.images.path(key) if image_store.valid_id(key) else key)
+            else:
+                bitmap, palette = self.emoji_atlas.tile(key)
+                tile_grid = displayio.TileGrid(bitmap,pixel_shader=palette)
+                size = bitmap_bytes(bitmap, palette)
+        except (OSError, ValueError) as e:
+            print(e)
+            return None
+        self.bitmap_cache.put(key, tile_grid, size)
+        return tile_grid
+
+    # Decode the next message's picture while idle, so that rotating to it
+    # is just a TileGrid swap.
+    def prefetch(self):
+        message = self.store.peek()
+        if message is None or message is self._prefetched:
+            return
+        self._prefetched = message
+        self._prepare(message.text, message.picture, message.emoji)
+
+    # True iff there are messages in the store
     def __bool__(self):
-        return bool(self.message_list)
+        return bool(self.store)
 
+    # Handle display/message: add a message, or replace the one with its id
     def json_message(self, mqtt_client, topic, message):
         print(f"New message on topic {topic}: {message}")
         try:
-            m = json.loads(message)
-            self.message_list.append(m)
-        except (ValueError, KeyError) as e:
+            record = self.store.selector.parse(message)
+            id, text, picture, emoji, priority = record[:5]
+            if text or picture or emoji:
+                result = self.store.put(*record)
+                print("Message {}".format(message_store.RESULTS[result]))
+                if result in (message_store.ADDED, message_store.UPDATED):
+                    # Lay it out now rather than when it's first shown
+                    self._prepare(text and text[:self.store.max_text], picture, emoji)
+                    if (priority or 0) >= self.preempt_priority:
+                        self.urgent = True
+            else:
+                print("Nothing to show in message")
+        except (ValueError, KeyError, TypeError) as e:
             print(e)
         gc.collect()
-        print(f"Free memory after adding message: {gc.mem_free()}")
\ No newline at end of file
+        print(f"Free memory after adding message: {gc.mem_free()}")
+
+    # Handle display/message/batch: a JSON array of messages, or one per line.
+    # They're stored in one pass with one log write and one collection, and
+    # laid out when they come up rather than all at once. Returns how many
+    # of each store result there were, indexed like message_store.RESULTS.
+    def batch_messages(self, mqtt_client, topic, message):
+        print(f"Batch on topic {topic}: {len(message)} bytes")
+        counts = [0] * len(message_store.RESULTS)
+        store = self.store
+        store.begin()
+        try:
+            for record in store.selector.parse_many(message):
+                if not (record[1] or record[2] or record[3]):
+                    counts[message_store.REJECTED] += 1
+                    continue
+                # One bad record is rejected; the rest still go in
+                try:
+                    result = store.put(*record)
+                    if result in (message_store.ADDED, message_store.UPDATED) and \
+                            (record[4] or 0) >= self.preempt_priority:
+                        self.urgent = True
+                except (ValueError, KeyError, TypeError) as e:
+                    print(e)
+                    result = message_store.REJECTED
+                counts[result] += 1
+        except (ValueError, KeyError, TypeError) as e:
+            # The rest of the batch can't be read; what came before stays
+            print("Bad batch: {}".format(e))
+        finally:
+            store.commit()
+        gc.collect()
+        print("Batch: {}; free memory {}".format(
+            ", ".join("{} {}".format(n, r) for n, r in zip(counts, message_store.RESULTS)),
+            gc.mem_free()))
+        return counts
+
+    # Handle display/image: a chunk of a picture. Returns (id, result) once
+    # the picture is saved or has failed, result indexing image_store.RESULTS
+    def image_chunk(self, mqtt_client, topic, message):
+        done = self.images.chunk(message)
+        if done is not None:
+            id, result = done
+            print("Image {} {}".format(id, image_store.RESULTS[result]))
+            if result == image_store.SAVED:
+                # Replaced; show the new one from now on
+                forget_image(self.images.path(id))
+                self.bitmap_cache.remove(id)
+                self._prefetched = None
+        return done
+
+    # Handle display/message/update: change some fields of the message with this id
+    def update_message(self, mqtt_client, topic, message):
+        print(f"Update on topic {topic}: {message}")
+        try:
+            record = self.store.selector.parse(message)
+            if record[0] is None:
+                print("Update without an id")
+                return
+            result = self.store.update(*record)
+            print("Message {}".format(message_store.RESULTS[result]))
+        except (ValueError, KeyError, TypeError) as e:
+            print(e)
+
+    # Handle display/message/delete: the payload is an id, bare, as a JSON
+    # string or number, or as {"id": ...}
+    def delete_message(self, mqtt_client, topic, message):
+        print(f"Delete on topic {topic}: {message}")
+        try:
+            if message.lstrip().startswith("{"):
+                id = self.store.selector.parse(message)[0]
+            else:
+                id = json_stream.load(message)
+        except ValueError:
+            id = None
+        if not isinstance(id, (str, int)) or isinstance(id, bool):
+            id = message.strip()
+        if not self.store.remove(id):
+            print("No message {}".format(id))
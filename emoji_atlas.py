@@ -0,0 +1,201 @@
+"""
+Reader for the packed emoji atlas written by scripts/pack_emoji_atlas.py.
+
+All values are big-endian:
+
+  header    4s "EMJ1", B version, B tile width, B tile height,
+            B colors per palette, H tile count, H palette count
+  offsets   (count + 1) x H, start of each tile's key in the key table,
+            counted in codepoints
+  keys      3 bytes per codepoint; tiles are sorted by codepoint sequence
+  entries   count x (I file offset of tile data, H palette number,
+            with 0x8000 set if the tile is nibble-packed rather than RLE)
+  palettes  palette count x colors x 3 bytes RGB
+  tiles     RLE tiles are one byte per run: (length - 1) << 4 | color index
+
+EmojiAtlas.find() binary-searches the key table on flash, so opening the
+atlas costs a file handle and a few dozen bytes of RAM however many emojis it
+holds. EmojiIndex reads the offsets and keys into RAM once instead, so
+lookups never touch the filesystem and can afford to try several fallbacks.
+"""
+
+import struct
+import displayio
+
+RAW = 0x8000
+ZWJ = 0x200D
+VS16 = 0xFE0F
+
+
+def encode(codepoints):
+    """Key bytes for a sequence of codepoints, as stored in the atlas."""
+    key = bytearray(3 * len(codepoints))
+    for i, cp in enumerate(codepoints):
+        key[3*i] = cp >> 16
+        key[3*i + 1] = (cp >> 8) & 0xFF
+        key[3*i + 2] = cp & 0xFF
+    return bytes(key)
+
+
+class EmojiAtlas:
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            (magic, version, self.tile_width, self.tile_height, self.colors,
+                self.count, palettes) = struct.unpack(">4sBBBBHH", self._file.read(12))
+            if magic != b"EMJ1":
+                raise ValueError("{} is not an emoji atlas".format(path))
+            self._offsets = 12
+            self._keys = self._offsets + 2 * (self.count + 1)
+            self._entries = self._keys + 3 * self._offset(self.count)
+            self._palettes = self._entries + 6 * self.count
+            self._file.seek(0, 2)
+            self._end = self._file.tell()
+        except Exception:
+            # Nothing else would close it
+            self._file.close()
+            raise
+        # Worst case RLE is a byte per pixel
+        self._buf = bytearray(self.tile_width * self.tile_height)
+
+    def _offset(self, i):
+        self._file.seek(self._offsets + 2*i)
+        return struct.unpack(">H", self._file.read(2))[0]
+
+    def key(self, i):
+        """Key bytes of tile ``i``."""
+        self._file.seek(self._offsets + 2*i)
+        start, end = struct.unpack(">HH", self._file.read(4))
+        self._file.seek(self._keys + 3*start)
+        return self._file.read(3 * (end - start))
+
+    def find(self, codepoints):
+        """Index of the tile for exactly this codepoint sequence, or None."""
+        key = encode(codepoints)
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.key(lo) == key:
+            return lo
+        return None
+
+    def read_index(self):
+        """The raw offsets and key tables, for building an EmojiIndex."""
+        self._file.seek(self._offsets)
+        offsets = self._file.read(self._keys - self._offsets)
+        keys = self._file.read(self._entries - self._keys)
+        return offsets, keys
+
+    def tile(self, i):
+        """Decode tile ``i`` into a new (Bitmap, Palette) pair."""
+        self._file.seek(self._entries + 6*i)
+        start, number = struct.unpack(">IH", self._file.read(6))
+        if i + 1 < self.count:
+            end = struct.unpack(">I", self._file.read(4))[0]
+        else:
+            end = self._end
+
+        palette = displayio.Palette(self.colors)
+        self._file.seek(self._palettes + 3 * self.colors * (number & ~RAW))
+        rgb = self._file.read(3 * self.colors)
+        for c in range(self.colors):
+            palette[c] = rgb[3*c] << 16 | rgb[3*c + 1] << 8 | rgb[3*c + 2]
+
+        bitmap = displayio.Bitmap(self.tile_width, self.tile_height, self.colors)
+        data = memoryview(self._buf)[:end - start]
+        self._file.seek(start)
+        self._file.readinto(data)
+        p = 0
+        if number & RAW:
+            for b in data:
+                # Bitmaps start out zeroed, so only non-zero pixels are written
+                if b >> 4:
+                    bitmap[p] = b >> 4
+                if b & 0xF and p + 1 < len(self._buf):
+                    bitmap[p + 1] = b & 0xF
+                p += 2
+        else:
+            for b in data:
+                run = (b >> 4) + 1
+                b &= 0xF
+                if b:
+                    for q in range(p, p + run):
+                        bitmap[q] = b
+                p += run
+        return bitmap, palette
+
+    def close(self):
+        self._file.close()
+
+
+class EmojiIndex:
+
+    def __init__(self, atlas):
+        self.count = atlas.count
+        self._offsets, self._keys = atlas.read_index()
+
+    def _offset(self, i):
+        return 3 * (self._offsets[2*i] << 8 | self._offsets[2*i + 1])
+
+    # Compare the key of tile i with the first n bytes of key, byte by byte
+    # so the bisection allocates nothing.
+    def _compare(self, i, key, n):
+        keys = self._keys
+        start = self._offset(i)
+        end = self._offset(i + 1)
+        for j in range(min(end - start, n)):
+            if keys[start + j] != key[j]:
+                return -1 if keys[start + j] < key[j] else 1
+        return (end - start > n) - (end - start < n)
+
+    def find(self, key, n=None):
+        """Index of the tile whose key is exactly key[:n] bytes, or None."""
+        if n is None:
+            n = len(key)
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(mid, key, n) < 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._compare(lo, key, n) == 0:
+            return lo
+        return None
+
+    def lookup(self, codepoints):
+        """Index of the closest available tile, or None.
+
+        That is the longest prefix of the sequence, with or without its
+        variation selectors, that ends on a whole emoji component: a missing
+        skin tone or ZWJ part falls back towards the base emoji.
+        """
+        stripped = [cp for cp in codepoints if cp != VS16]
+        best = None
+        best_weight = 0
+        for cps in (codepoints, stripped):
+            key = encode(cps)
+            # Codepoints other than variation selectors in cps[:n]
+            weight = len(stripped)
+            for n in range(len(cps), 0, -1):
+                if weight <= best_weight:
+                    break
+                last = cps[n-1]
+                if last != ZWJ:
+                    i = self.find(key, 3*n)
+                    if i is not None:
+                        best = i
+                        best_weight = weight
+                        break
+                if last != VS16:
+                    weight -= 1
+            if len(stripped) == len(codepoints):
+                break
+        return best
@@ -24,7 +24,11 @@ All text above must be included in any redistribution.
 # l.level = logging.ERROR
 # l.error("test")
 
-from adafruit_logging import LoggingHandler
+import io
+import os
+import sys
+import time
+from adafruit_logging import LoggingHandler, level_for
 
 class FileHandler(LoggingHandler):
 
@@ -52,4 +56,134 @@ class FileHandler(LoggingHandler):
         :param msg: The core message
 
         """
-        self._file.write(self.format(level, msg))
\ No newline at end of file
+        self._file.write(self.format(level, msg))
+
+class RingFileHandler(LoggingHandler):
+    """Log lines are kept in a fixed RAM ring and written to flash in
+    batches, rather than a write per line. The ring is flushed once
+    ``flush_size`` bytes are waiting, or whenever flush() is called: code.py
+    does that every so often and when it crashes. If flash can't keep up
+    the oldest lines are dropped. The file is moved to ``path.1`` (and so
+    on, up to ``backups``) once it would grow past ``max_bytes``.
+
+    It has write() and flush(), but isn't a stream as far as CircuitPython
+    is concerned: print(file=) and sys.print_exception() raise "stream
+    operation not supported" given one. Write text with write(), and
+    exceptions with write_exception().
+    """
+
+    def __init__(self, path, *, buffer_size=2048, flush_size=1024, max_bytes=32768,
+                 backups=1):
+        """Create an instance.
+
+        :param path: the log file
+        :param buffer_size: bytes of RAM for lines not yet written
+        :param flush_size: waiting bytes that trigger a write
+        :param max_bytes: size at which the file is rotated
+        :param backups: old files kept
+
+        """
+        self.path = path
+        self.flush_size = min(flush_size, buffer_size)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0     # oldest waiting byte
+        self._len = 0       # bytes waiting
+        self._writable = True
+        try:
+            self._size = os.stat(path)[6]
+        except OSError:
+            self._size = 0
+
+    def emit(self, level, msg):
+        """Add a line to the ring, as the pieces of the usual format.
+
+        :param level: The level at which to log
+        :param msg: The core message
+
+        """
+        self.write(str(time.monotonic()))
+        self.write(": ")
+        self.write(level_for(level))
+        self.write(" - ")
+        self.write(msg)
+        self.write("\r\n")
+
+    def write(self, text):
+        data = memoryview(text.encode() if isinstance(text, str) else text)
+        n = len(data)
+        size = len(self._buf)
+        if n > size:
+            self.dropped += n - size
+            data = data[n - size:]
+            n = size
+        # Make room by dropping the oldest bytes
+        over = self._len + n - size
+        if over > 0:
+            self._start = (self._start + over) % size
+            self._len -= over
+            self.dropped += over
+        end = (self._start + self._len) % size
+        first = min(n, size - end)
+        self._buf[end:end + first] = data[:first]
+        if first < n:
+            self._buf[:n - first] = data[first:]
+        self._len += n
+        if self._len >= self.flush_size:
+            self.flush()
+
+    def write_exception(self, e):
+        """Add ``e`` and its traceback, as sys.print_exception() prints them."""
+        buf = io.StringIO()
+        sys.print_exception(e, buf)
+        self.write(buf.getvalue())
+
+    def flush(self):
+        """Write whatever is waiting to flash."""
+        if not self._len or not self._writable:
+            return
+        size = len(self._buf)
+        end = self._start + self._len
+        try:
+            if self._size + self._len > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as f:
+                if end <= size:
+                    f.write(self._view[self._start:end])
+                else:
+                    f.write(self._view[self._start:])
+                    f.write(self._view[:end - size])
+        except OSError as e:
+            # Flash is read-only unless boot.py remounted it
+            print("Not logging to {}: {}".format(self.path, e))
+            self._writable = False
+            return
+        self._size += self._len
+        self._start = 0
+        self._len = 0
+
+    # FAT won't rename over an existing file, so each one is removed first
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            old = self.path if i == 1 else "{}.{}".format(self.path, i - 1)
+            new = "{}.{}".format(self.path, i)
+            try:
+                os.remove(new)
+            except OSError:
+                pass
+            try:
+                os.rename(old, new)
+            except OSError:
+                pass
+        if not self.backups:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self._size = 0
+
+    def close(self):
+        self.flush()
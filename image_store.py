@@ -0,0 +1,259 @@
+"""
+Message pictures sent over MQTT, a chunk at a time, into files on flash.
+
+A picture is a palettised BMP of at most 64x32, sent as a run of frames,
+one per MQTT message. A frame is one line of ASCII: the picture's id, the
+chunk's index and, on the first chunk only, the chunk count, the file's
+size and its CRC-32 in hex, then the chunk's bytes in base64, all separated
+by spaces:
+
+    logo 0 3 1078 5d2f0a1c Qk02BAAAAAAAADYAAAAoAAAAQAAAACAAAAABAAgAAAAAAAAEAAAT...
+    logo 1 AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA...
+    logo 2 AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA...
+
+MiniMQTT hands payloads over as text, so the bytes can't go as they are.
+scripts/image_frames.py makes the frames from an image.
+
+Decoded chunks are gathered in a fixed buffer and written out to
+``<directory>/<id>.tmp`` whenever it fills, so only one chunk and the
+buffer are ever in RAM, whatever the picture's size. Once the last chunk is
+in, the file's CRC and header are checked and it replaces
+``<directory>/<id>.bmp``. A message then shows it by giving the id as its
+``picture``.
+
+Chunks have to come in order. A repeat, as a QoS 1 redelivery would be, is
+ignored, including a first chunk with the same header as the upload under
+way or the last one saved; a gap ends the upload. So does any other first
+chunk, or no chunk for ``timeout`` seconds. There is one upload at a time.
+As with the message log, writing only works when boot.py has remounted the
+filesystem writable.
+"""
+
+import os
+import time
+from binascii import a2b_base64, crc32
+
+from bitmap_cache import read_header
+
+SAVED = 0
+BAD_FRAME = 1
+OUT_OF_ORDER = 2
+TOO_BIG = 3
+BAD_CHECKSUM = 4
+BAD_IMAGE = 5
+NOT_SAVED = 6
+ABANDONED = 7
+RESULTS = ("saved", "bad frame", "out of order", "too big", "bad checksum", "bad image",
+           "not saved", "abandoned")
+
+MAX_ID = 16
+
+
+def valid_id(id):
+    """Whether ``id`` can name a picture: short, and not a path."""
+    return 0 < len(id) <= MAX_ID and "/" not in id and "." not in id
+
+
+class ImageStore:
+
+    def __init__(self, directory="images", *, max_size=8192, buffer_size=1024, timeout=60,
+                 width=64, height=32):
+        """
+        :param directory: where the pictures go on flash
+        :param max_size: largest file accepted, in bytes
+        :param buffer_size: bytes gathered in RAM between writes
+        :param timeout: seconds without a chunk after which an upload is dropped
+        :param width: widest picture accepted
+        :param height: tallest picture accepted
+
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.width = width
+        self.height = height
+        self._buffer = bytearray(buffer_size)
+        self._buffered = 0
+        self._file = None
+        self.id = None          # of the upload under way, if any
+        self._done = None       # header of the last one saved, for its redeliveries
+        self._count = 0
+        self._next = 0
+        self._size = 0
+        self._written = 0
+        self._crc = 0
+        self._expected_crc = 0
+        self._last = 0
+
+    def path(self, id):
+        return "{}/{}.bmp".format(self.directory, id)
+
+    def _tmp(self, id):
+        return "{}/{}.tmp".format(self.directory, id)
+
+    def chunk(self, frame, now=None):
+        """Take one frame. Returns (id, result) once an upload is over, one
+        way or the other, and None while it's under way or for a repeated
+        chunk."""
+        if now is None:
+            now = time.monotonic()
+        fields = frame.split()
+        try:
+            id = fields[0]
+            index = int(fields[1])
+            if not valid_id(id):
+                raise ValueError("bad id {}".format(id))
+            if index == 0:
+                count, size, expected_crc = int(fields[2]), int(fields[3]), int(fields[4], 16)
+                data = fields[5] if len(fields) > 5 else ""
+            else:
+                data = fields[2] if len(fields) > 2 else ""
+            data = a2b_base64(data)
+        except (IndexError, ValueError) as e:
+            # binascii.Error is a ValueError
+            print("Bad image frame: {}".format(e))
+            return (fields[0] if fields else None), BAD_FRAME
+
+        if index == 0:
+            if count < 1 or size < 0:
+                print("Bad image frame: {} chunks, {} bytes".format(count, size))
+                return id, BAD_FRAME
+            header = (id, count, size, expected_crc)
+            if header == self._done or (self.id is not None and self._next > 0
+                                        and header == self._header()):
+                # Redelivered
+                return None
+            if self.id is not None:
+                print("Image {} abandoned for {}".format(self.id, id))
+                self._abort()
+            if size > self.max_size:
+                return id, TOO_BIG
+            try:
+                self._start(id, count, size, expected_crc)
+            except OSError as e:
+                print("Can't save image {}: {}".format(id, e))
+                return id, NOT_SAVED
+        elif id != self.id:
+            return None if self._done and id == self._done[0] else (id, OUT_OF_ORDER)
+        elif index < self._next:
+            # Already have it
+            return None
+        elif index > self._next or index >= self._count:
+            self._abort()
+            return id, OUT_OF_ORDER
+        self._last = now
+        self._next = index + 1
+        try:
+            if self._written + self._buffered + len(data) > self._size:
+                self._abort()
+                return id, TOO_BIG
+            self._add(data)
+            if self._next < self._count:
+                return None
+            return id, self._finish()
+        except OSError as e:
+            print("Can't save image {}: {}".format(id, e))
+            self._abort()
+            return id, NOT_SAVED
+
+    def expire(self, now=None):
+        """Drop an upload that has stalled; returns (id, ABANDONED) if it did."""
+        if self.id is None:
+            return None
+        if now is None:
+            now = time.monotonic()
+        if now - self._last < self.timeout:
+            return None
+        id = self.id
+        print("Image {} abandoned after {} of {} chunks".format(id, self._next, self._count))
+        self._abort()
+        return id, ABANDONED
+
+    def _header(self):
+        return self.id, self._count, self._size, self._expected_crc
+
+    def _start(self, id, count, size, expected_crc):
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            # Most likely there already
+            pass
+        self._file = open(self._tmp(id), "wb")
+        self.id = id
+        self._done = None
+        self._count = count
+        self._next = 0
+        self._size = size
+        self._written = 0
+        self._buffered = 0
+        self._crc = 0
+        self._expected_crc = expected_crc
+
+    def _add(self, data):
+        self._crc = crc32(data, self._crc)
+        buffer = self._buffer
+        i = 0
+        while i < len(data):
+            n = min(len(buffer) - self._buffered, len(data) - i)
+            buffer[self._buffered:self._buffered + n] = data[i:i + n]
+            self._buffered += n
+            i += n
+            if self._buffered == len(buffer):
+                self._flush()
+
+    def _flush(self):
+        if self._buffered:
+            self._file.write(memoryview(self._buffer)[:self._buffered])
+            self._written += self._buffered
+            self._buffered = 0
+
+    def _finish(self):
+        id = self.id
+        self._flush()
+        self._file.close()
+        header = self._header()
+        self._file = None
+        self.id = None
+        tmp = self._tmp(id)
+        if self._written != self._size or self._crc & 0xFFFFFFFF != self._expected_crc:
+            self._remove(tmp)
+            return BAD_CHECKSUM
+        try:
+            # The header's enough; the pixels are read when it's shown
+            with open(tmp, "rb") as f:
+                offset, _, width, height, _, _ = read_header(f, tmp)
+            if not 0 < width <= self.width or not 0 < abs(height) <= self.height:
+                raise ValueError("{}x{} doesn't fit the panel".format(width, abs(height)))
+            if offset >= self._size:
+                raise ValueError("{} has no pixels".format(tmp))
+        except (OSError, ValueError) as e:
+            print("Image {}: {}".format(id, e))
+            self._remove(tmp)
+            return BAD_IMAGE
+        path = self.path(id)
+        # FAT won't rename over an existing file
+        self._remove(path)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            self._remove(tmp)
+            raise
+        # Only now, so a resend after a failure isn't taken for a redelivery
+        self._done = header
+        print("Saved image {}, {} bytes".format(id, self._written))
+        return SAVED
+
+    def _abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.id is not None:
+            self._remove(self._tmp(self.id))
+        self.id = None
+        self._buffered = 0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
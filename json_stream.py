@@ -0,0 +1,284 @@
+"""
+Field-selective JSON decoding.
+
+A Selector is built once from the key paths we care about, e.g.
+``("main", "temp")`` or ``("weather", 0, "icon")``, and parse() walks a
+document byte by byte, decoding only the values at those paths into a
+list in the same order (None where a path is missing). Everything else is
+skipped without building strings, dicts or lists, so the full tree never
+exists in RAM. parse_many() does the same for each document in an array or
+a newline-delimited stream, one at a time. The source can be a str, bytes,
+or any iterable of byte chunks such as ``response.iter_content(64)``, so a
+response can be parsed straight off the socket.
+"""
+
+import json
+
+
+class _Reader:
+
+    def __init__(self, source):
+        if isinstance(source, str):
+            source = source.encode()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._buf = source
+            self._chunks = None
+        else:
+            self._buf = b""
+            self._chunks = iter(source)
+        self._pos = 0
+
+    def peek(self):
+        """Next byte without consuming it, or -1 at the end."""
+        while self._pos >= len(self._buf):
+            if self._chunks is None:
+                return -1
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                self._chunks = None
+                return -1
+            self._pos = 0
+        return self._buf[self._pos]
+
+    def next(self):
+        c = self.peek()
+        if c < 0:
+            raise ValueError("Unexpected end of JSON")
+        self._pos += 1
+        return c
+
+    def skip_ws(self):
+        c = self.peek()
+        while c == 0x20 or c == 0x0A or c == 0x0D or c == 0x09:
+            self._pos += 1
+            c = self.peek()
+        return c
+
+    def expect(self, c):
+        if self.skip_ws() != c:
+            raise ValueError("Expected {!r} in JSON".format(chr(c)))
+        self._pos += 1
+
+    def separator(self, close):
+        """Consume the ',' between items or the ``close`` after the last;
+        True if it was ``close``."""
+        c = self.skip_ws()
+        if c == close:
+            self._pos += 1
+            return True
+        if c < 0:
+            raise ValueError("Unexpected end of JSON")
+        if c != 0x2C:
+            raise ValueError("Expected ',' or {!r} in JSON".format(chr(close)))
+        self._pos += 1
+        return False
+
+
+_ESCAPES = {0x22: 0x22, 0x5C: 0x5C, 0x2F: 0x2F, 0x62: 0x08, 0x66: 0x0C,
+            0x6E: 0x0A, 0x72: 0x0D, 0x74: 0x09}
+
+
+def _hex4(r):
+    v = 0
+    for _ in range(4):
+        v = v << 4 | int(chr(r.next()), 16)
+    return v
+
+
+def _read_string(r, out):
+    """Read a string body (after the opening quote) into bytearray ``out``
+    as UTF-8, or just skip it if ``out`` is None."""
+    while True:
+        c = r.next()
+        if c == 0x22:
+            return out
+        if c != 0x5C:
+            if out is not None:
+                out.append(c)
+            continue
+        c = r.next()
+        if c != 0x75:
+            e = _ESCAPES.get(c)
+            if e is None:
+                raise ValueError("Bad escape in JSON string")
+            if out is not None:
+                out.append(e)
+            continue
+        cp = _hex4(r)
+        if 0xD800 <= cp < 0xDC00:
+            # Surrogate pair, as used for emoji
+            if r.next() != 0x5C or r.next() != 0x75:
+                raise ValueError("Unpaired surrogate in JSON")
+            cp = 0x10000 + ((cp - 0xD800) << 10) + (_hex4(r) - 0xDC00)
+        if out is not None:
+            out.extend(chr(cp).encode())
+
+
+def _skip(r):
+    """Skip one value without decoding it."""
+    c = r.skip_ws()
+    if c == 0x22:
+        r.next()
+        _read_string(r, None)
+        return
+    if c != 0x7B and c != 0x5B:
+        # Number, true, false or null
+        while c >= 0 and c not in b",}] \t\r\n":
+            r.next()
+            c = r.peek()
+        return
+    depth = 0
+    while True:
+        c = r.next()
+        if c == 0x22:
+            _read_string(r, None)
+        elif c == 0x7B or c == 0x5B:
+            depth += 1
+        elif c == 0x7D or c == 0x5D:
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def _load(r):
+    """Decode one value in full."""
+    c = r.skip_ws()
+    if c == 0x22:
+        r.next()
+        return str(_read_string(r, bytearray()), "utf-8")
+    if c == 0x7B:
+        r.next()
+        obj = {}
+        if r.skip_ws() == 0x7D:
+            r.next()
+            return obj
+        while True:
+            r.expect(0x22)
+            key = str(_read_string(r, bytearray()), "utf-8")
+            r.expect(0x3A)
+            obj[key] = _load(r)
+            if r.separator(0x7D):
+                return obj
+    if c == 0x5B:
+        r.next()
+        arr = []
+        if r.skip_ws() == 0x5D:
+            r.next()
+            return arr
+        while True:
+            arr.append(_load(r))
+            if r.separator(0x5D):
+                return arr
+    token = bytearray()
+    while c >= 0 and c not in b",}] \t\r\n":
+        token.append(r.next())
+        c = r.peek()
+    return json.loads(token)
+
+
+def load(source):
+    """One JSON value decoded in full, from anything parse() takes."""
+    return _load(_Reader(source))
+
+
+class Selector:
+
+    def __init__(self, paths):
+        """
+        :param paths: key paths, each a tuple of object keys (str) and
+            array indexes (int); none may be a prefix of another
+
+        """
+        self.count = len(paths)
+        # Trie of (key, child) pairs, with record indexes at the leaves
+        self._root = []
+        for i, path in enumerate(paths):
+            node = self._root
+            for depth, key in enumerate(path):
+                if isinstance(key, str):
+                    key = key.encode()
+                leaf = depth == len(path) - 1
+                for k, child in node:
+                    if k == key:
+                        if leaf or isinstance(child, int):
+                            raise ValueError("Overlapping JSON paths {}".format(path))
+                        node = child
+                        break
+                else:
+                    child = i if leaf else []
+                    node.append((key, child))
+                    node = child
+
+    def parse(self, source):
+        """Values at the selected paths, in order, from a JSON document."""
+        record = [None] * self.count
+        r = _Reader(source)
+        key = bytearray()
+        self._walk(r, self._root, record, key)
+        return record
+
+    def parse_many(self, source):
+        """Yield the selected values of each document in a JSON array, or
+        in a run of documents separated by whitespace (e.g. one per line).
+        Each is decoded as it's reached; an error stops the run there."""
+        r = _Reader(source)
+        key = bytearray()
+        c = r.skip_ws()
+        if c == 0x5B:
+            r.next()
+            if r.skip_ws() == 0x5D:
+                return
+            while True:
+                record = [None] * self.count
+                self._walk(r, self._root, record, key)
+                yield record
+                if r.separator(0x5D):
+                    return
+        while c >= 0:
+            record = [None] * self.count
+            self._walk(r, self._root, record, key)
+            yield record
+            c = r.skip_ws()
+
+    def _walk(self, r, node, record, key):
+        if isinstance(node, int):
+            record[node] = _load(r)
+            return
+        c = r.skip_ws()
+        if c == 0x7B:
+            r.next()
+            if r.skip_ws() == 0x7D:
+                r.next()
+                return
+            while True:
+                r.expect(0x22)
+                key[:] = b""
+                _read_string(r, key)
+                r.expect(0x3A)
+                for k, child in node:
+                    if k == key:
+                        self._walk(r, child, record, key)
+                        break
+                else:
+                    _skip(r)
+                if r.separator(0x7D):
+                    return
+        elif c == 0x5B:
+            r.next()
+            if r.skip_ws() == 0x5D:
+                r.next()
+                return
+            index = 0
+            while True:
+                for k, child in node:
+                    if k == index:
+                        self._walk(r, child, record, key)
+                        break
+                else:
+                    _skip(r)
+                index += 1
+                if r.separator(0x5D):
+                    return
+        else:
+            _skip(r)
@@ -0,0 +1,171 @@
+"""
+Text layout from glyph metrics.
+
+FontMetrics caches each font's glyph widths as they are looked up, so
+measuring text doesn't go back to the font. fit() word-wraps a message to
+the panel in the first of a list of fonts that it fits, leaving room for a
+picture on the left if it can, and returns a Layout: the lines, their
+widths and the font. Layout.render() draws it, right-aligned, into a Bitmap
+once, so showing the message again is just a TileGrid swap.
+"""
+
+import displayio
+
+_MISSING = 0xFF
+
+
+class FontMetrics:
+
+    def __init__(self, font, line_spacing=1.0):
+        """
+        :param font: a terminalio or adafruit_bitmap_font font
+        :param line_spacing: line pitch as a fraction of the font height
+
+        """
+        self.font = font
+        box = font.get_bounding_box()
+        self.height = box[1]
+        # BDF fonts give the descent; the built-in font is all above the baseline
+        self.baseline = self.height + box[3] if len(box) > 3 else self.height
+        self.pitch = int(self.height * line_spacing + 0.5)
+        self._ascii = bytearray(b"\xfe" * 95)   # 0xFE: not looked up yet
+        self._other = {}
+        space = self.char_width(" ")
+        # Some of our fonts have no space; wrapping still needs a gap
+        self.space = box[0] // 2 if space is None else space
+
+    def char_width(self, c):
+        """Advance of ``c``, or None if the font doesn't have it."""
+        cp = ord(c)
+        if 0x20 <= cp < 0x7F:
+            w = self._ascii[cp - 0x20]
+            if w == 0xFE:
+                glyph = self.font.get_glyph(cp)
+                w = glyph.shift_x if glyph else _MISSING
+                self._ascii[cp - 0x20] = w
+        else:
+            w = self._other.get(cp)
+            if w is None:
+                glyph = self.font.get_glyph(cp)
+                w = glyph.shift_x if glyph else _MISSING
+                self._other[cp] = w
+        return None if w == _MISSING else w
+
+    def has(self, text):
+        for c in text:
+            if c not in " \n" and self.char_width(c) is None:
+                return False
+        return True
+
+    def width(self, text):
+        w = 0
+        for c in text:
+            cw = self.char_width(c)
+            if cw is not None:
+                w += cw
+            elif c == " ":
+                w += self.space
+        return w
+
+
+def wrap(metrics, text, max_width):
+    """Greedy word wrap. Returns (lines, widths); words wider than
+    ``max_width`` are broken where they reach it."""
+    lines = []
+    widths = []
+    for paragraph in text.split("\n"):
+        line = ""
+        line_w = 0
+        for word in paragraph.split(" "):
+            if not word:
+                continue
+            word_w = metrics.width(word)
+            if line and line_w + metrics.space + word_w <= max_width:
+                line += " " + word
+                line_w += metrics.space + word_w
+                continue
+            if line:
+                lines.append(line)
+                widths.append(line_w)
+            while word_w > max_width:
+                cut = 1
+                cut_w = metrics.width(word[0])
+                while cut < len(word) and cut_w + metrics.width(word[cut]) <= max_width:
+                    cut_w += metrics.width(word[cut])
+                    cut += 1
+                lines.append(word[:cut])
+                widths.append(cut_w)
+                word = word[cut:]
+                word_w -= cut_w
+            line = word
+            line_w = word_w
+        lines.append(line)
+        widths.append(line_w)
+    return lines, widths
+
+
+class Layout:
+
+    def __init__(self, metrics, lines, widths):
+        self.metrics = metrics
+        self.lines = lines
+        self.widths = widths
+        self.width = max(widths) if widths else 0
+        self.height = (len(lines) - 1) * metrics.pitch + metrics.height if lines else 0
+
+    def render(self, color):
+        """A TileGrid of the lines, right-aligned, in ``color`` on transparent."""
+        bitmap = displayio.Bitmap(max(1, self.width), max(1, self.height), 2)
+        pitch = self.metrics.pitch
+        for i in range(len(self.lines)):
+            draw(bitmap, self.metrics, self.lines[i], self.width - self.widths[i], i * pitch)
+        palette = displayio.Palette(2)
+        palette.make_transparent(0)
+        palette[1] = color
+        return displayio.TileGrid(bitmap, pixel_shader=palette)
+
+
+def fit(text, fonts, width=64, height=32, reserve=0):
+    """Lay ``text`` out in the first of ``fonts`` (FontMetrics) it fits.
+    Keeps ``reserve`` pixels clear on the left if it can; None if the text
+    doesn't fit at all."""
+    for avail in ((width - reserve, width) if reserve else (width,)):
+        for metrics in fonts:
+            if not metrics.has(text):
+                continue
+            lines, widths = wrap(metrics, text, avail)
+            layout = Layout(metrics, lines, widths)
+            if layout.height <= height:
+                return layout
+    return None
+
+
+def draw(bitmap, metrics, text, x, top):
+    """Draw ``text`` into a 1-bit ``bitmap`` from ``x``, its line's top at
+    ``top``. Returns the x after the text."""
+    font = metrics.font
+    baseline = top + metrics.baseline
+    width = bitmap.width
+    height = bitmap.height
+    for c in text:
+        glyph = font.get_glyph(ord(c))
+        if not glyph:
+            if c == " ":
+                x += metrics.space
+            continue
+        src = glyph.bitmap
+        left = x + glyph.dx
+        glyph_top = baseline - glyph.dy - glyph.height
+        tile_x = glyph.tile_index * glyph.width
+        for gy in range(glyph.height):
+            y = glyph_top + gy
+            if y < 0 or y >= height:
+                continue
+            for gx in range(glyph.width):
+                px = left + gx
+                if 0 <= px < width and src[tile_x + gx, gy]:
+                    bitmap[px, y] = 1
+        x += glyph.shift_x
+        if x >= width:
+            break
+    return x
@@ -0,0 +1,63 @@
+"""
+Scrolling text for messages too long for the panel.
+
+render() rasterises a line of text once, when the message arrives, into a
+1-bit Bitmap. Marquee then scrolls it by moving its TileGrid, so a frame
+costs one x assignment: no relayout and no new strings. The position is
+worked out from the clock rather than stepped each frame, so frames lost
+while MQTT is busy make the text skip ahead instead of slowing it down.
+"""
+
+import displayio
+
+from layout import draw
+
+
+def render(metrics, text, color, *, max_width=1024):
+    """A TileGrid of ``text`` on one line, in ``color`` on transparent."""
+    width = min(max(1, metrics.width(text)), max_width)
+    bitmap = displayio.Bitmap(width, metrics.height, 2)
+    draw(bitmap, metrics, text, 0, 0)
+    palette = displayio.Palette(2)
+    palette.make_transparent(0)
+    palette[1] = color
+    return displayio.TileGrid(bitmap, pixel_shader=palette)
+
+
+class Marquee:
+
+    def __init__(self, width=64, speed=24):
+        """
+        :param width: of the panel, in pixels
+        :param speed: in pixels a second
+
+        """
+        self.width = width
+        self.speed = speed
+        self.tile_grid = None
+        self._start = 0
+        self._span = width
+
+    def start(self, tile_grid, now):
+        self.tile_grid = tile_grid
+        self._start = now
+        self._span = self.width + tile_grid.bitmap.width
+        tile_grid.x = self.width
+
+    def stop(self):
+        self.tile_grid = None
+
+    # Seconds to scroll all the way across once
+    def duration(self):
+        return self._span / self.speed
+
+    # True if the text moved
+    def step(self, now):
+        if self.tile_grid is None:
+            return False
+        # Going round again if the message is still up after one pass
+        x = self.width - int((now - self._start) * self.speed) % self._span
+        if x == self.tile_grid.x:
+            return False
+        self.tile_grid.x = x
+        return True
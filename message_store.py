@@ -0,0 +1,498 @@
+"""
+Bounded message storage that survives a power cycle.
+
+MessageStore holds at most ``capacity`` messages. Each is a small Message
+record with just what the sign shows, linked into a list in arrival order
+and indexed by id, so lookups, updates and deletes by id don't search.
+
+When the store is full a new message replaces, in order of preference, an
+expired message, then the oldest of the lowest priority; a message of
+lower priority than everything stored is turned away. Republishing a
+message that is already stored (same id, or same content if it has no id)
+is a no-op, so QoS 1 redeliveries don't pile up.
+
+Messages are shown in rounds: each round shows every message once,
+highest priority first and in arrival order within a priority, so a new
+important message goes straight to the front of the queue. next() takes
+the front of a heap keyed that way in O(log n). Expiry is kept on a second
+heap, so checking for expired messages doesn't scan the list either, and
+entries left behind by updated or deleted messages are dropped when they
+reach the top.
+
+Every change is appended to a log on flash as one line, ``+`` and a JSON
+record for a message, ``-`` and a JSON id for a deletion; changes made
+between begin() and commit() go out in one write. The log is read back at
+startup and rewritten with just the live messages once it has grown to
+``compact_after`` lines. A message's expiry is written as a wall-clock
+time when ``clock`` tells the time, so time spent powered off counts
+towards it. Messages read back before the clock is known (the sign only
+gets the time from the network) keep that time and start counting down
+to it at sync(). Without a clock, the time left is written instead, and
+starts over at the next boot. As with the error log, writing only works
+when boot.py has remounted the filesystem writable; otherwise the store is
+RAM only.
+
+put() turns away a message whose fields are the wrong type, as the sign
+would fail on it when showing it, and again on every boot once it's in the
+log.
+"""
+
+import json
+import os
+import time
+
+from json_stream import Selector
+
+ADDED = 0
+UPDATED = 1
+DUPLICATE = 2
+REJECTED = 3
+RESULTS = ("added", "updated", "duplicate", "rejected")
+
+# Record fields, in the order Selector returns them and put() takes them
+FIELDS = (("id",), ("text",), ("picture",), ("emoji",), ("priority",), ("ttl",), ("duration",))
+# Log records also have the wall-clock expiry, if it was known
+LOG_FIELDS = FIELDS + (("expires",),)
+
+
+def _is(value, types):
+    """Whether ``value`` is None or of ``types``; bools don't count as numbers."""
+    return value is None or (isinstance(value, types) and not isinstance(value, bool))
+
+
+# Binary heap of tuples; heapq isn't on the board
+def _push(heap, item):
+    heap.append(item)
+    i = len(heap) - 1
+    while i:
+        parent = (i - 1) >> 1
+        if heap[parent] <= item:
+            break
+        heap[i] = heap[parent]
+        i = parent
+    heap[i] = item
+
+
+def _pop(heap):
+    last = heap.pop()
+    if not heap:
+        return last
+    top = heap[0]
+    n = len(heap)
+    i = 0
+    while True:
+        child = 2*i + 1
+        if child >= n:
+            break
+        if child + 1 < n and heap[child + 1] < heap[child]:
+            child += 1
+        if last <= heap[child]:
+            break
+        heap[i] = heap[child]
+        i = child
+    heap[i] = last
+    return top
+
+
+class Message:
+
+    __slots__ = ("id", "text", "picture", "emoji", "priority", "expires", "duration",
+                 "seq", "prev", "next")
+
+    def __init__(self, id, text, picture, emoji, priority, expires, duration):
+        self.id = id
+        self.text = text
+        self.picture = picture
+        self.emoji = emoji
+        self.priority = priority
+        self.expires = expires      # time.monotonic() deadline, or None
+        self.duration = duration    # seconds on screen, or None for the default
+        self.seq = 0                # of its live entry in the show queue
+        self.prev = None
+        self.next = None
+
+    def same(self, text, picture, emoji, priority, duration):
+        return (self.text == text and self.picture == picture and self.emoji == emoji
+                and self.priority == priority and self.duration == duration)
+
+    def ttl(self, now):
+        return None if self.expires is None else max(0, self.expires - now)
+
+    def __str__(self):
+        return "{}: {!r}".format(self.id, self.text)
+
+
+class MessageStore:
+
+    def __init__(self, capacity=16, *, path=None, max_text=50, compact_after=None, clock=None):
+        """
+        :param capacity: most messages kept
+        :param path: log file on flash, if any
+        :param max_text: longest text kept
+        :param compact_after: log lines before it is rewritten; 4 x capacity
+            by default
+        :param clock: function returning the wall-clock time in seconds, or
+            None while it isn't known
+
+        """
+        self.capacity = capacity
+        self.path = path
+        self.max_text = max_text
+        self.compact_after = compact_after or 4 * capacity
+        self.selector = Selector(FIELDS)
+        self.clock = clock
+        self._expiries = {}     # wall-clock expiry by id, of messages loaded before sync()
+        self._by_id = {}
+        self._first = None
+        self._last = None
+        self._next_id = 0
+        self._queue = []        # (round, -priority, seq, message)
+        self._expiring = []     # (expires, seq, message)
+        self._round = 0
+        self._seq = 0
+        self._log_lines = 0
+        self._loading = False
+        self._updating = False
+        self._batch = None      # log lines held back by begin()
+        self._writable = path is not None
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        m = self._first
+        while m is not None:
+            yield m
+            m = m.next
+
+    def get(self, id):
+        return self._by_id.get(id)
+
+    def first(self):
+        return self._first
+
+    def next(self, now=None):
+        """The message to show next, or None once every message has had its
+        turn this round; the call after that starts the next round."""
+        if now is None:
+            now = time.monotonic()
+        self.expire(now)
+        top = self._top()
+        if top is None:
+            return None
+        rnd, p, seq, m = top
+        if rnd > self._round:
+            self._round = rnd
+            return None
+        _pop(self._queue)
+        self._enqueue(m, rnd + 1)
+        return m
+
+    def peek(self):
+        """The message next() will return next, or None."""
+        top = self._top()
+        return None if top is None else top[3]
+
+    # Live front of the show queue, dropping entries of changed or deleted messages
+    def _top(self):
+        queue = self._queue
+        while queue:
+            m = queue[0][3]
+            if self._by_id.get(m.id) is m and m.seq == queue[0][2]:
+                return queue[0]
+            _pop(queue)
+        return None
+
+    def _enqueue(self, m, rnd):
+        self._seq += 1
+        m.seq = self._seq
+        _push(self._queue, (rnd, -m.priority, self._seq, m))
+        if len(self._queue) > 2 * self.capacity:
+            self._requeue()
+
+    # Rebuild the heaps without their dead entries
+    def _requeue(self):
+        live = [e for e in self._queue if self._by_id.get(e[3].id) is e[3] and e[3].seq == e[2]]
+        self._queue = []
+        for e in live:
+            _push(self._queue, e)
+        live = [e for e in self._expiring if self._by_id.get(e[2].id) is e[2] and e[2].expires == e[0]]
+        self._expiring = []
+        for e in live:
+            _push(self._expiring, e)
+
+    def put(self, id, text, picture=None, emoji=None, priority=0, ttl=None, duration=None,
+            now=None):
+        """Add a message, or replace the one with the same id. Returns
+        ADDED, UPDATED, DUPLICATE or REJECTED."""
+        if now is None:
+            now = time.monotonic()
+        if not (_is(id, (str, int)) and _is(text, str) and _is(picture, str)
+                and _is(emoji, str) and _is(ttl, (int, float))
+                and _is(priority, (int, float)) and _is(duration, (int, float))):
+            print("Message fields of the wrong type")
+            return REJECTED
+        if text and len(text) > self.max_text:
+            text = text[:self.max_text]
+        priority = priority or 0
+        if id is None:
+            for m in self:
+                if m.same(text, picture, emoji, priority, duration):
+                    return DUPLICATE
+            id = self._new_id()
+        else:
+            id = str(id)
+        expires = None if ttl is None else now + ttl
+        m = self._by_id.get(id)
+        if m is not None:
+            if m.same(text, picture, emoji, priority, duration):
+                return DUPLICATE
+            if not self._loading and not self._updating:
+                # Replaced, ttl and all
+                self._expiries.pop(id, None)
+            m.text = text
+            m.picture = picture
+            m.emoji = emoji
+            m.duration = duration
+            m.expires = expires
+            if priority != m.priority:
+                m.priority = priority
+                self._enqueue(m, self._round)
+            self._expire_at(m)
+            self._log_put(m, now)
+            return UPDATED
+        if len(self._by_id) >= self.capacity:
+            victim = self._victim(now)
+            if victim.priority > priority and (victim.expires is None or victim.expires > now):
+                return REJECTED
+            print("Message store full; dropping {}".format(victim))
+            self.remove(victim.id)
+        m = Message(id, text, picture, emoji, priority, expires, duration)
+        self._by_id[id] = m
+        m.prev = self._last
+        if self._last is None:
+            self._first = m
+        else:
+            self._last.next = m
+        self._last = m
+        self._enqueue(m, self._round)
+        self._expire_at(m)
+        self._log_put(m, now)
+        return ADDED
+
+    def update(self, id, text=None, picture=None, emoji=None, priority=None, ttl=None,
+               duration=None, now=None):
+        """Change the given fields of a stored message. Returns UPDATED,
+        DUPLICATE if nothing changed, or REJECTED if there is no such id."""
+        m = self._by_id.get(str(id))
+        if m is None:
+            return REJECTED
+        if now is None:
+            now = time.monotonic()
+        if ttl is not None:
+            self._expiries.pop(m.id, None)
+        # An expiry still waiting for sync() stays
+        self._updating = True
+        try:
+            return self.put(m.id,
+                            m.text if text is None else text,
+                            m.picture if picture is None else picture,
+                            m.emoji if emoji is None else emoji,
+                            m.priority if priority is None else priority,
+                            m.ttl(now) if ttl is None else ttl,
+                            m.duration if duration is None else duration, now)
+        finally:
+            self._updating = False
+
+    def remove(self, id):
+        """Delete a message by id. Returns False if there was none."""
+        m = self._by_id.pop(str(id), None)
+        if m is None:
+            return False
+        if m.prev is None:
+            self._first = m.next
+        else:
+            m.prev.next = m.next
+        if m.next is None:
+            self._last = m.prev
+        else:
+            m.next.prev = m.prev
+        m.prev = m.next = None
+        self._expiries.pop(m.id, None)
+        self._log("-" + json.dumps(m.id))
+        return True
+
+    def clear(self):
+        self._by_id.clear()
+        self._expiries = {}
+        self._first = self._last = None
+        self._queue = []
+        self._expiring = []
+        self.compact()
+
+    def expire(self, now=None):
+        """Delete expired messages. Returns how many there were."""
+        if now is None:
+            now = time.monotonic()
+        expired = 0
+        heap = self._expiring
+        while heap and heap[0][0] <= now:
+            expires, seq, m = _pop(heap)
+            if self._by_id.get(m.id) is m and m.expires == expires:
+                print("Message {} expired".format(m))
+                self.remove(m.id)
+                expired += 1
+        return expired
+
+    def _expire_at(self, m):
+        if m.expires is not None:
+            self._seq += 1
+            _push(self._expiring, (m.expires, self._seq, m))
+            # Every ttl change leaves a dead entry behind
+            if len(self._expiring) > 2 * self.capacity:
+                self._requeue()
+
+    def _new_id(self):
+        while str(self._next_id) in self._by_id:
+            self._next_id += 1
+        self._next_id += 1
+        return str(self._next_id - 1)
+
+    # Expired first, else the oldest of the lowest priority
+    def _victim(self, now):
+        victim = None
+        for m in self:
+            if m.expires is not None and m.expires <= now:
+                return m
+            if victim is None or m.priority < victim.priority:
+                victim = m
+        return victim
+
+    def _record(self, m, now):
+        ttl = m.ttl(now)
+        expires = self._expiries.get(m.id)
+        wall = self.clock() if self.clock else None
+        if ttl is not None and wall is not None:
+            expires = wall + round(ttl)
+        if expires is not None:
+            ttl = None
+        return json.dumps({"id": m.id, "text": m.text, "picture": m.picture, "emoji": m.emoji,
+                           "priority": m.priority, "ttl": ttl, "duration": m.duration,
+                           "expires": expires})
+
+    def _log_put(self, m, now):
+        self._log("+" + self._record(m, now))
+
+    def begin(self):
+        """Hold back log writes until commit(), to write a batch of changes
+        to flash in one go."""
+        if self._batch is None:
+            self._batch = []
+
+    def commit(self):
+        lines = self._batch
+        self._batch = None
+        if lines:
+            self._write_log(lines)
+
+    def _log(self, line):
+        if not self._writable or self._loading:
+            return
+        if self._batch is not None:
+            self._batch.append(line)
+        else:
+            self._write_log((line,))
+
+    def _write_log(self, lines):
+        try:
+            with open(self.path, "a") as f:
+                for line in lines:
+                    f.write(line)
+                    f.write("\n")
+        except OSError as e:
+            print("Not saving messages: {}".format(e))
+            self._writable = False
+            return
+        self._log_lines += len(lines)
+        if self._log_lines >= self.compact_after:
+            self.compact()
+
+    def load(self):
+        """Replay the log into the store."""
+        self._loading = True
+        lines = 0
+        selector = Selector(LOG_FIELDS)
+        wall = self.clock() if self.clock else None
+        try:
+            try:
+                f = open(self.path, "r")
+            except OSError:
+                # Reset mid-compaction, after the old log was removed
+                f = open(self.path + ".tmp", "r")
+            with f:
+                for line in f:
+                    lines += 1
+                    try:
+                        if line[0] == "+":
+                            record = selector.parse(line[1:])
+                            expires = record.pop()
+                            if expires is not None and wall is not None:
+                                record[5] = max(0, expires - wall)
+                            if self.put(*record) != REJECTED and expires is not None \
+                                    and wall is None:
+                                # Counted down from sync()
+                                self._expiries[str(record[0])] = expires
+                        elif line[0] == "-":
+                            self.remove(json.loads(line[1:]))
+                    except (ValueError, IndexError, KeyError, TypeError) as e:
+                        # Most likely a line cut short by a reset
+                        print("Bad line in {}: {}".format(self.path, e))
+        except OSError as e:
+            print("No saved messages: {}".format(e))
+        finally:
+            self._loading = False
+        self._log_lines = lines
+        print("Loaded {} messages".format(len(self)))
+        if lines > len(self):
+            self.compact()
+
+    def sync(self, now=None):
+        """Now that the clock tells the time, start counting down to the
+        expiries of the messages loaded before it did."""
+        wall = self.clock() if self.clock else None
+        if wall is None or not self._expiries:
+            return
+        if now is None:
+            now = time.monotonic()
+        for id, expires in self._expiries.items():
+            m = self._by_id.get(id)
+            if m is not None and m.expires is None:
+                m.expires = now + max(0, expires - wall)
+                self._expire_at(m)
+        self._expiries = {}
+        self.compact()
+
+    def compact(self):
+        """Rewrite the log with only the live messages."""
+        if not self._writable:
+            return
+        now = time.monotonic()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                for m in self:
+                    f.write("+")
+                    f.write(self._record(m, now))
+                    f.write("\n")
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            os.rename(tmp, self.path)
+        except OSError as e:
+            print("Not saving messages: {}".format(e))
+            self._writable = False
+            return
+        self._log_lines = len(self)
@@ -0,0 +1,145 @@
+"""
+Which display mode is on screen, and the rules for moving between them.
+
+States are the mode objects themselves. command() handles display/mode
+messages; tick() updates the current mode and, when it reports that it is
+done, moves on: a persistent message loop starts over, any other mode hands
+over to the messages if there are some, and otherwise weather comes back.
+An urgent (high priority) message interrupts weather or air mode straight
+away, and the interrupted mode comes back once the messages are done.
+
+Modes are built the first time they're needed rather than at startup: the
+machine is given a function that makes each one, so AirMode's fonts and
+bitmaps aren't loaded until someone goes on air, and the message store is
+read back when weather first hands over or the first message arrives.
+
+What's shown goes through a Screen, which is refreshed after every tick if
+the tick, or anything since the last one, changed what's on it.
+"""
+
+import gc
+import time
+
+
+class ModeMachine:
+
+    def __init__(self, screen, *, air_mode, weather_mode, message_mode, air_submodes=(),
+                 profile=None, telemetry=None):
+        """
+        :param screen: the Screen to show modes on
+        :param air_mode: function returning the AirMode, called on first use
+        :param air_submodes: the commands that go to the AirMode
+        :param weather_mode: likewise for the WeatherMode
+        :param message_mode: likewise for the MessageMode
+        :param profile: BootProfile to record building each mode in, if any
+        :param telemetry: Telemetry to time each mode's update() and the
+            garbage collections in, if any
+
+        """
+        self.screen = screen
+        self.profile = profile
+        self.telemetry = telemetry
+        self._makers = {"air": air_mode, "weather": weather_mode, "messages": message_mode}
+        self.air_submodes = air_submodes
+        self._modes = {}
+        self.current = None
+        self.resume = None  # mode interrupted by an urgent message
+
+    def _mode(self, name):
+        mode = self._modes.get(name)
+        if mode is None:
+            if self.profile:
+                self.profile.mark()
+            mode = self._makers[name]()
+            self._modes[name] = mode
+            if self.profile:
+                self.profile.phase("build {}".format(type(mode).__name__))
+        return mode
+
+    air_mode = property(lambda self: self._mode("air"))
+    weather_mode = property(lambda self: self._mode("weather"))
+    message_mode = property(lambda self: self._mode("messages"))
+
+    def built(self, name):
+        return name in self._modes
+
+    def start(self):
+        self.show(self.weather_mode)
+
+    def show(self, mode):
+        self.current = mode
+        self.screen.show(mode)
+
+    # Handle mqtt message to set display mode: On/Off Air, Messages, Weather
+    def command(self, message):
+        self.resume = None
+        # Checked against the submode names, so other commands don't build air mode
+        if message == "Messages" and self.message_mode:
+            self.message_mode.display_timestamp = 0
+            self.message_mode.current_message = None
+            self.message_mode.persist = True
+            self.show(self.message_mode)
+        elif message == "Weather":
+            self.weather_mode.display_timestamp = time.monotonic()
+            if self.built("messages"):
+                self.message_mode.persist = False
+            self.show(self.weather_mode)
+        elif message in self.air_submodes:
+            self.air_mode.set_submode(message)
+            self.show(self.air_mode)
+        else:
+            self.screen.show(self.current)
+
+    def tick(self):
+        self._tick()
+        self.screen.refresh()
+
+    def _tick(self):
+        current = self.current
+        # Nothing can be urgent before the first message has built the mode
+        message_mode = self._modes.get("messages")
+        if message_mode is not None and message_mode.urgent:
+            message_mode.urgent = False
+            if current != message_mode:
+                print("Urgent message; interrupting {}".format(type(current).__name__))
+                self.resume = current
+                message_mode.display_timestamp = 0
+                message_mode.current_message = None
+                self.show(message_mode)
+                return
+        if not current:
+            return
+        if self.telemetry is None:
+            running = current.update()
+        else:
+            start = time.monotonic()
+            running = current.update()
+            self.telemetry.histogram(type(current).__name__).add(time.monotonic() - start)
+        if running:
+            return
+        # Current mode returns False if it's "done"
+        message_mode = self.message_mode
+        if current == message_mode and self.resume is not None:
+            # Back to whatever the urgent message interrupted
+            self.current = self.resume
+            self.resume = None
+            if self.current == self.weather_mode:
+                self.weather_mode.display_timestamp = time.monotonic()
+            self.current.update()
+        elif current == message_mode and message_mode.persist:
+            message_mode.display_timestamp = 0
+            message_mode.current_message = None
+        elif current != message_mode and message_mode:
+            # Switch to messages
+            self.current = message_mode
+            message_mode.update()
+        else:
+            # Switch to weather
+            self.weather_mode.display_timestamp = time.monotonic()
+            self.current = self.weather_mode
+            self.current.update()
+        self.screen.show(self.current)
+        if self.telemetry is None:
+            gc.collect()
+        else:
+            self.telemetry.collect()
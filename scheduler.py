@@ -0,0 +1,142 @@
+"""
+Cooperative scheduler for the main loop.
+
+Each task is a plain function run every ``period`` seconds; a task that falls
+behind skips the ticks it missed rather than running back to back. Between
+ticks the scheduler hands the time until the next one to an idle task (the
+MQTT client's loop), so network I/O soaks up slack instead of delaying
+rendering. Every task keeps its own run count, busy time, worst run time and
+worst lateness so rendering jitter and MQTT latency can be read separately.
+Give a task a telemetry Histogram, or the scheduler one for whole passes,
+and its run times are also counted into that.
+
+A task that raises is still due again a period later, and the tasks after
+it in the pass still run; the exception is raised once the pass is over,
+so one failing task can't starve the rest.
+"""
+
+import time
+
+
+class Task:
+
+    def __init__(self, name, func, period=0):
+        self.name = name
+        self.func = func
+        self.period = period
+        self.due = 0
+        self.runs = 0
+        self.busy = 0.0
+        self.max_time = 0.0
+        self.max_late = 0.0
+        self.histogram = None
+
+    def _late(self, now):
+        # due is 0 until the first run, which can't be late
+        late = now - self.due
+        if self.due and late > self.max_late:
+            self.max_late = late
+
+    def _run(self, now, *args):
+        self.func(*args)
+        done = time.monotonic()
+        elapsed = done - now
+        self.runs += 1
+        self.busy += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if self.histogram is not None:
+            self.histogram.add(elapsed)
+        return done
+
+    def reset_stats(self):
+        self.runs = 0
+        self.busy = 0.0
+        self.max_time = 0.0
+        self.max_late = 0.0
+
+    def __str__(self):
+        return "{}: {} runs, {:.1f} ms avg, {:.1f} ms max, {:.1f} ms max late".format(
+            self.name, self.runs, 1000 * self.busy / self.runs if self.runs else 0,
+            1000 * self.max_time, 1000 * self.max_late)
+
+
+class Scheduler:
+
+    def __init__(self, min_idle=0.01, max_idle=0.1):
+        """
+        :param min_idle: shortest timeout handed to the idle task
+        :param max_idle: longest timeout handed to the idle task
+
+        """
+        self.tasks = []
+        self.idle = None
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.histogram = None   # of passes that ran a task, idle time aside
+
+    def add(self, name, func, period=0):
+        task = Task(name, func, period)
+        self.tasks.append(task)
+        return task
+
+    def remove(self, name):
+        # A new list, so a task can remove itself while run_once() loops
+        self.tasks = [task for task in self.tasks if task.name != name]
+
+    def set_idle(self, name, func):
+        """Run ``func(timeout)`` between ticks, with the time to the next one."""
+        self.idle = Task(name, func)
+        return self.idle
+
+    def get(self, name):
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        if self.idle and self.idle.name == name:
+            return self.idle
+        return None
+
+    def run_once(self):
+        start = now = time.monotonic()
+        ran = False
+        error = None
+        for task in self.tasks:
+            if now >= task.due:
+                ran = True
+                task._late(now)
+                due = task.due + task.period
+                # Set before running, so a task that raises still waits its turn
+                task.due = due
+                try:
+                    now = task._run(now)
+                except Exception as e:
+                    now = time.monotonic()
+                    if error is None:
+                        error = e
+                if due <= now:
+                    # Fell behind; skip the missed ticks
+                    task.due = now + task.period
+        if ran and self.histogram is not None:
+            self.histogram.add(now - start)
+        if error is not None:
+            raise error
+        if self.idle:
+            timeout = self.max_idle
+            for task in self.tasks:
+                if task.due - now < timeout:
+                    timeout = task.due - now
+            if timeout < self.min_idle:
+                timeout = self.min_idle
+            self.idle.due = now
+            self.idle._run(now, timeout)
+
+    def run(self):
+        while True:
+            self.run_once()
+
+    def report(self):
+        for task in self.tasks:
+            print(task)
+        if self.idle:
+            print(self.idle)
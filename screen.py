@@ -0,0 +1,88 @@
+"""
+Refreshing the panel by hand, and only when something on it changed.
+
+With auto-refresh on, CircuitPython redraws whenever anything on the shown
+group has been touched, and a Label relays out its whole text on every
+assignment, even of the text it already has. Screen turns auto-refresh off.
+The modes make their changes through it: text, colors and visibility are
+compared first, so writes that change nothing cost a comparison, and
+anything else (groups swapped, bitmaps drawn, TileGrids moved) is reported
+with changed(). ModeMachine calls refresh() after each tick, which redraws
+only if something changed, at most ``fps`` times a second.
+"""
+
+import time
+
+# Asking for a frame rate this high makes refresh() all but immediate
+_NOW = 1000
+
+
+class Screen:
+
+    def __init__(self, display=None, fps=30):
+        """
+        :param display: the FramebufferDisplay; None to only track changes
+        :param fps: most refreshes a second
+
+        """
+        self.display = display
+        self.fps = fps
+        self.root = None
+        self.dirty = False
+        self.refreshes = 0
+        self.skipped = 0            # writes that would have changed nothing
+        self._last_refresh = 0
+        if display is not None:
+            display.auto_refresh = False
+
+    def show(self, group):
+        if group is not self.root:
+            self.root = group
+            if self.display is not None:
+                self.display.show(group)
+            self.dirty = True
+
+    def changed(self):
+        """Something on screen changed other than through this."""
+        self.dirty = True
+
+    def text(self, label, text):
+        if label.text == text:
+            self.skipped += 1
+            return False
+        label.text = text
+        self.dirty = True
+        return True
+
+    def color(self, widget, color):
+        if widget.color == color:
+            self.skipped += 1
+            return False
+        widget.color = color
+        self.dirty = True
+        return True
+
+    def hidden(self, node, hidden):
+        if node.hidden == hidden:
+            return False
+        node.hidden = hidden
+        self.dirty = True
+        return True
+
+    def refresh(self, now=None):
+        """Redraw if anything changed and a frame is due; True if it did."""
+        if not self.dirty or self.display is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if now - self._last_refresh < 1 / self.fps:
+            return False
+        # The minimum frame rate would raise after a second with nothing to
+        # show, and a call more than a frame after the last one is skipped
+        # "to catch up"; the second call then goes straight through
+        if not self.display.refresh(target_frames_per_second=_NOW, minimum_frames_per_second=0):
+            self.display.refresh(target_frames_per_second=_NOW, minimum_frames_per_second=0)
+        self.dirty = False
+        self.refreshes += 1
+        self._last_refresh = now
+        return True
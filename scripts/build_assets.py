@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# Builds the emoji atlas from PNG sources, redoing only what changed. Run it
+# on the host:
+#
+#   python3 scripts/build_assets.py ~/emoji/png
+#   python3 scripts/build_assets.py ~/emoji/png --include flags --exclude skin
+#   python3 scripts/build_assets.py                # just repack assets/emojis
+#
+# Each PNG, named after its hyphen-joined codepoints, is converted with
+# ImageMagick into a 16-color BMP in assets/emojis, the way
+# convert_to_matrixportal.sh did, and the BMPs are packed into
+# bmps/emojis.bin by pack_emoji_atlas.py. The BMPs stay out of bmps/, which
+# is copied to CIRCUITPY, so only the atlas takes up flash on the sign.
+# Conversions and tile encoding run in a process pool. A cache
+# (.asset_cache/emojis.json) keeps the content hash of every source and BMP
+# along with its encoded tile, so a run only converts and encodes files
+# whose contents changed, and leaves the atlas alone if nothing in it did.
+#
+# Tiles fall into categories: "gendered" (sequences with a female or male
+# sign after the base emoji, left out by default as before), "skin" (with a
+# skin tone modifier) and "flags" (regional indicator pairs and tag
+# sequences). --include and --exclude pick which go in. The chosen tiles are
+# added in order of priority, plain emojis first, then skin tones, then
+# flags, for as long as the atlas stays within --budget bytes; emoji_atlas
+# falls back towards the base emoji for anything left out. What went in and
+# what didn't is written to bmps/emojis.manifest.json.
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pack_emoji_atlas as atlas
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_VERSION = 1
+CATEGORIES = ("gendered", "skin", "flags")
+# Leaves room for the code, fonts, pictures and logs on a 2 MB CIRCUITPY
+BUDGET = 320 * 1024
+
+# The two ImageMagick passes of convert_to_matrixportal.sh
+RESIZE = ("-adaptive-resize", "21x21", "-gamma", "0.55", "-dither", "None", "-colors", "16")
+FLATTEN = ("-background", "black", "-alpha", "remove", "-alpha", "off",
+           "-colors", "16", "-type", "Palette")
+
+
+def categories(key):
+    """The categories of the emoji with codepoints ``key``."""
+    found = []
+    if any(cp == 0x2640 or cp == 0x2642 for cp in key[1:]):
+        found.append("gendered")
+    if any(0x1F3FB <= cp <= 0x1F3FF for cp in key):
+        found.append("skin")
+    if 0x1F1E6 <= key[0] <= 0x1F1FF or (key[0] == 0x1F3F4 and len(key) > 1
+                                         and 0xE0020 <= key[1] <= 0xE007F):
+        found.append("flags")
+    return found
+
+
+def priority(key):
+    cats = categories(key)
+    return (2 if "flags" in cats else 1 if "skin" in cats else 0, len(key), key)
+
+
+def digest(path, previous):
+    """[size, mtime, sha1] of a file, only rereading it if its size or
+    modification time differ from ``previous``."""
+    st = os.stat(path)
+    if previous and previous[0] == st.st_size and previous[1] == st.st_mtime_ns:
+        return previous
+    with open(path, "rb") as f:
+        return [st.st_size, st.st_mtime_ns, hashlib.sha1(f.read()).hexdigest()]
+
+
+def convert(job):
+    """PNG to palettised BMP; returns an error message or None."""
+    src, dst = job
+    try:
+        first = subprocess.Popen(("magick", src) + RESIZE + ("-",), stdout=subprocess.PIPE)
+        second = subprocess.run(("magick", "-") + FLATTEN + ("BMP:" + dst,),
+                                stdin=first.stdout, capture_output=True)
+        first.stdout.close()
+        first.wait()
+    except FileNotFoundError:
+        return "ImageMagick's magick command isn't on the PATH"
+    if first.returncode or second.returncode:
+        return second.stderr.decode(errors="replace").strip() or "magick failed"
+    return None
+
+
+def encode(path):
+    """The cacheable form of pack_emoji_atlas.encode_tile(), or an error."""
+    try:
+        size, palette, raw, data = atlas.encode_tile(path)
+    except (OSError, ValueError) as e:
+        return str(e)
+    return [size[0], size[1], "".join("{:06x}".format(c) for c in palette), raw, data.hex()]
+
+
+def decode(tile):
+    width, height, palette, raw, data = tile
+    return ((width, height), tuple(int(palette[i:i + 6], 16) for i in range(0, len(palette), 6)),
+            raw, bytes.fromhex(data))
+
+
+def run(func, items, jobs):
+    """``func`` over ``items``, in a pool of ``jobs`` processes if worth it."""
+    if jobs <= 1 or len(items) < 2 * jobs:
+        return [func(item) for item in items]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(func, items, chunksize=max(1, len(items) // (4 * jobs))))
+
+
+def load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data, **kwargs):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(json.dumps(data, **kwargs))
+    os.replace(tmp, path)
+
+
+def select(tiles, budget):
+    """Split ``tiles`` ({name: (key, tile)}) into the names that fit the
+    budget, in order of priority, and the ones that don't."""
+    included, dropped = [], []
+    count = codepoints = data = 0
+    palettes = set()
+    for name in sorted(tiles, key=lambda name: priority(tiles[name][0])):
+        key, (_, palette, _, encoded) = tiles[name]
+        new_palette = palette not in palettes
+        size = atlas.atlas_size(count + 1, codepoints + len(key),
+                                len(palettes) + new_palette, data + len(encoded))
+        if size > budget:
+            dropped.append(name)
+            continue
+        included.append(name)
+        count += 1
+        codepoints += len(key)
+        data += len(encoded)
+        palettes.add(palette)
+    return included, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the emoji atlas from PNG sources")
+    parser.add_argument("source", nargs="?",
+                        help="directory of <codepoints>.png files; without it the BMPs are repacked")
+    parser.add_argument("--bmps", default=os.path.join(REPO, "assets", "emojis"))
+    parser.add_argument("--atlas", default=os.path.join(REPO, "bmps", "emojis.bin"))
+    parser.add_argument("--manifest", default=os.path.join(REPO, "bmps", "emojis.manifest.json"))
+    parser.add_argument("--cache", default=os.path.join(REPO, ".asset_cache", "emojis.json"))
+    parser.add_argument("--budget", type=int, default=BUDGET, help="most bytes for the atlas")
+    parser.add_argument("--include", action="append", choices=CATEGORIES, default=[],
+                        help="category to put in (all but gendered are by default)")
+    parser.add_argument("--exclude", action="append", choices=CATEGORIES, default=[],
+                        help="category to leave out")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="ignore the cache")
+    args = parser.parse_args()
+    start = time.monotonic()
+
+    excluded_cats = set(args.exclude) | ({"gendered"} - set(args.include))
+    settings = {"version": CACHE_VERSION, "convert": [RESIZE, FLATTEN]}
+    cache = load_json(args.cache, {})
+    cached = json.dumps(cache)
+    if args.force or cache.get("settings") != json.loads(json.dumps(settings)):
+        cache = {"settings": settings, "tiles": {}}
+    entries = cache["tiles"]
+
+    ext = ".png" if args.source else ".bmp"
+    names = sorted(name[:-4] for name in os.listdir(args.source or args.bmps)
+                   if name.endswith(ext))
+    chosen, excluded = [], []
+    for name in names:
+        if excluded_cats.intersection(categories(atlas.key_for(name))):
+            excluded.append(name)
+        else:
+            chosen.append(name)
+
+    # PNGs whose contents changed since they were converted, or whose BMP
+    # has gone or been changed since
+    jobs = []
+    if args.source:
+        os.makedirs(args.bmps, exist_ok=True)
+        for name in chosen:
+            entry = entries.setdefault(name, {})
+            src = digest(os.path.join(args.source, name + ".png"), entry.get("src"))
+            bmp_path = os.path.join(args.bmps, name + ".bmp")
+            if (src[2] != (entry.get("src") or [None] * 3)[2] or not os.path.exists(bmp_path)
+                    or digest(bmp_path, entry.get("bmp"))[2] != (entry.get("bmp") or [None] * 3)[2]):
+                entry.pop("bmp", None)
+                jobs.append((os.path.join(args.source, name + ".png"), bmp_path))
+            entry["src"] = src
+    failed = set()
+    for (src, dst), error in zip(jobs, run(convert, jobs, args.jobs)):
+        if error:
+            print("{}: {}".format(src, error), file=sys.stderr)
+            failed.add(os.path.basename(dst)[:-4])
+    converted = len(jobs) - len(failed)
+
+    # BMPs whose contents changed since they were encoded
+    paths, tiles = [], {}
+    for name in chosen:
+        entry = entries.setdefault(name, {})
+        path = os.path.join(args.bmps, name + ".bmp")
+        if name in failed or not os.path.exists(path):
+            continue
+        bmp = digest(path, entry.get("bmp"))
+        if bmp[2] != (entry.get("bmp") or [None] * 3)[2] or "tile" not in entry:
+            entry.pop("tile", None)
+            paths.append((name, path))
+        entry["bmp"] = bmp
+    for (name, path), tile in zip(paths, run(encode, [path for _, path in paths], args.jobs)):
+        if isinstance(tile, str):
+            print(tile, file=sys.stderr)
+            entries[name].pop("bmp")
+            failed.add(name)
+        else:
+            entries[name]["tile"] = tile
+    for name in chosen:
+        tile = entries.get(name, {}).get("tile")
+        if tile:
+            tiles[name] = (atlas.key_for(name), decode(tile))
+
+    if not tiles:
+        print("Nothing to pack", file=sys.stderr)
+        return 1
+    included, dropped = select(tiles, args.budget)
+    fingerprint = hashlib.sha1(" ".join(
+        ["{}".format(args.budget)] + excluded + ["{}:{}".format(name, entries[name]["bmp"][2])
+                                                 for name in sorted(included)]).encode()).hexdigest()
+    manifest = load_json(args.manifest, {})
+    if fingerprint == cache.get("atlas") and os.path.exists(args.atlas) \
+            and manifest.get("size") == os.path.getsize(args.atlas):
+        count, npalettes, size = manifest["tiles"], manifest["palettes"], manifest["size"]
+        written = False
+    else:
+        count, npalettes, size = atlas.write_atlas([tiles[name] for name in included], args.atlas)
+        written = True
+        cache["atlas"] = fingerprint
+        by_category = {"plain": 0, "skin": 0, "flags": 0}
+        for name in included:
+            cats = categories(tiles[name][0])
+            by_category["flags" if "flags" in cats else "skin" if "skin" in cats else "plain"] += 1
+        save_json(args.manifest, {
+            "atlas": os.path.relpath(args.atlas, REPO),
+            "budget": args.budget,
+            "size": size,
+            "tiles": count,
+            "palettes": npalettes,
+            "included": by_category,
+            "dropped": sorted(dropped),
+            "excluded": excluded,
+        }, indent=1)
+    # Forget tiles whose files have gone
+    present = set(names)
+    for name in list(entries):
+        if name not in present:
+            del entries[name]
+    if json.dumps(cache) != cached:
+        save_json(args.cache, cache)
+
+    print("{}: {} tiles, {} palettes, {} of {} bytes{}; {} converted, {} encoded, "
+          "{} dropped for space, {} excluded, {} failed, {:.0f} ms".format(
+              os.path.relpath(args.atlas), count, npalettes, size, args.budget,
+              "" if written else " (unchanged)", converted, len(paths), len(dropped),
+              len(excluded), len(failed), (time.monotonic() - start) * 1000))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Compiles a BDF font into the binary format read by binary_font.py on the
+# MatrixPortal, keeping only the glyphs the sign uses. Run it on the host:
+#
+#   python3 scripts/compile_font.py fonts/BellotaText-Bold-21_DJL.bdf
+#   python3 scripts/compile_font.py fonts/6x10_DJL.bdf \
+#       --chars $'°Ckph%r↑↗→↘↓↙←↖↥↧\u33a9\u00ad 0123456789'
+#
+# The output goes next to the BDF with a .fnt extension unless -o is given.
+# Without --chars every glyph in the font is kept. Parsing BDF text and
+# picking glyphs out of it is the slow part of loading a font on the board;
+# the compiled file is read in one go and needs no parsing.
+# See binary_font.py for the file layout.
+
+import argparse
+import os
+import struct
+import sys
+
+MAGIC = b"FNT1"
+VERSION = 1
+
+
+def read_bdf(path):
+    """Return (bounding box, {codepoint: (width, height, dx, dy, shift_x,
+    shift_y, rows)}) with rows as the glyph's packed bitmap bytes."""
+    box = (0, 0, 0, 0)
+    glyphs = {}
+    codepoint = None
+    shift = (0, 0)
+    bbx = None
+    rows = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if rows is not None:
+                if words[0] == "ENDCHAR":
+                    if codepoint is not None and codepoint >= 0:
+                        glyphs[codepoint] = bbx + shift + (bytes(rows),)
+                    rows = None
+                    continue
+                # Rows are padded to whole bytes, as in the BDF
+                rows.extend(bytes.fromhex(words[0])[:(bbx[0] + 7) // 8])
+            elif words[0] == "FONTBOUNDINGBOX":
+                box = tuple(int(v) for v in words[1:5])
+            elif words[0] == "ENCODING":
+                codepoint = int(words[1])
+            elif words[0] == "DWIDTH":
+                shift = tuple(int(v) for v in words[1:3])
+            elif words[0] == "BBX":
+                bbx = tuple(int(v) for v in words[1:5])
+            elif words[0] == "BITMAP":
+                rows = bytearray()
+    return box, glyphs
+
+
+def compile_font(box, glyphs, chars=None):
+    if chars is not None:
+        wanted = set(ord(c) for c in chars)
+        missing = wanted - set(glyphs)
+        if missing:
+            print("Not in the font: {}".format(" ".join("U+{:04X}".format(cp)
+                                                        for cp in sorted(missing))),
+                  file=sys.stderr)
+        glyphs = {cp: g for cp, g in glyphs.items() if cp in wanted}
+    out = bytearray(struct.pack(">4sBbbbbH", MAGIC, VERSION, *box, len(glyphs)))
+    codepoints = sorted(glyphs)
+    for cp in codepoints:
+        out += struct.pack(">IBBbbbb", cp, *glyphs[cp][:6])
+    for cp in codepoints:
+        out += glyphs[cp][6]
+    return bytes(out), len(codepoints)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a BDF font for binary_font.py")
+    parser.add_argument("bdf")
+    parser.add_argument("-o", "--output", help="default: the BDF path with .fnt")
+    parser.add_argument("--chars", help="characters to keep; default all")
+    args = parser.parse_args()
+
+    box, glyphs = read_bdf(args.bdf)
+    data, count = compile_font(box, glyphs, args.chars)
+    output = args.output or os.path.splitext(args.bdf)[0] + ".fnt"
+    with open(output, "wb") as f:
+        f.write(data)
+    print("{}: {} of {} glyphs, {} bytes (BDF {} bytes)".format(
+        output, count, len(glyphs), len(data), os.path.getsize(args.bdf)))
+
+
+if __name__ == "__main__":
+    main()
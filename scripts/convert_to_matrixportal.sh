@@ -1,18 +1,14 @@
 #!/bin/sh
-# This command omits all national flags, Fitzpatrick Scale, and male/female gender modifiers
-# There isn't enough space to do them all on 2MB flash. 
-# You could easily copy a few on from each if needed, 
-# or you could pick a different "default set" of emojis with a specific Fitzpatrick colour
-# by renaming to the "base" emoji codepoint when you copy them over.
-# When the matrixportal searches for an emoji, it first looks for the full filename (all codepoints)
-# but then backs off to just the part before the first hyphen (first codepoint)
-# which is usually a "default" version of the emoji.
+# Converts the emoji PNGs in the current directory and packs them into
+# bmps/emojis.bin. This is now done by build_assets.py, which converts in
+# parallel, only redoes emojis whose PNGs changed, and leaves out male/female
+# gender modifier sequences as this script did; see it for the options, e.g.
+#
+#   convert_to_matrixportal.sh --exclude flags --budget 250000
+#
+# When the matrixportal searches for an emoji, it looks for the full
+# codepoint sequence, then for the longest prefix of it that ends on a whole
+# emoji component, with or without variation selectors, so a missing skin
+# tone or ZWJ part falls back towards the base emoji.
 
-fileconvert () {
-    magick $1.png -adaptive-resize 21x21 -gamma 0.55 -dither None -colors 16 - | magick - -background black -alpha remove -alpha off -colors 16 -type Palette BMP:bmps/$1.bmp
-}
-
-for FNAME in `ls -1 *.png | egrep -v -e '-1f1|-1f3f[b-f]|-264[02]-' | sed 's/.png//g'`
-do
-    fileconvert $FNAME
-done
+exec python3 "`dirname $0`/build_assets.py" . "$@"
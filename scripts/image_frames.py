@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# Turns a BMP into the frames image_store.ImageStore takes on
+# display/<subtopic>/image, one per line, for mosquitto_pub to send one
+# message a line:
+#
+#   python3 scripts/image_frames.py logo.bmp --id logo \
+#       | mosquitto_pub -h broker -t display/sign/image -q 1 -l
+#   mosquitto_pub -h broker -t display/sign/message -q 1 \
+#       -m '{"text": "Hello", "picture": "logo"}'
+#
+# The result comes back on display/<subtopic>/image/result. True-color
+# BMPs are palettised first, as by palettise_bmp.py, so the image can have
+# at most 256 colors; it can be at most 64x32. Chunks are --chunk bytes
+# before base64, so each frame stays well inside MiniMQTT's buffer.
+
+import argparse
+import base64
+import os
+import struct
+import sys
+import zlib
+
+import palettise_bmp
+
+MAX_ID = 16
+
+
+def image_bytes(path, width=64, height=32):
+    """The palettised BMP to send for ``path``."""
+    image = palettise_bmp.read_bmp(path)
+    if image is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        w, h = struct.unpack_from("<ii", data, 18)
+    else:
+        w, h, _, rows = image
+        data = palettise_bmp.palettise(w, h, rows)[0]
+    if w > width or abs(h) > height:
+        raise ValueError("{} is {}x{}; the panel is {}x{}".format(path, w, abs(h), width, height))
+    return data
+
+
+def frames(id, data, chunk=384):
+    chunks = [data[i:i + chunk] for i in range(0, len(data), chunk)]
+    for i, part in enumerate(chunks):
+        encoded = base64.b64encode(part).decode()
+        if i == 0:
+            yield "{} 0 {} {} {:08x} {}".format(id, len(chunks), len(data),
+                                                 zlib.crc32(data), encoded)
+        else:
+            yield "{} {} {}".format(id, i, encoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames for sending a picture to the sign")
+    parser.add_argument("bmp")
+    parser.add_argument("--id", help="what messages call it; the file's name by default")
+    parser.add_argument("--chunk", type=int, default=384, help="bytes per frame, before base64")
+    parser.add_argument("--max-size", type=int, default=8192,
+                        help="largest file the sign takes (ImageStore's max_size)")
+    args = parser.parse_args()
+    id = args.id or os.path.splitext(os.path.basename(args.bmp))[0]
+    if not 0 < len(id) <= MAX_ID or "/" in id or "." in id:
+        parser.error("the id must be 1 to {} characters, without / or .".format(MAX_ID))
+    try:
+        data = image_bytes(args.bmp)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    if len(data) > args.max_size:
+        print("{} is {} bytes; the sign takes at most {}".format(args.bmp, len(data), args.max_size),
+              file=sys.stderr)
+        return 1
+    count = 0
+    for frame in frames(id, data, args.chunk):
+        print(frame)
+        count += 1
+    print("{}: {} bytes in {} frames".format(id, len(data), count), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
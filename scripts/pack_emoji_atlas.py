@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Packs a directory of palettised emoji BMPs into the single atlas file read
+# by emoji_atlas.py on the MatrixPortal. Run it on the host, e.g.
+#
+#   python3 scripts/pack_emoji_atlas.py assets/emojis bmps/emojis.bin
+#
+# Each BMP is named after its hyphen-joined codepoints, as produced by
+# build_assets.py, which also packs the atlas itself, a tile at a time, from
+# its cache. Identical palettes are stored once and each
+# tile's pixel indices are run-length encoded, or nibble-packed if that is
+# smaller, so the whole set including flags and skin tones fits on flash.
+# See emoji_atlas.py for the file layout.
+
+import argparse
+import os
+import struct
+import sys
+
+MAGIC = b"EMJ1"
+COLORS = 16
+RAW = 0x8000
+
+
+def read_bmp(path):
+    """Return (width, height, palette, pixels) for a 1/4/8-bit BMP, with
+    pixels as a top-down list of palette indices and palette as RGB ints."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] != b"BM":
+        raise ValueError("{}: not a BMP file".format(path))
+    offset, = struct.unpack_from("<I", data, 10)
+    header_size, width, height, _, bits, compression = struct.unpack_from("<IiiHHI", data, 14)
+    used, = struct.unpack_from("<I", data, 46)
+    if bits not in (1, 4, 8) or compression not in (0, 3):
+        raise ValueError("{}: unsupported {}-bit BMP".format(path, bits))
+    used = used or 1 << bits
+    palette = []
+    for i in range(used):
+        b, g, r = struct.unpack_from("<BBB", data, 14 + header_size + 4 * i)
+        palette.append(r << 16 | g << 8 | b)
+    stride = (width * bits + 31) // 32 * 4
+    mask = (1 << bits) - 1
+    pixels = []
+    for y in range(abs(height)):
+        row = offset + stride * (abs(height) - 1 - y if height > 0 else y)
+        for x in range(width):
+            bit = x * bits
+            byte = data[row + bit // 8]
+            pixels.append(byte >> (8 - bits - bit % 8) & mask)
+    return width, abs(height), palette, pixels
+
+
+def rle(pixels):
+    out = bytearray()
+    i = 0
+    while i < len(pixels):
+        run = 1
+        while run < 16 and i + run < len(pixels) and pixels[i + run] == pixels[i]:
+            run += 1
+        out.append((run - 1) << 4 | pixels[i])
+        i += run
+    return bytes(out)
+
+
+def nibbles(pixels):
+    out = bytearray((len(pixels) + 1) // 2)
+    for i, p in enumerate(pixels):
+        out[i // 2] |= p << (4 if i % 2 == 0 else 0)
+    return bytes(out)
+
+
+def key_for(name):
+    return tuple(int(cp, 16) for cp in name.split("-"))
+
+
+def encode_tile(path):
+    """Return ((width, height), palette, raw, data) for one BMP: its palette
+    padded to COLORS, and its pixels run-length encoded, or nibble-packed
+    (raw) if that is smaller."""
+    width, height, palette, pixels = read_bmp(path)
+    if len(palette) > COLORS or max(pixels) >= COLORS:
+        raise ValueError("{}: more than {} colors".format(path, COLORS))
+    palette = tuple(palette + [0] * (COLORS - len(palette)))
+    encoded = rle(pixels)
+    packed = nibbles(pixels)
+    if len(packed) < len(encoded):
+        return (width, height), palette, True, packed
+    return (width, height), palette, False, encoded
+
+
+def atlas_size(count, codepoints, palettes, data):
+    """Bytes in an atlas of ``count`` tiles with ``codepoints`` key
+    codepoints in all, ``palettes`` distinct palettes and ``data`` bytes of
+    encoded tiles."""
+    return 12 + 2 * (count + 1) + 3 * codepoints + 6 * count + 3 * COLORS * palettes + data
+
+
+def write_atlas(tiles, out_path):
+    """Write the atlas for ``tiles``, a list of (codepoints, encode_tile()
+    result). Returns (tiles, palettes, bytes)."""
+    tiles = sorted(tiles)
+    tile_size = None
+    palettes = {}
+    for key, (size, palette, raw, data) in tiles:
+        if tile_size is None:
+            tile_size = size
+        elif size != tile_size:
+            raise ValueError("{}: tile is {}x{}, expected {}x{}".format(
+                "-".join("{:x}".format(cp) for cp in key), *size, *tile_size))
+        palettes.setdefault(palette, len(palettes))
+
+    count = len(tiles)
+    key_table = bytearray()
+    offsets = [0]
+    for key, _ in tiles:
+        for cp in key:
+            key_table += cp.to_bytes(3, "big")
+        offsets.append(len(key_table) // 3)
+    if offsets[-1] > 0xFFFF:
+        raise ValueError("Too many codepoints for the key table")
+
+    header = struct.pack(">4sBBBBHH", MAGIC, 1, tile_size[0], tile_size[1],
+                         COLORS, count, len(palettes))
+    index = struct.pack(">{}H".format(count + 1), *offsets) + key_table
+    data_start = (len(header) + len(index) + 6 * count
+                  + len(palettes) * COLORS * 3)
+    entries = bytearray()
+    data = bytearray()
+    for key, (size, palette, raw, encoded) in tiles:
+        number = palettes[palette]
+        entries += struct.pack(">IH", data_start + len(data), number | RAW if raw else number)
+        data += encoded
+    palette_table = bytearray()
+    for palette in sorted(palettes, key=palettes.get):
+        for color in palette:
+            palette_table += color.to_bytes(3, "big")
+
+    with open(out_path, "wb") as f:
+        f.write(header)
+        f.write(index)
+        f.write(entries)
+        f.write(palette_table)
+        f.write(data)
+    return count, len(palettes), data_start + len(data)
+
+
+def pack(sources, out_path):
+    """Write the atlas for ``sources``, a list of (codepoints, bmp path)."""
+    return write_atlas([(key, encode_tile(path)) for key, path in sources], out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack emoji BMPs into an atlas.")
+    parser.add_argument("source", help="directory of <codepoints>.bmp files")
+    parser.add_argument("atlas", help="atlas file to write")
+    args = parser.parse_args()
+    sources = []
+    for name in os.listdir(args.source):
+        if name.endswith(".bmp"):
+            sources.append((key_for(name[:-4]), os.path.join(args.source, name)))
+    count, npalettes, size = pack(sources, args.atlas)
+    print("{}: {} tiles, {} palettes, {} bytes".format(args.atlas, count, npalettes, size))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Rewrites true-color BMPs as palettised ones that bitmap_cache.load_bmp()
+# can read into RAM, so the sign doesn't convert every pixel from flash on
+# each refresh. Run it on the host:
+#
+#   python3 scripts/palettise_bmp.py bmps/weather/*.bmp bmps/Wings_DD8000_mid.bmp
+#
+# Files are rewritten in place unless -o is given (for a single input). The
+# conversion is lossless: the palette holds exactly the colors the image
+# uses, at 1, 4 or 8 bits a pixel, so an image with more than 256 colors is
+# refused; reduce it first, e.g. with magick's -colors. Files that are
+# palettised already are left alone.
+
+import argparse
+import os
+import struct
+import sys
+
+
+def read_bmp(path):
+    """Return (width, height, bits, rows) with rows top-down as lists of
+    (r, g, b), or None if the file is palettised already."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] != b"BM":
+        raise ValueError("{} is not a BMP file".format(path))
+    offset = struct.unpack_from("<I", data, 10)[0]
+    width, height, _, bits, compression = struct.unpack_from("<iiHHI", data, 18)
+    if bits <= 8:
+        return None
+    if bits not in (24, 32) or compression not in (0, 3):
+        raise ValueError("{}: {}-bit BMPs aren't supported".format(path, bits))
+    step = bits // 8
+    stride = (width * step + 3) // 4 * 4
+    rows = []
+    for y in range(abs(height)):
+        start = offset + y * stride
+        rows.append([(data[i + 2], data[i + 1], data[i])
+                     for i in range(start, start + width * step, step)])
+    # Stored bottom-up unless the height is negative
+    if height > 0:
+        rows.reverse()
+    return width, abs(height), bits, rows
+
+
+def palettise(width, height, rows):
+    """Return the BMP bytes for ``rows`` with a palette of their colors, in
+    order of first appearance."""
+    colors = {}
+    for row in rows:
+        for color in row:
+            if color not in colors:
+                colors[color] = len(colors)
+    if len(colors) > 256:
+        raise ValueError("{} colors; at most 256 fit a palette".format(len(colors)))
+    bits = 1 if len(colors) <= 2 else 4 if len(colors) <= 16 else 8
+    per_byte = 8 // bits
+    stride = (width * bits + 31) // 32 * 4
+
+    pixels = bytearray()
+    for row in reversed(rows):
+        packed = bytearray(stride)
+        for x, color in enumerate(row):
+            packed[x // per_byte] |= colors[color] << (8 - bits * (x % per_byte + 1))
+        pixels += packed
+    palette = bytearray()
+    for r, g, b in colors:
+        palette += bytes((b, g, r, 0))
+
+    offset = 14 + 40 + len(palette)
+    header = struct.pack("<2sIHHI", b"BM", offset + len(pixels), 0, 0, offset)
+    info = struct.pack("<IiiHHIIiiII", 40, width, height, 1, bits, 0, len(pixels),
+                       2835, 2835, len(colors), 0)
+    return header + info + palette + pixels, len(colors), bits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Palettise BMPs for bitmap_cache.load_bmp()")
+    parser.add_argument("bmps", nargs="+")
+    parser.add_argument("-o", "--output", help="with one input: where to write it")
+    args = parser.parse_args()
+    if args.output and len(args.bmps) > 1:
+        parser.error("-o takes a single input")
+
+    failed = False
+    for path in args.bmps:
+        try:
+            image = read_bmp(path)
+            if image is None:
+                print("{}: already palettised".format(path))
+                continue
+            width, height, old_bits, rows = image
+            data, colors, bits = palettise(width, height, rows)
+        except (OSError, ValueError) as e:
+            print("{}: {}".format(path, e), file=sys.stderr)
+            failed = True
+            continue
+        output = args.output or path
+        size = os.path.getsize(path)
+        with open(output, "wb") as f:
+            f.write(data)
+        print("{}: {} colors, {} to {} bits, {} to {} bytes".format(
+            output, colors, old_bits, bits, size, len(data)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
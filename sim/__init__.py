@@ -0,0 +1,6 @@
+"""
+Host-side simulator for the MatrixPortal message board.
+
+Run ``python -m sim.bench`` from the repository root to replay the traces in
+sim/traces against ``code.py`` and print the benchmark report.
+"""
@@ -0,0 +1,73 @@
+"""
+Benchmark report over one or more replay traces.
+
+    python -m sim.bench                      # every trace in sim/traces
+    python -m sim.bench sim/traces/basic.json --json out.json
+    python -m sim.bench --no-heap            # latency without tracemalloc overhead
+
+Latencies are host wall-clock times for each mode's ``update()`` and are only
+meaningful relative to another run on the same machine. Allocation figures are
+bytes allocated between consecutive ``mqtt_client.loop()`` calls, as traced by
+tracemalloc. Refreshes are counted in virtual time against the shown group.
+"""
+
+import argparse
+import glob
+import json
+import os
+
+from sim.replay import replay
+
+TRACES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def report(name, summary):
+    lines = [
+        "== {} ==".format(name),
+        "virtual time {virtual_seconds:.1f} s, {iterations} loop iterations, "
+        "{weather_requests} weather requests ({weather_not_modified} not modified), "
+        "{published} publishes, "
+        "{mqtt_connects} MQTT connects".format(**summary),
+        "heap: boot {boot_heap} B, peak {peak_heap} B; "
+        "alloc/iteration mean {alloc_per_iteration:.0f} B, p95 {alloc_p95} B".format(**summary),
+        "flash: {files_opened} files opened, {stats} stats".format(**summary),
+        "display: {layouts} label layouts, {late_frames} late frames".format(**summary),
+        "{:<16}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}".format(
+            "mode", "updates", "mean us", "p50 us", "p95 us", "max us", "refresh", "flash B"),
+    ]
+    for mode, m in summary["modes"].items():
+        lines.append("{:<16}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}{:>12}".format(
+            mode, m["updates"], m["mean_us"], m["p50_us"], m["p95_us"], m["max_us"],
+            m["refreshes"], m["flash_bytes"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("traces", nargs="*")
+    parser.add_argument("--json", help="also write the summaries to this file")
+    parser.add_argument("--no-heap", action="store_true",
+                        help="skip tracemalloc; heap and allocation figures read 0")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the firmware's own prints")
+    args = parser.parse_args(argv)
+    paths = args.traces or sorted(glob.glob(os.path.join(TRACES, "*.json")))
+    results = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        results[name] = replay(load(path), track_heap=not args.no_heap,
+                               quiet=not args.verbose)
+        print(report(name, results[name]))
+        print()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
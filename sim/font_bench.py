@@ -0,0 +1,82 @@
+"""
+Time and heap taken to load the sign's fonts, from BDF and compiled.
+
+    python -m sim.font_bench
+    python -m sim.font_bench --repeat 20
+
+"bdf" is what the modes used to do at startup: load_font() on the BDF and
+load_glyphs() with the characters they use. "fnt" is binary_font reading
+the file compiled by scripts/compile_font.py. Both use the stand-ins in
+sim/hw, whose BDF reader parses the whole file like the real one scans it;
+times are host wall-clock and sizes CPython's, so only the ratios carry
+over to the board.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(REPO, "sim", "hw"), REPO]
+
+from adafruit_bitmap_font import bitmap_font
+from binary_font import BinaryFont
+
+# Kept in step with the load_glyphs() calls in display_modes
+FONTS = (
+    ("fonts/BellotaText-Bold-21_DJL.bdf", "ONAIRFNPTE"),
+    ("fonts/6x10_DJL.bdf", "°Ckph%r↑↗→↘↓↙←↖↥↧㎩­ 0123456789"),
+)
+
+
+def load_bdf(path, chars):
+    font = bitmap_font.load_font(path)
+    font.load_glyphs(chars)
+    return font
+
+
+def load_fnt(path, chars):
+    return BinaryFont(path.rsplit(".", 1)[0] + ".fnt")
+
+
+def measure(func, path, chars, repeat):
+    """(mean ms, peak bytes, retained bytes) for loading one font."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(path, chars)
+    ms = (time.perf_counter() - start) * 1000 / repeat
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    font = func(path, chars)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del font
+    return ms, peak - base, retained - base
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+    os.chdir(REPO)
+    print("{:<34}{:<6}{:>8}{:>10}{:>10}{:>12}".format(
+        "font", "path", "file B", "load ms", "peak B", "retained B"))
+    totals = {}
+    for path, chars in FONTS:
+        for label, func, file in (("bdf", load_bdf, path),
+                                  ("fnt", load_fnt, path.rsplit(".", 1)[0] + ".fnt")):
+            ms, peak, retained = measure(func, path, chars, args.repeat)
+            total = totals.setdefault(label, [0, 0, 0])
+            total[0] += ms
+            total[1] = max(total[1], peak)
+            total[2] += retained
+            print("{:<34}{:<6}{:>8}{:>10.2f}{:>10}{:>12}".format(
+                os.path.basename(path), label, os.path.getsize(file), ms, peak, retained))
+    for label, (ms, peak, retained) in totals.items():
+        print("{:<34}{:<6}{:>8}{:>10.2f}{:>10}{:>12}".format("all", label, "", ms, peak, retained))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Stand-in for ``adafruit_bitmap_font.bitmap_font``; reads BDF metrics and bitmaps."""
+
+import displayio
+from adafruit_bitmap_font.glyph_cache import Glyph
+
+
+class BDF:
+
+    def __init__(self, f):
+        self._file = f
+        self._box = (0, 0, 0, 0)
+        self._glyphs = {}
+        self._metrics = {}
+        codepoint = None
+        shift_x = shift_y = 0
+        bitmap = None
+        row = -1
+        for line in f:
+            if row >= 0:
+                if line.startswith("ENDCHAR"):
+                    row = -1
+                    continue
+                bits = int(line.strip() or "0", 16)
+                nbits = 4 * len(line.strip())
+                for x in range(bitmap.width):
+                    if bits >> (nbits - 1 - x) & 1:
+                        bitmap[x, row] = 1
+                row += 1
+            elif line.startswith("FONTBOUNDINGBOX"):
+                self._box = tuple(int(v) for v in line.split()[1:5])
+            elif line.startswith("ENCODING"):
+                codepoint = int(line.split()[1])
+            elif line.startswith("DWIDTH"):
+                shift_x, shift_y = (int(v) for v in line.split()[1:3])
+            elif line.startswith("BBX"):
+                width, height, dx, dy = (int(v) for v in line.split()[1:5])
+                bitmap = displayio.Bitmap(max(1, width), max(1, height), 2)
+                self._metrics[codepoint] = Glyph(bitmap, 0, width, height, dx, dy,
+                                                 shift_x, shift_y)
+            elif line.startswith("BITMAP"):
+                row = 0
+        f.close()
+
+    def get_bounding_box(self):
+        return self._box
+
+    def load_glyphs(self, code_points):
+        if isinstance(code_points, int):
+            code_points = (code_points,)
+        elif isinstance(code_points, (str, bytes)):
+            code_points = [c if isinstance(c, int) else ord(c) for c in code_points]
+        for cp in code_points:
+            if cp in self._metrics:
+                self._glyphs[cp] = self._metrics[cp]
+
+    def get_glyph(self, code_point):
+        if code_point not in self._glyphs:
+            self.load_glyphs(code_point)
+        return self._glyphs.get(code_point)
+
+
+def load_font(filename):
+    return BDF(open(filename, "r", encoding="utf-8"))
@@ -0,0 +1,6 @@
+"""Stand-in for ``adafruit_bitmap_font.glyph_cache``."""
+
+from collections import namedtuple
+
+Glyph = namedtuple("Glyph", ["bitmap", "tile_index", "width", "height",
+                             "dx", "dy", "shift_x", "shift_y"])
@@ -0,0 +1,106 @@
+"""
+Stand-in for ``adafruit_display_text.label`` (the 2.x ``max_glyphs`` API).
+
+Like the real Label, assigning ``text`` always relays out the whole string,
+even when it is unchanged; assigning ``color`` writes palette entry 1. Each
+layout is counted.
+"""
+
+import displayio
+from sim import runtime
+
+
+class Label(displayio.Group):
+
+    def __init__(self, font, *, x=0, y=0, text="", max_glyphs=None,
+                 color=0xFFFFFF, background_color=None, line_spacing=1.25,
+                 anchor_point=None, anchored_position=None, scale=1, **kwargs):
+        if not max_glyphs and not text:
+            raise RuntimeError("Please provide a max size, or initial text")
+        if not max_glyphs:
+            max_glyphs = len(text)
+        super().__init__(max_size=max_glyphs, scale=scale, x=x, y=y)
+        self.font = font
+        self._max_glyphs = max_glyphs
+        self._text = None
+        self.palette = displayio.Palette(2)
+        self.palette[0] = 0
+        self.palette.make_transparent(0)
+        self.palette[1] = color
+        self._color = color
+        self.line_spacing = line_spacing
+        self._anchor_point = anchor_point or (0, 0)
+        self._anchored_position = anchored_position
+        self._bounding_box = (0, 0, 0, 0)
+        self.layouts = 0
+        self._update_text(str(text))
+
+    def _update_text(self, new_text):
+        self.layouts += 1
+        runtime.current.counters.layouts += 1
+        width = height = line_width = tiles = 0
+        _, line_height = self.font.get_bounding_box()[:2]
+        lines = 1
+        for c in new_text:
+            if c == "\n":
+                lines += 1
+                line_width = 0
+                continue
+            glyph = self.font.get_glyph(ord(c))
+            if glyph is None:
+                continue
+            line_width += glyph.shift_x
+            width = max(width, line_width)
+            # One TileGrid per visible glyph, with a spare slot for the
+            # background box the real Label reserves
+            if glyph.width > 0 and glyph.height > 0:
+                tiles += 1
+                if tiles > self._max_glyphs + 1:
+                    raise RuntimeError("Group full")
+        height = int(line_height * self.line_spacing * lines)
+        self._bounding_box = (0, 0, width, height)
+        self._text = new_text
+        self._dirty = True
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, new_text):
+        self._update_text(str(new_text))
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, new_color):
+        self._color = new_color
+        self.palette[1] = new_color
+
+    @property
+    def bounding_box(self):
+        return self._bounding_box
+
+    @property
+    def anchor_point(self):
+        return self._anchor_point
+
+    @anchor_point.setter
+    def anchor_point(self, value):
+        self._anchor_point = value
+        self._dirty = True
+
+    @property
+    def anchored_position(self):
+        return self._anchored_position
+
+    @anchored_position.setter
+    def anchored_position(self, value):
+        self._anchored_position = value
+        self._dirty = True
+
+    def _collect(self, dirty, flash):
+        dirty, flash = super()._collect(dirty, flash)
+        return self.palette._take_dirty() or dirty, flash
@@ -0,0 +1,46 @@
+"""
+Stand-in for ``adafruit_esp32spi.adafruit_esp32spi``.
+
+The access point is out of reach during the trace's "esp" outages, which
+only an ESP32 reset gets past. From "ntp_delay" seconds after joining,
+get_time() is the trace's "epoch" (Unix time at power-on) plus the
+virtual time since.
+"""
+
+from sim import runtime
+
+
+class ESP_SPIcontrol:
+
+    def __init__(self, spi, cs_pin, ready_pin, reset_pin, gpio0_pin=None, **kwargs):
+        self._joined = False
+        self._joined_at = 0
+
+    @property
+    def is_connected(self):
+        return self._joined and not runtime.current.wifi_down()
+
+    @is_connected.setter
+    def is_connected(self, value):
+        self._joined = value
+        self._joined_at = runtime.current.clock.now
+
+    def connect_AP(self, ssid, password, timeout_s=10):
+        rt = runtime.current
+        rt.check_end()
+        if rt.wifi_down():
+            rt.clock.advance(timeout_s)
+            raise RuntimeError("No such ssid", ssid)
+        rt.clock.advance(rt.trace.get("wifi_connect", 2.0))
+        self._joined = True
+        self._joined_at = rt.clock.now
+
+    def get_time(self):
+        rt = runtime.current
+        if not self.is_connected or rt.clock.now - self._joined_at < rt.trace.get("ntp_delay", 0):
+            raise ValueError("_GET_TIME returned 0")
+        return (int(rt.trace.get("epoch", 1618245000) + rt.clock.now),)
+
+    def reset(self):
+        runtime.current.esp_reset()
+        self._joined = False
@@ -0,0 +1,67 @@
+"""
+Stand-in for ``adafruit_esp32spi.adafruit_esp32spi_wifimanager``.
+
+``get()`` serves the replay trace's canned OpenWeather responses in order,
+repeating the last one, and charges each one's ``latency`` to the clock.
+With the trace's "weather_validators" set they carry an ETag and
+Last-Modified, and a request sending those back gets a 304, as from
+sim.weather_server.
+"""
+
+import json
+
+from sim import runtime
+from sim.weather_server import not_modified, validators
+
+
+class Response:
+
+    def __init__(self, body, status_code=200, headers=None):
+        self._body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return json.dumps(self._body)
+
+    @property
+    def content(self):
+        return self.text.encode()
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        content = self.content
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+class ESPSPI_WiFiManager:
+
+    def __init__(self, esp, secrets, status_pixel=None, attempts=2, **kwargs):
+        self.esp = esp
+        self.ssid = secrets["ssid"]
+        self.password = secrets.get("password")
+
+    def connect(self):
+        runtime.current.clock.advance(runtime.current.trace.get("wifi_connect", 2.0))
+        self.esp.is_connected = True
+
+    def reset(self):
+        self.esp.reset()
+
+    def get(self, url, headers=None, **kwargs):
+        rt = runtime.current
+        body = rt.weather_response()
+        if not rt.trace.get("weather_validators"):
+            return Response(body)
+        if not_modified(body, {k.lower(): v for k, v in (headers or {}).items()}):
+            rt.counters.weather_not_modified += 1
+            return Response(None, 304)
+        etag, modified = validators(body)
+        return Response(body, headers={"etag": etag, "last-modified": modified})
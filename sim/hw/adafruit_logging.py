@@ -0,0 +1,81 @@
+"""Stand-in for the CircuitPython 6 era ``adafruit_logging``."""
+
+import time
+
+NOTSET = 0
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+CRITICAL = 50
+
+LEVELS = [(NOTSET, "NOTSET"), (DEBUG, "DEBUG"), (INFO, "INFO"),
+          (WARNING, "WARNING"), (ERROR, "ERROR"), (CRITICAL, "CRITICAL")]
+
+
+def level_for(value):
+    for i in range(len(LEVELS)):
+        if value == LEVELS[i][0]:
+            return LEVELS[i][1]
+        if value < LEVELS[i][0]:
+            return LEVELS[i - 1][1]
+    return LEVELS[0][1]
+
+
+class LoggingHandler:
+
+    def format(self, level, msg):
+        return "{0}: {1} - {2}".format(time.monotonic(), level_for(level), msg)
+
+    def emit(self, level, msg):
+        raise NotImplementedError()
+
+
+class PrintHandler(LoggingHandler):
+
+    def emit(self, level, msg):
+        print(self.format(level, msg))
+
+
+_loggers = {}
+
+
+def getLogger(name):
+    if name not in _loggers:
+        _loggers[name] = Logger()
+    return _loggers[name]
+
+
+class Logger:
+
+    def __init__(self):
+        self._level = NOTSET
+        self._handler = PrintHandler()
+
+    def setLevel(self, value):
+        self._level = value
+
+    def getEffectiveLevel(self):
+        return self._level
+
+    def addHandler(self, handler):
+        self._handler = handler
+
+    def log(self, level, format_string, *args):
+        if level >= self._level:
+            self._handler.emit(level, format_string % args)
+
+    def debug(self, format_string, *args):
+        self.log(DEBUG, format_string, *args)
+
+    def info(self, format_string, *args):
+        self.log(INFO, format_string, *args)
+
+    def warning(self, format_string, *args):
+        self.log(WARNING, format_string, *args)
+
+    def error(self, format_string, *args):
+        self.log(ERROR, format_string, *args)
+
+    def critical(self, format_string, *args):
+        self.log(CRITICAL, format_string, *args)
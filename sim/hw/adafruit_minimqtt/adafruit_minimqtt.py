@@ -0,0 +1,109 @@
+"""
+Stand-in for ``adafruit_minimqtt.adafruit_minimqtt``.
+
+``loop()`` delivers at most one message from the replay trace per call, like
+the real client, and also drives the simulator's background hooks (display
+auto-refresh and the benchmark's per-iteration sampling). The "broker"
+drops the connection and refuses new ones during the trace's outages.
+"""
+
+from sim import runtime
+
+
+class MMQTTException(Exception):
+    pass
+
+
+def set_socket(sock, iface=None):
+    pass
+
+
+class MQTT:
+
+    def __init__(self, broker, port=None, username=None, password=None,
+                 client_id=None, is_ssl=True, keep_alive=60, **kwargs):
+        self.broker = broker
+        self.port = port
+        self.client_id = client_id
+        self.keep_alive = keep_alive
+        self.logger = None
+        self.on_message = None
+        self._callbacks = {}
+        self._subscribed = []
+        self._connected = False
+        self._timestamp = 0
+
+    def enable_logger(self, logger, log_level=20):
+        self.logger = logger.getLogger("log")
+        self.logger.setLevel(log_level)
+
+    def connect(self, clean_session=True, host=None, port=None, keep_alive=None):
+        rt = runtime.current
+        rt.check_end()
+        rt.counters.mqtt_connects += 1
+        rt.clock.advance(rt.trace.get("mqtt_connect", 0.2))
+        if rt.link_down():
+            self._connected = False
+            raise MMQTTException("Connection refused")
+        self._connected = True
+        self._timestamp = rt.clock.now
+        return 0
+
+    def reconnect(self, resub_topics=True, qos=None):
+        self.connect()
+
+    def disconnect(self):
+        # The socket is closed even when the broker can't be told
+        runtime.current.socket_closed()
+        connected = self._connected
+        self._connected = False
+        if not connected:
+            raise MMQTTException("MiniMQTT is not connected.")
+
+    def is_connected(self):
+        if not self._connected:
+            raise MMQTTException("MiniMQTT is not connected.")
+        return True
+
+    def subscribe(self, topic, qos=0):
+        self._subscribed.append((topic, qos))
+
+    def add_topic_callback(self, mqtt_topic, callback_method):
+        self._callbacks[mqtt_topic] = callback_method
+
+    def remove_topic_callback(self, mqtt_topic):
+        del self._callbacks[mqtt_topic]
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        runtime.current.counters.published.append((runtime.current.clock.now, topic, msg))
+
+    def _subscribed_to(self, topic):
+        for sub, _ in self._subscribed:
+            if sub == topic or (sub.endswith("#") and topic.startswith(sub[:-1])):
+                return True
+        return False
+
+    def loop(self, timeout=1):
+        rt = runtime.current
+        for hook in rt.loop_hooks:
+            hook()
+        if rt.on_iteration is not None:
+            rt.on_iteration()
+        if not self._connected:
+            raise MMQTTException("MiniMQTT is not connected.")
+        if rt.link_down():
+            self._connected = False
+            raise MMQTTException("Connection dropped")
+        message = rt.next_message(timeout)
+        self._timestamp = rt.clock.now
+        if message is None:
+            return None
+        topic, payload = message
+        if not self._subscribed_to(topic):
+            return None
+        callback = self._callbacks.get(topic)
+        if callback is not None:
+            callback(self, topic, payload)
+        elif self.on_message is not None:
+            self.on_message(self, topic, payload)
+        return 0
@@ -0,0 +1,5 @@
+"""Stand-in for ``adafruit_requests``."""
+
+
+def set_socket(sock, iface=None):
+    pass
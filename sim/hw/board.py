@@ -0,0 +1,20 @@
+"""Stand-in for the MatrixPortal M4 ``board`` module."""
+
+
+class Pin:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "board." + self.name
+
+
+for _name in ("BUTTON_UP", "BUTTON_DOWN", "L", "NEOPIXEL",
+              "MTX_R1", "MTX_G1", "MTX_B1", "MTX_R2", "MTX_G2", "MTX_B2",
+              "MTX_ADDRA", "MTX_ADDRB", "MTX_ADDRC", "MTX_ADDRD", "MTX_ADDRE",
+              "MTX_CLK", "MTX_LAT", "MTX_OE",
+              "ESP_CS", "ESP_BUSY", "ESP_RESET", "ESP_GPIO0",
+              "SCK", "MOSI", "MISO", "TX", "RX"):
+    globals()[_name] = Pin(_name)
+del _name
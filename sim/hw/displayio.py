@@ -0,0 +1,294 @@
+"""
+Stand-in for ``displayio``.
+
+Nothing is rasterised. Every object tracks whether it changed since the last
+refresh so the display stand-in can count the refreshes CircuitPython would
+have done, and OnDiskBitmaps report how many bytes a refresh pulls from flash.
+"""
+
+import struct
+
+
+class _Node:
+
+    def __init__(self):
+        self._dirty = True
+        self._hidden = False
+        self._parent = None
+
+    @property
+    def hidden(self):
+        return self._hidden
+
+    @hidden.setter
+    def hidden(self, value):
+        value = bool(value)
+        if value != self._hidden:
+            self._hidden = value
+            self._dirty = True
+            if self._parent is not None:
+                self._parent._dirty = True
+
+    def _collect(self, dirty, flash):
+        """Fold this subtree's dirty state and flash reads into the totals."""
+        d = self._dirty
+        self._dirty = False
+        return dirty or d, flash
+
+
+class Group(_Node):
+
+    def __init__(self, *, max_size=4, scale=1, x=0, y=0):
+        super().__init__()
+        self._max_size = max_size
+        self._layers = []
+        self.scale = scale
+        self._x = x
+        self._y = y
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        if value != self._x:
+            self._x = value
+            self._dirty = True
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        if value != self._y:
+            self._y = value
+            self._dirty = True
+
+    def append(self, layer):
+        self.insert(len(self._layers), layer)
+
+    def insert(self, index, layer):
+        if len(self._layers) >= self._max_size:
+            raise RuntimeError("Group full")
+        if layer._parent is not None:
+            raise ValueError("Layer already in a group.")
+        layer._parent = self
+        self._layers.insert(index, layer)
+        self._dirty = True
+
+    def pop(self, i=-1):
+        layer = self._layers.pop(i)
+        layer._parent = None
+        self._dirty = True
+        return layer
+
+    def remove(self, layer):
+        self.pop(self._layers.index(layer))
+
+    def index(self, layer):
+        return self._layers.index(layer)
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __getitem__(self, index):
+        return self._layers[index]
+
+    def __setitem__(self, index, layer):
+        old = self._layers[index]
+        old._parent = None
+        layer._parent = self
+        self._layers[index] = layer
+        self._dirty = True
+
+    def __delitem__(self, index):
+        self.pop(index)
+
+    def __contains__(self, layer):
+        return layer in self._layers
+
+    def _collect(self, dirty, flash):
+        dirty, flash = super()._collect(dirty, flash)
+        for layer in self._layers:
+            layer_dirty, layer_flash = layer._collect(False, 0)
+            if not layer._hidden:
+                dirty = dirty or layer_dirty
+                flash += layer_flash
+        return dirty, flash
+
+
+class Bitmap:
+
+    def __init__(self, width, height, value_count):
+        self.width = width
+        self.height = height
+        self._bits = 1
+        while (1 << self._bits) < value_count:
+            self._bits <<= 1
+        self._data = bytearray(width * height)
+        self._dirty = False
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            index = index[1] * self.width + index[0]
+        return self._data[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, tuple):
+            index = index[1] * self.width + index[0]
+        if self._data[index] != value:
+            self._data[index] = value
+            self._dirty = True
+
+    def fill(self, value):
+        for i in range(len(self._data)):
+            self._data[i] = value
+        self._dirty = True
+
+    def _take_dirty(self):
+        d = self._dirty
+        self._dirty = False
+        return d
+
+
+class OnDiskBitmap:
+
+    def __init__(self, file):
+        if isinstance(file, str):
+            file = open(file, "rb")
+        self._file = file
+        file.seek(0)
+        header = file.read(30)
+        if header[:2] != b"BM":
+            raise ValueError("Invalid BMP file")
+        self.width, height = struct.unpack_from("<ii", header, 18)
+        self.height = abs(height)
+        self._bits = struct.unpack_from("<H", header, 28)[0]
+
+    @property
+    def flash_bytes(self):
+        return ((self.width * self._bits + 31) // 32) * 4 * self.height
+
+    def _take_dirty(self):
+        return False
+
+
+class ColorConverter:
+
+    def __init__(self, *, dither=False):
+        self.dither = dither
+
+    def convert(self, color):
+        return color
+
+    def _take_dirty(self):
+        return False
+
+
+class Palette:
+
+    def __init__(self, color_count):
+        self._colors = [0] * color_count
+        self._transparent = set()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._colors)
+
+    def __getitem__(self, index):
+        return self._colors[index]
+
+    def __setitem__(self, index, color):
+        if isinstance(color, (bytes, bytearray, tuple, list)):
+            color = color[0] << 16 | color[1] << 8 | color[2]
+        # CircuitPython skips the invalidation when the color is unchanged.
+        if self._colors[index] != color:
+            self._colors[index] = color
+            self._dirty = True
+
+    def make_transparent(self, index):
+        if index not in self._transparent:
+            self._transparent.add(index)
+            self._dirty = True
+
+    def make_opaque(self, index):
+        if index in self._transparent:
+            self._transparent.discard(index)
+            self._dirty = True
+
+    def is_transparent(self, index):
+        return index in self._transparent
+
+    def _take_dirty(self):
+        d = self._dirty
+        self._dirty = False
+        return d
+
+
+class TileGrid(_Node):
+
+    def __init__(self, bitmap, *, pixel_shader, width=1, height=1,
+                 tile_width=None, tile_height=None, default_tile=0, x=0, y=0):
+        super().__init__()
+        self.bitmap = bitmap
+        self.pixel_shader = pixel_shader
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width or bitmap.width
+        self.tile_height = tile_height or bitmap.height
+        self._tiles = bytearray([default_tile] * (width * height))
+        self._x = x
+        self._y = y
+        self.flip_x = False
+        self.flip_y = False
+        self.transpose_xy = False
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        if value != self._x:
+            self._x = value
+            self._dirty = True
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        if value != self._y:
+            self._y = value
+            self._dirty = True
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            index = index[1] * self.width + index[0]
+        return self._tiles[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, tuple):
+            index = index[1] * self.width + index[0]
+        if self._tiles[index] != value:
+            self._tiles[index] = value
+            self._dirty = True
+
+    def _collect(self, dirty, flash):
+        dirty, flash = super()._collect(dirty, flash)
+        dirty = self.bitmap._take_dirty() or dirty
+        dirty = self.pixel_shader._take_dirty() or dirty
+        if not self._hidden and isinstance(self.bitmap, OnDiskBitmap):
+            flash += self.bitmap.flash_bytes
+        return dirty, flash
+
+
+class Shape(Bitmap):
+    pass
+
+
+def release_displays():
+    pass
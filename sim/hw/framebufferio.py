@@ -0,0 +1,91 @@
+"""
+Stand-in for ``framebufferio``.
+
+Auto-refresh is modelled as a background task polled from the MQTT stand-in's
+``loop()``: at most ``target_fps`` times per virtual second it refreshes if the
+shown group changed. Every refresh is counted against the shown group's class.
+
+With auto-refresh off, refresh() follows CircuitPython 6: an early call waits
+for the next frame, a call more than a frame after the previous one is
+skipped to catch up, and going longer than ``minimum_frames_per_second``
+allows between refreshes raises. The background task then only watches for
+changes left on the shown group for more than ``LATE`` seconds without a
+refresh, and counts them as late frames.
+"""
+
+from sim import runtime
+
+
+class FramebufferDisplay:
+
+    target_fps = 60
+    LATE = 0.25
+
+    def __init__(self, framebuffer, *, rotation=0, auto_refresh=True):
+        self.framebuffer = framebuffer
+        self.width = framebuffer.width
+        self.height = framebuffer.height
+        self.rotation = rotation
+        self.auto_refresh = auto_refresh
+        self.root_group = None
+        self._last_refresh = None
+        self._last_call = None
+        # Changes collected by the background task that no refresh has shown
+        self._pending = False
+        self._pending_since = None
+        runtime.current.loop_hooks.append(self._background)
+
+    def show(self, group):
+        if group is not self.root_group:
+            self.root_group = group
+            if group is not None:
+                group._dirty = True
+
+    def _refresh_now(self):
+        group = self.root_group
+        if group is None:
+            return False
+        dirty, flash = group._collect(False, 0)
+        dirty = dirty or self._pending
+        self._pending = False
+        self._pending_since = None
+        if not dirty:
+            return False
+        runtime.current.counters.count_refresh(type(group).__name__, flash)
+        self._last_refresh = runtime.current.clock.now
+        return True
+
+    def _background(self):
+        now = runtime.current.clock.now
+        if not self.auto_refresh:
+            if self.root_group is None:
+                return
+            dirty, _ = self.root_group._collect(False, 0)
+            if dirty and not self._pending:
+                self._pending = True
+                self._pending_since = now
+            elif self._pending_since is not None and now - self._pending_since > self.LATE:
+                runtime.current.counters.late_frames += 1
+                self._pending_since = None
+            return
+        if self._last_refresh is not None and now - self._last_refresh < 1 / self.target_fps:
+            return
+        self._refresh_now()
+
+    def refresh(self, *, target_frames_per_second=60, minimum_frames_per_second=1):
+        clock = runtime.current.clock
+        if not self.auto_refresh and self._last_call is not None:
+            if (minimum_frames_per_second and self._last_refresh is not None
+                    and clock.now - self._last_refresh > 1 / minimum_frames_per_second):
+                raise RuntimeError("Below minimum frame rate")
+            since_call = clock.now - self._last_call
+            self._last_call = clock.now
+            if since_call > 1 / target_frames_per_second:
+                return False
+        self._last_call = clock.now
+        # An early call blocks until the next frame is due.
+        if target_frames_per_second and self._last_refresh is not None:
+            clock.advance(self._last_refresh + 1 / target_frames_per_second - clock.now)
+        self._refresh_now()
+        self._last_refresh = clock.now
+        return True
@@ -0,0 +1,11 @@
+"""Stand-in for ``rgbmatrix``."""
+
+
+class RGBMatrix:
+
+    def __init__(self, *, width, bit_depth, rgb_pins, addr_pins, clock_pin,
+                 latch_pin, output_enable_pin, **kwargs):
+        self.width = width
+        self.height = len(rgb_pins) // 3 << len(addr_pins)
+        self.bit_depth = bit_depth
+        self.brightness = 1.0
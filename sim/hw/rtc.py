@@ -0,0 +1,18 @@
+"""
+Stand-in for ``rtc``: setting the time moves the clock behind time.time().
+"""
+
+import time
+
+from sim import runtime
+
+
+class RTC:
+
+    @property
+    def datetime(self):
+        return time.localtime(runtime.current.clock.time())
+
+    @datetime.setter
+    def datetime(self, value):
+        runtime.current.clock.set_time(time.mktime(value))
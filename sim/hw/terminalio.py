@@ -0,0 +1,36 @@
+"""Stand-in for ``terminalio``: a fixed 6x12 cell font.
+
+Glyph shapes are placeholders (a box per printable character); only the
+metrics match the real font.
+"""
+
+import displayio
+from adafruit_bitmap_font.glyph_cache import Glyph
+
+_FIRST = 0x20
+_LAST = 0x7E
+
+
+class _BuiltinFont:
+
+    def __init__(self, width, height):
+        self._box = (width, height)
+        count = _LAST - _FIRST + 1
+        self.bitmap = displayio.Bitmap(width * count, height, 2)
+        for i in range(1, count):
+            for x in range(1, width - 1):
+                self.bitmap[i * width + x, 2] = 1
+                self.bitmap[i * width + x, height - 3] = 1
+        self._glyphs = [Glyph(self.bitmap, i, width, height, 0, 0, width, 0)
+                        for i in range(count)]
+
+    def get_bounding_box(self):
+        return self._box
+
+    def get_glyph(self, codepoint):
+        if codepoint < _FIRST or codepoint > _LAST:
+            return None
+        return self._glyphs[codepoint - _FIRST]
+
+
+FONT = _BuiltinFont(6, 12)
@@ -0,0 +1,98 @@
+"""
+Peak and retained heap of the two ways to decode our JSON payloads.
+
+    python -m sim.json_bench                 # payloads from every trace
+    python -m sim.json_bench sim/traces/basic.json
+
+"loads" is what the firmware used to do: read the whole body (as
+``response.json()`` does) and ``json.loads`` it, keeping the full tree.
+"select" is json_stream.Selector streaming 64-byte chunks, keeping only the
+selected fields. Sizes are CPython's, so they are bigger than on the board,
+but the ratio between the two paths carries over.
+"""
+
+import argparse
+import glob
+import json
+import os
+import tracemalloc
+
+from json_stream import Selector
+
+TRACES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+
+# Kept in step with WeatherMode.FIELDS and MessageMode.FIELDS, which can't be
+# imported here without the board
+WEATHER_FIELDS = (("main", "temp"), ("main", "pressure"), ("main", "humidity"),
+                  ("wind", "speed"), ("wind", "deg"), ("weather", 0, "main"),
+                  ("weather", 0, "icon"), ("dt",))
+MESSAGE_FIELDS = (("text",), ("picture",), ("emoji",))
+
+
+def chunks(body, size=64):
+    view = memoryview(body)
+    for i in range(0, len(body), size):
+        yield bytes(view[i:i + size])
+
+
+def loads(body):
+    return json.loads(bytes(body))
+
+
+def measure(func, body):
+    """(peak, retained) bytes allocated while decoding ``body``."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = func(body)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak - base, retained - base
+
+
+def payloads(paths):
+    weather, messages = [], []
+    for path in paths:
+        with open(path) as f:
+            trace = json.load(f)
+        for entry in trace.get("weather", ()):
+            if "body" in entry:
+                weather.append(json.dumps(entry["body"]).encode())
+        for event in trace.get("events", ()):
+            if event.get("topic", "").endswith("/message"):
+                messages.append(event["payload"].encode())
+    return weather, messages
+
+
+def compare(name, bodies, fields):
+    selector = Selector(fields)
+    select = lambda body: selector.parse(chunks(body))
+    rows = {"loads": [0, 0], "select": [0, 0]}
+    for body in bodies:
+        for label, func in (("loads", loads), ("select", select)):
+            peak, retained = measure(func, body)
+            rows[label][0] = max(rows[label][0], peak)
+            rows[label][1] = max(rows[label][1], retained)
+    size = max(len(b) for b in bodies)
+    print("== {} ({} payloads, largest {} B) ==".format(name, len(bodies), size))
+    print("{:<10}{:>12}{:>14}".format("path", "peak B", "retained B"))
+    for label, (peak, retained) in rows.items():
+        print("{:<10}{:>12}{:>14}".format(label, peak, retained))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("traces", nargs="*")
+    args = parser.parse_args(argv)
+    paths = args.traces or sorted(glob.glob(os.path.join(TRACES, "*.json")))
+    weather, messages = payloads(paths)
+    if weather:
+        compare("weather", weather, WEATHER_FIELDS)
+    if messages:
+        compare("messages", messages, MESSAGE_FIELDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Replay a recorded trace against the unmodified ``code.py`` under CPython.
+
+The firmware runs against the stand-ins in sim/hw inside a throwaway
+CIRCUITPY directory that links in the repo's assets, so anything the firmware
+writes to "flash" is discarded afterwards. A trace is a JSON object:
+
+    {
+      "duration": 120,          # virtual seconds to run the main loop for
+      "heap": 60000,            # bytes gc.mem_free() reports once booted
+      "secrets": {...},         # overrides for the fake secrets.py
+      "weather": [{"latency": 0.4, "body": {...}}, {"error": "timeout"}],
+      "epoch": 1618245000,      # Unix time at power-on, for the ESP32's NTP time
+      "ntp_delay": 0,           # seconds after joining before it has it
+      "weather_validators": true,   # send ETag/Last-Modified, answer 304s
+      "flash": {"weather_cache.json": {...}},   # files there at power-on
+      "events": [
+        {"t": 5, "topic": "display/mode", "payload": "OnAir"},
+        {"t": 9, "button": "down", "hold": 0.3},
+        {"t": 30, "drop": "socket", "for": 5}
+      ]
+    }
+
+Weather responses are served in order and the last one repeats. Like
+OpenWeather they come without validators unless "weather_validators" is
+set; then a request carrying the body's ETag or Last-Modified gets a 304.
+"flash" entries are written as text, or as JSON if they aren't strings,
+before the firmware starts. Event times
+are virtual seconds from power-on. A "drop" event cuts the broker off for
+"for" seconds, after which a plain reconnect works for "mqtt"; "socket"
+also needs the client to close its socket, and "esp" takes WiFi down too
+until the ESP32 is reset.
+"""
+
+import builtins
+import json
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sim import runtime
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HW = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hw")
+
+# Top level entries of the repo that are not copied onto the device.
+NOT_ON_FLASH = (".git", "sim", "scripts", "assets", "requests.jsonl")
+
+
+def _percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+class Metrics:
+
+    def __init__(self, rt):
+        self.rt = rt
+        self.latency = {}
+        self.iterations = 0
+        self.alloc = []
+        self.peak_heap = 0
+        self.boot_heap = None
+        self._last = None
+
+    def timed(self, name, update):
+        latency = self.latency.setdefault(name, [])
+        perf_counter = time.perf_counter
+
+        def wrapper(mode, *args, **kwargs):
+            t = perf_counter()
+            try:
+                return update(mode, *args, **kwargs)
+            finally:
+                latency.append(perf_counter() - t)
+        wrapper.__wrapped__ = update
+        return wrapper
+
+    def iteration(self):
+        self.iterations += 1
+        if not self.rt.track_heap:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if self._last is None:
+            self.boot_heap = peak - self.rt._heap_base
+            self.rt.mark_booted()
+        else:
+            self.alloc.append(peak - self._last)
+        self.peak_heap = max(self.peak_heap, peak - self.rt._heap_base)
+        tracemalloc.reset_peak()
+        self._last = current
+
+    def summary(self):
+        modes = {}
+        counters = self.rt.counters
+        names = set(self.latency) | set(counters.refreshes)
+        for name in sorted(names):
+            lat = self.latency.get(name, [])
+            modes[name] = {
+                "updates": len(lat),
+                "mean_us": sum(lat) / len(lat) * 1e6 if lat else 0,
+                "p50_us": _percentile(lat, 0.5) * 1e6,
+                "p95_us": _percentile(lat, 0.95) * 1e6,
+                "max_us": max(lat) * 1e6 if lat else 0,
+                "refreshes": counters.refreshes.get(name, 0),
+                "flash_bytes": counters.flash_bytes.get(name, 0),
+            }
+        return {
+            "virtual_seconds": round(self.rt.clock.now - self.rt.t0, 3),
+            "iterations": self.iterations,
+            "alloc_per_iteration": sum(self.alloc) / len(self.alloc) if self.alloc else 0,
+            "alloc_p95": _percentile(self.alloc, 0.95),
+            "boot_heap": self.boot_heap or 0,
+            "peak_heap": self.peak_heap,
+            "files_opened": counters.files_opened,
+            "stats": counters.stats,
+            "weather_requests": counters.weather_requests,
+            "weather_not_modified": counters.weather_not_modified,
+            "mqtt_connects": counters.mqtt_connects,
+            "layouts": counters.layouts,
+            "late_frames": counters.late_frames,
+            "published": len(counters.published),
+            "modes": modes,
+        }
+
+
+def _device_modules():
+    names = set()
+    for base in (REPO, HW):
+        for entry in os.listdir(base):
+            if entry.endswith(".py"):
+                names.add(entry[:-3])
+            elif os.path.isdir(os.path.join(base, entry)):
+                names.add(entry)
+    names.discard("sim")
+    return names
+
+
+def _purge(names):
+    for mod in list(sys.modules):
+        if mod.split(".")[0] in names:
+            del sys.modules[mod]
+
+
+def _make_flash(files=None):
+    flash = tempfile.mkdtemp(prefix="CIRCUITPY-")
+    for entry in os.listdir(REPO):
+        if entry in NOT_ON_FLASH or entry.endswith(".py"):
+            continue
+        if os.path.isdir(os.path.join(REPO, entry)):
+            os.symlink(os.path.join(REPO, entry), os.path.join(flash, entry))
+    for name, content in (files or {}).items():
+        with open(os.path.join(flash, name), "w") as f:
+            f.write(content if isinstance(content, str) else json.dumps(content))
+    return flash
+
+
+def _count_flash_access(counters):
+    real_open = builtins.open
+    real_stat = os.stat
+
+    def device_open(file, *args, **kwargs):
+        if isinstance(file, str) and not os.path.isabs(file):
+            counters.files_opened += 1
+        return real_open(file, *args, **kwargs)
+
+    def device_stat(path, *args, **kwargs):
+        if isinstance(path, str) and not os.path.isabs(path):
+            counters.stats += 1
+        return real_stat(path, *args, **kwargs)
+
+    builtins.open = device_open
+    os.stat = device_stat
+
+    def restore():
+        builtins.open = real_open
+        os.stat = real_stat
+    return restore
+
+
+def instrument(metrics, module):
+    import displayio
+    for name in dir(module):
+        cls = getattr(module, name)
+        if (isinstance(cls, type) and issubclass(cls, displayio.Group)
+                and cls.__module__ == module.__name__ and "update" in cls.__dict__):
+            cls.update = metrics.timed(name, cls.update)
+
+
+def replay(trace, *, track_heap=True, script="code.py", quiet=True):
+    """Run ``script`` from the repo against ``trace`` and return a summary."""
+    rt = runtime.Runtime(trace, track_heap=track_heap)
+    metrics = Metrics(rt)
+    names = _device_modules()
+    flash = _make_flash(trace.get("flash"))
+    cwd = os.getcwd()
+    saved_path = list(sys.path)
+    saved_stdout = sys.stdout
+    sys.path[:0] = [HW, REPO]
+    _purge(names)
+    uninstall = runtime.install(rt)
+    restore = _count_flash_access(rt.counters)
+    os.chdir(flash)
+    try:
+        if quiet:
+            sys.stdout = open(os.devnull, "w")
+        import display_modes
+        instrument(metrics, display_modes)
+        rt.on_iteration = metrics.iteration
+        rt.start_heap()
+        try:
+            runpy.run_path(os.path.join(REPO, script), run_name="__main__")
+        except runtime.ReplayDone:
+            pass
+    finally:
+        rt.stop_heap()
+        if quiet:
+            sys.stdout.close()
+            sys.stdout = saved_stdout
+        os.chdir(cwd)
+        restore()
+        uninstall()
+        _purge(names)
+        sys.path[:] = saved_path
+        shutil.rmtree(flash, ignore_errors=True)
+    return metrics.summary()
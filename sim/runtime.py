@@ -0,0 +1,276 @@
+"""
+Shared state for the host-side MatrixPortal simulator.
+
+The stand-in hardware modules in sim/hw read and write everything through the
+single Runtime instance held in ``current``: the virtual clock, button pin
+levels, queued MQTT traffic, canned weather responses and the counters the
+benchmark reports.
+"""
+
+import gc
+import io
+import sys
+import time
+import traceback
+import tracemalloc
+
+
+class ReplayDone(BaseException):
+    """Raised from the MQTT stand-in once the trace duration has elapsed."""
+
+
+class Clock:
+
+    # Virtual seconds charged for every pin read, so busy-waits on a button
+    # make progress towards the scheduled release.
+    PIN_READ_COST = 0.0001
+
+    # The RTC starts at 2000-01-01 until it's set
+    RTC_START = 946684800
+
+    def __init__(self, start=1.0):
+        self.now = start
+        self._rtc_base = self.RTC_START - start
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return int(self._rtc_base + self.now)
+
+    def set_time(self, seconds):
+        self._rtc_base = seconds - self.now
+
+    def monotonic_ns(self):
+        return int(self.now * 1000000000)
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+class Counters:
+
+    def __init__(self):
+        self.refreshes = {}
+        self.flash_bytes = {}
+        self.files_opened = 0
+        self.stats = 0
+        self.published = []
+        self.weather_requests = 0
+        self.weather_not_modified = 0
+        self.mqtt_connects = 0
+        self.layouts = 0
+        self.late_frames = 0
+
+    def count_refresh(self, name, flash_bytes=0):
+        self.refreshes[name] = self.refreshes.get(name, 0) + 1
+        if flash_bytes:
+            self.flash_bytes[name] = self.flash_bytes.get(name, 0) + flash_bytes
+
+
+class Runtime:
+
+    def __init__(self, trace, heap_size=None, track_heap=True):
+        self.trace = trace
+        self.clock = Clock(trace.get("start", 1.0))
+        self.t0 = self.clock.now
+        self.end = self.t0 + trace.get("duration", 60)
+        self.heap_size = heap_size or trace.get("heap", 60000)
+        self.track_heap = track_heap
+        self.counters = Counters()
+        self.secrets = dict(DEFAULT_SECRETS, **trace.get("secrets", {}))
+
+        # Pins read as high (released) unless inside a scheduled press window.
+        self.presses = {}
+        self.messages = []
+        # (start, end, what it takes to recover: "mqtt", "socket" or "esp")
+        self.outages = []
+        self._socket_closed = self._esp_reset = 0
+        for event in trace.get("events", []):
+            t = self.t0 + event["t"]
+            if "button" in event:
+                pin = "BUTTON_" + event["button"].upper()
+                self.presses.setdefault(pin, []).append((t, t + event.get("hold", 0.1)))
+            elif "topic" in event:
+                self.messages.append((t, event["topic"], event["payload"]))
+            elif "drop" in event:
+                self.outages.append((t, t + event.get("for", 0), event["drop"]))
+        self.messages.sort(key=lambda m: m[0])
+        self._next_message = 0
+
+        self.weather = list(trace.get("weather", []))
+        self._next_weather = 0
+
+        # Background work run from every MQTT loop() call, then the
+        # benchmark's per-iteration sample.
+        self.loop_hooks = []
+        self.on_iteration = None
+        self._heap_base = 0
+        self._free_base = 0
+
+    # --- pins ---
+
+    def pin_value(self, pin):
+        self.clock.advance(Clock.PIN_READ_COST)
+        now = self.clock.now
+        for start, end in self.presses.get(pin, ()):
+            if start <= now < end:
+                return False
+        return True
+
+    # --- broker and access point ---
+
+    def check_end(self):
+        if self.clock.now >= self.end:
+            raise ReplayDone()
+
+    def _outage(self, levels):
+        now = self.clock.now
+        for start, end, level in self.outages:
+            if level not in levels or now < start:
+                continue
+            # Over once its time is up and the client has done what it takes
+            fixed = (level == "mqtt" or (level == "socket" and self._socket_closed >= start)
+                     or self._esp_reset >= start)
+            if now < end or not fixed:
+                return True
+        return False
+
+    def link_down(self):
+        """Whether the broker is unreachable right now."""
+        return self._outage(("mqtt", "socket", "esp"))
+
+    def wifi_down(self):
+        return self._outage(("esp",))
+
+    def socket_closed(self):
+        self._socket_closed = self.clock.now
+
+    def esp_reset(self):
+        self._esp_reset = self._socket_closed = self.clock.now
+
+    # --- MQTT ---
+
+    def next_message(self, timeout):
+        """Return the next due (topic, payload), advancing the clock by at most
+        ``timeout`` while waiting for it."""
+        if self.clock.now >= self.end:
+            raise ReplayDone()
+        deadline = self.clock.now + timeout
+        if self._next_message < len(self.messages):
+            t, topic, payload = self.messages[self._next_message]
+            if t <= deadline:
+                self.clock.now = max(self.clock.now, t)
+                self._next_message += 1
+                return topic, payload
+        self.clock.now = deadline
+        return None
+
+    # --- weather ---
+
+    def weather_response(self):
+        self.counters.weather_requests += 1
+        if not self.weather:
+            raise RuntimeError("No weather responses in trace")
+        entry = self.weather[min(self._next_weather, len(self.weather) - 1)]
+        self._next_weather += 1
+        self.clock.advance(entry.get("latency", 0.3))
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return entry.get("body", entry)
+
+    # --- heap ---
+
+    def start_heap(self):
+        if self.track_heap:
+            tracemalloc.start()
+            self._heap_base = self._free_base = tracemalloc.get_traced_memory()[0]
+
+    def mark_booted(self):
+        # CPython objects are several times larger than their CircuitPython
+        # counterparts, so gc.mem_free() reports the trace's "heap" figure
+        # minus whatever has been allocated since the main loop started.
+        if self.track_heap:
+            self._free_base = tracemalloc.get_traced_memory()[0]
+
+    def stop_heap(self):
+        if self.track_heap:
+            tracemalloc.stop()
+
+    def heap_used(self):
+        if not self.track_heap:
+            return 0
+        return tracemalloc.get_traced_memory()[0] - self._heap_base
+
+    def mem_free(self):
+        if not self.track_heap:
+            return self.heap_size
+        used = tracemalloc.get_traced_memory()[0] - self._free_base
+        return max(0, self.heap_size - used)
+
+    def mem_alloc(self):
+        return self.heap_used()
+
+
+DEFAULT_SECRETS = {
+    "ssid": "sim",
+    "password": "sim",
+    "openweather_location": "London,CA",
+    "openweather_token": "0000",
+    "mqtt_broker": "localhost",
+    "mqtt_port": 8883,
+    "mqtt_username": "sim",
+    "mqtt_passwd": "sim",
+    "mqtt_client_id": "sim-matrixportal",
+    "matrix_subtopic": "sim",
+}
+
+current = None
+
+
+def _print_exception(e, file=None):
+    if isinstance(e, ReplayDone):
+        return
+    # Only a native stream will do on the board
+    if file is not None and not isinstance(file, io.IOBase):
+        raise OSError("stream operation not supported")
+    traceback.print_exception(type(e), e, e.__traceback__, file=file or sys.stdout)
+
+
+class _SecretsModule:
+    pass
+
+
+def install(runtime):
+    """Make ``runtime`` current and patch the CircuitPython-only bits of
+    ``time``, ``gc`` and ``sys`` that the firmware uses. Returns a callable
+    that undoes the patches."""
+    global current
+    current = runtime
+    saved = (time.monotonic, time.monotonic_ns, time.sleep, time.time, sys.modules.get("secrets"))
+    time.monotonic = runtime.clock.monotonic
+    time.time = runtime.clock.time
+    time.monotonic_ns = runtime.clock.monotonic_ns
+    time.sleep = runtime.clock.sleep
+    gc.mem_free = runtime.mem_free
+    gc.mem_alloc = runtime.mem_alloc
+    sys.print_exception = _print_exception
+    secrets = _SecretsModule()
+    secrets.secrets = runtime.secrets
+    sys.modules["secrets"] = secrets
+
+    def uninstall():
+        global current
+        time.monotonic, time.monotonic_ns, time.sleep, time.time, old_secrets = saved
+        if old_secrets is None:
+            sys.modules.pop("secrets", None)
+        else:
+            sys.modules["secrets"] = old_secrets
+        current = None
+
+    return uninstall
@@ -0,0 +1,236 @@
+"""
+A local stand-in for OpenWeather, and a check of WeatherService against it.
+
+    python -m sim.weather_server                     # check, with basic.json
+    python -m sim.weather_server sim/traces/basic.json --serve --port 8080
+
+The server answers every GET with the trace's weather responses in order,
+repeating the last, after each one's ``latency``; an "error" entry is a
+503. Responses carry an ETag (a hash of the body) and a Last-Modified (the
+body's ``dt``), and a request that sends either back for the same body gets
+a bare 304, as from a server that supports conditional requests. With
+--no-validators it sends neither, like OpenWeather.
+
+Without --serve it runs weather.WeatherService, over a requests-style
+adapter for urllib, through a reboot with a WeatherCache in a temporary
+directory, and checks what it fetched, what it skipped and what it saved.
+The replay's WiFiManager stand-in answers the same way.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from json_stream import Selector
+from sim.json_bench import WEATHER_FIELDS
+from weather import WeatherCache, WeatherService
+
+TRACES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+DT = WEATHER_FIELDS.index(("dt",))
+
+
+def validators(body):
+    """The ETag and Last-Modified for ``body``."""
+    etag = '"{}"'.format(hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16])
+    modified = formatdate(body["dt"], usegmt=True) if "dt" in body else None
+    return etag, modified
+
+
+def not_modified(body, headers):
+    """Whether a request with ``headers`` (lowercase names) already has ``body``."""
+    etag, modified = validators(body)
+    if "if-none-match" in headers:
+        return headers["if-none-match"] == etag
+    since = headers.get("if-modified-since")
+    if since and modified:
+        try:
+            return parsedate_to_datetime(since).timestamp() >= body["dt"]
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class WeatherServer(ThreadingHTTPServer):
+
+    def __init__(self, entries, port=0, validators=True):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.entries = entries
+        self.validators = validators
+        self.requests = 0
+        self.not_modified = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/data/2.5/weather".format(self.server_address[1])
+
+    def next_entry(self):
+        with self._lock:
+            entry = self.entries[min(self._next, len(self.entries) - 1)]
+            self._next += 1
+            self.requests += 1
+        return entry
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        entry = self.server.next_entry()
+        time.sleep(entry.get("latency", 0))
+        if "error" in entry:
+            self.send_error(503, entry["error"])
+            return
+        body = entry.get("body", entry)
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        if self.server.validators and not_modified(body, headers):
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if self.server.validators:
+            etag, modified = validators(body)
+            self.send_header("ETag", etag)
+            if modified:
+                self.send_header("Last-Modified", modified)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Response:
+    """What WeatherService uses of an adafruit_requests response."""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.status_code = raw.status
+        self.headers = {k.lower(): v for k, v in raw.headers.items()}
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        while True:
+            chunk = self._raw.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def json(self):
+        return json.loads(self._raw.read())
+
+    def close(self):
+        self._raw.close()
+
+
+class UrlNetwork:
+    """requests-style get() over urllib."""
+
+    def get(self, url, headers=None, **kwargs):
+        request = urllib.request.Request(url, headers=headers or {})
+        try:
+            return Response(urllib.request.urlopen(request, timeout=10))
+        except urllib.error.HTTPError as e:
+            # 304s and errors alike; WeatherService looks at the status
+            return Response(e)
+
+
+def check(entries, validators=True):
+    """Run WeatherService through the trace's first two readings and a
+    reboot; returns the failed expectations."""
+    readings = [e.get("body", e) for e in entries if "error" not in e]
+    later = [body for body in readings[1:] if body.get("dt") != readings[0].get("dt")]
+    if not readings or not later:
+        return ["the trace needs two readings with different dt"]
+    first, second = {"body": readings[0]}, {"body": later[0]}
+    # The first reading twice, an error, then the second
+    script = [first, first, first, {"error": "overloaded"}, second]
+    server = WeatherServer(script, validators=validators)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "weather_cache.json")
+    failed = []
+
+    def expect(ok, what):
+        print("{} {}".format("ok  " if ok else "FAIL", what))
+        if not ok:
+            failed.append(what)
+
+    def service():
+        return WeatherService(UrlNetwork(), server.url, selector=Selector(WEATHER_FIELDS),
+                              cache=WeatherCache(path), dt=DT)
+
+    try:
+        weather = service()
+        expect(weather.data is None, "no cache to start from")
+        expect(weather.fetch() and weather.updated, "first fetch is new data")
+        saved = WeatherCache(path)
+        expect(saved.load() and saved.dt == first["body"]["dt"], "saved to the cache")
+        saved_at = os.stat(path).st_mtime_ns
+
+        # A reboot
+        weather = service()
+        now = time.monotonic()
+        expect(weather.data == saved.data, "cached data there at boot")
+        expect(weather.stale(now) and weather.age(now) is None, "cached data is stale until fetched")
+        expect(weather.fetch() and not weather.updated, "same reading isn't new")
+        expect(not weather.stale(time.monotonic()), "and is fresh again")
+        expect(os.stat(path).st_mtime_ns == saved_at, "nor saved again")
+        expect(weather.fetch() and not weather.updated and weather.unchanged == 2,
+               "nor the next time")
+        if validators:
+            expect(server.not_modified == 2, "those were 304s")
+        else:
+            expect(server.not_modified == 0, "those were full responses")
+        expect(not weather.fetch() and weather.data == saved.data, "a failure keeps the data")
+        expect(weather.fetch() and weather.updated and weather.data[DT] == second["body"]["dt"],
+               "a new reading is new")
+        saved.load()
+        expect(saved.dt == second["body"]["dt"], "and saved")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(directory, ignore_errors=True)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("trace", nargs="?", default=os.path.join(TRACES, "basic.json"))
+    parser.add_argument("--serve", action="store_true", help="just serve the trace")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-validators", action="store_true",
+                        help="send no ETag or Last-Modified, like OpenWeather")
+    args = parser.parse_args(argv)
+    with open(args.trace) as f:
+        entries = json.load(f).get("weather", [])
+    if not entries:
+        parser.error("no weather responses in {}".format(args.trace))
+    if args.serve:
+        server = WeatherServer(entries, port=args.port, validators=not args.no_validators)
+        print("Serving {} responses at {}".format(len(entries), server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    failed = check(entries, validators=not args.no_validators)
+    print("{} failed".format(len(failed)) if failed else "all ok")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
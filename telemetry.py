@@ -0,0 +1,133 @@
+"""
+Running statistics cheap enough to leave on.
+
+A Histogram counts samples into fixed buckets of milliseconds, and keeps
+their count, total and maximum. Recording a sample rounds it to whole ms
+once and from there does only small-int arithmetic, so the histogram holds
+no floats; the mean is worked out when summing up, and percentiles are
+read off the buckets, to the bucket's upper bound.
+
+Telemetry holds the sign's histograms by name (scheduler passes, the MQTT
+loop, weather fetches, garbage collections and each mode's update()), along
+with the lowest and mean free heap, and every ``interval`` seconds sums them
+up as a short JSON object and starts over. code.py publishes that on
+display/<subtopic>/stats.
+"""
+
+import gc
+import json
+import time
+from array import array
+
+# Upper bounds of the buckets, in ms; the last bucket is everything above
+BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counts = array("L", [0] * (len(bounds) + 1))
+        self.count = 0
+        self.total = 0          # ms; a summary interval's worth stays a small int
+        self.max = 0
+
+    def add(self, seconds):
+        ms = int(seconds * 1000 + 0.5)
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        bounds = self.bounds
+        i = 0
+        n = len(bounds)
+        while i < n and ms > bounds[i]:
+            i += 1
+        self.counts[i] += 1
+
+    def percentile(self, q):
+        """Upper bound in ms of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i in range(len(self.counts)):
+            seen += self.counts[i]
+            if seen >= rank:
+                break
+        if i < len(self.bounds) and self.bounds[i] < self.max:
+            return self.bounds[i]
+        return self.max
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def summary(self):
+        """[count, mean, p50, p95, max], times in whole ms."""
+        return [self.count, round(self.mean()), self.percentile(0.5),
+                self.percentile(0.95), self.max]
+
+
+class Telemetry:
+
+    def __init__(self, interval=300):
+        """
+        :param interval: seconds between summaries
+
+        """
+        self.interval = interval
+        self.histograms = {}
+        self.gc = self.histogram("gc")
+        self.started = time.monotonic()
+        self.next_summary = self.started + interval
+        self._reset_heap()
+
+    def histogram(self, name, bounds=BOUNDS):
+        """The histogram called ``name``, made the first time it's asked for."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = Histogram(bounds)
+            self.histograms[name] = histogram
+        return histogram
+
+    def _reset_heap(self):
+        self.heap_min = None
+        self.heap_mean = 0.0
+        self.heap_samples = 0
+
+    def sample_heap(self):
+        free = gc.mem_free()
+        if self.heap_min is None or free < self.heap_min:
+            self.heap_min = free
+        self.heap_samples += 1
+        self.heap_mean += (free - self.heap_mean) / self.heap_samples
+
+    def collect(self):
+        """gc.collect(), timed."""
+        start = time.monotonic()
+        gc.collect()
+        self.gc.add(time.monotonic() - start)
+
+    def due(self, now):
+        return now >= self.next_summary
+
+    def summary(self, now=None):
+        """The stats since the last summary as JSON, and start over."""
+        if now is None:
+            now = time.monotonic()
+        stats = {"up": round(now - self.started),
+                 "heap": [self.heap_min or 0, round(self.heap_mean)]}
+        for name, histogram in self.histograms.items():
+            if histogram.count:
+                stats[name] = histogram.summary()
+            histogram.reset()
+        self._reset_heap()
+        self.next_summary = now + self.interval
+        return json.dumps(stats)
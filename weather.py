@@ -0,0 +1,209 @@
+"""
+OpenWeather fetching, kept off the render path.
+
+WeatherService decides when a fetch is due, keeps the last good response
+for as long as fetches keep failing, and backs off exponentially with jitter
+between retries. It also keeps the numbers needed to tell how often the sign
+is showing old data: fetch latency, failure counts and the age of the data.
+
+WeatherCache keeps the last good response on flash, so after a reset there
+is weather to show before the network is up: it's shown as stale, since
+nothing says how old it is, until a fetch confirms or replaces it. The
+service sends the response's ETag and Last-Modified back with each fetch,
+so a server that supports conditional requests can answer 304 instead of
+resending the body, and compares OpenWeather's ``dt`` (when the reading was
+taken) with the data it has, so a response that only repeats it isn't
+treated, redrawn or saved as new.
+"""
+
+import json
+import random
+import time
+
+
+class WeatherCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.dt = None
+        self.etag = None
+        self.modified = None
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+            self.data = cached["data"]
+            self.dt = cached.get("dt")
+            self.etag = cached.get("etag")
+            self.modified = cached.get("modified")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("No cached weather: {}".format(e))
+            self.data = None
+            return False
+        return True
+
+    def save(self, data, dt, etag, modified):
+        """Write the response to flash. Fails, returning False, unless boot.py
+        remounted the filesystem writable."""
+        self.data = data
+        self.dt = dt
+        self.etag = etag
+        self.modified = modified
+        try:
+            with open(self.path, "w") as f:
+                json.dump({"dt": dt, "etag": etag, "modified": modified, "data": data}, f)
+        except OSError as e:
+            print("Couldn't cache weather: {}".format(e))
+            return False
+        return True
+
+
+class WeatherService:
+
+    def __init__(self, network, url, *, selector=None, interval=600, stale_after=1800,
+                 retry_min=30, retry_max=600, cache=None, dt=None):
+        """
+        :param network: anything with a requests-style ``get(url, headers=...)``
+        :param url: the OpenWeather query
+        :param selector: a json_stream.Selector; if given, ``data`` is its
+            record, streamed off the socket, rather than the whole response
+        :param interval: seconds between fetches while they succeed
+        :param stale_after: age in seconds past which the data counts as stale
+        :param retry_min: first retry delay after a failure
+        :param retry_max: cap on the retry delay
+        :param cache: a WeatherCache to start from and keep up to date, if any
+        :param dt: index of ``dt`` in the selector's record; without a
+            selector it's read from the response
+
+        """
+        self.network = network
+        self.url = url
+        self.selector = selector
+        self.interval = interval
+        self.stale_after = stale_after
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+
+        self.data = None
+        self.timestamp = 0      # when data was fetched
+        self.next_fetch = 0
+
+        self.fetches = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.last_error = None
+        self.histogram = None   # of fetch latencies, for telemetry
+
+        self.dt_field = dt
+        self.updated = False    # whether the last fetch brought a new reading
+        self.unchanged = 0      # fetches that didn't
+        self.etag = None
+        self.modified = None
+        self.cache = cache
+        # Cached data is of unknown age, so stale until a fetch vouches for it
+        self.from_cache = False
+        if cache is not None and cache.load():
+            self.data = cache.data
+            self.etag = cache.etag
+            self.modified = cache.modified
+            self.from_cache = True
+
+    def due(self, now):
+        return now >= self.next_fetch
+
+    def age(self, now):
+        """Seconds since the data was fetched, or None if there is none or
+        it came from the cache."""
+        if self.data is None or self.from_cache:
+            return None
+        return now - self.timestamp
+
+    def stale(self, now):
+        return self.data is None or self.from_cache or now - self.timestamp > self.stale_after
+
+    def dt(self, data):
+        """OpenWeather's time of the reading in ``data``, if known."""
+        if data is None:
+            return None
+        if self.selector:
+            return None if self.dt_field is None else data[self.dt_field]
+        return data.get("dt")
+
+    def fetch(self, now=None):
+        """Try to fetch new data. Returns True if it worked, and sets
+        ``updated`` if ``data`` holds a new reading; on failure the old data
+        stays and the next attempt is backed off."""
+        if now is None:
+            now = time.monotonic()
+        self.fetches += 1
+        headers = {}
+        if self.data is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.modified:
+                headers["If-Modified-Since"] = self.modified
+        try:
+            response = self.network.get(self.url, headers=headers)
+            status = response.status_code
+            if status == 304 and self.data is not None:
+                data = self.data
+            elif status != 200:
+                response.close()
+                raise ValueError("HTTP status {}".format(status))
+            elif self.selector:
+                data = self.selector.parse(response.iter_content(64))
+                if None in data:
+                    raise ValueError("Missing fields in weather response")
+            else:
+                data = response.json()
+            etag = response.headers.get("etag", self.etag)
+            modified = response.headers.get("last-modified", self.modified)
+            response.close()
+        except Exception as e:
+            done = time.monotonic()
+            self._record_latency(done - now)
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = repr(e)
+            delay = min(self.retry_max, self.retry_min * 2 ** (self.consecutive_failures - 1))
+            # Full jitter on the upper half, so signs sharing an AP don't retry in lockstep
+            self.next_fetch = done + random.uniform(delay / 2, delay)
+            print("Some error occurred getting weather! {}\n".format(self.last_error))
+            return False
+        done = time.monotonic()
+        self._record_latency(done - now)
+        self.consecutive_failures = 0
+        dt = self.dt(data)
+        self.updated = status != 304 and (dt is None or dt != self.dt(self.data))
+        if not self.updated:
+            self.unchanged += 1
+        if self.cache is not None and (self.updated or etag != self.etag
+                                       or modified != self.modified):
+            self.cache.save(data, dt, etag, modified)
+        self.data = data
+        self.etag = etag
+        self.modified = modified
+        self.from_cache = False
+        self.timestamp = done
+        self.next_fetch = done + self.interval
+        return True
+
+    def _record_latency(self, latency):
+        self.last_latency = latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+        if self.histogram is not None:
+            self.histogram.add(latency)
+
+    def __str__(self):
+        now = time.monotonic()
+        age = self.age(now)
+        return "weather: {} fetches, {} failed ({} in a row), {} unchanged, {:.2f} s last, " \
+            "{:.2f} s max, age {}".format(
+                self.fetches, self.failures, self.consecutive_failures, self.unchanged,
+                self.last_latency, self.max_latency,
+                "cached" if self.from_cache else "none" if age is None else "{:.0f} s".format(age))
@@ -0,0 +1,192 @@
+"""
+Weather history on a fixed budget.
+
+WeatherHistory keeps the last ``capacity`` readings of temperature,
+pressure, humidity and wind speed in arrays used as a ring buffer, stamped
+with OpenWeather's ``dt`` rather than time.monotonic() so that they still
+line up after a reboot, and saves them to flash after each new reading.
+
+Trends are least-squares slopes, in units per hour, over the newest
+``window`` readings. They come from running sums that each reading adds to
+and the one leaving the window subtracts from, so adding a reading is O(1)
+however long the history is. Every ``window`` readings the sums are rebuilt
+around the current window, which keeps the numbers small enough for
+CircuitPython's floats and stops rounding errors from piling up.
+"""
+
+import struct
+from array import array
+
+TEMP = 0
+PRESSURE = 1
+HUMIDITY = 2
+WIND = 3
+FIELDS = 4
+
+# Times are kept as seconds since 2020 so they stay small ints on the board
+EPOCH = 1577836800
+
+_MAGIC = b"WHS1"
+_HEADER = ">4sHHH"  # magic, capacity, count, index of the oldest reading
+
+
+class WeatherHistory:
+
+    def __init__(self, capacity=72, window=18, path=None):
+        """
+        :param capacity: readings kept; 72 is 12 hours at one per 10 minutes
+        :param window: newest readings the trends are fitted to
+        :param path: file to load from and save to, if any
+
+        """
+        self.capacity = capacity
+        self.window = min(window, capacity)
+        self.path = path
+        self.times = array("i", [0] * capacity)
+        self.values = [array("f", [0] * capacity) for _ in range(FIELDS)]
+        self.count = 0
+        self._head = 0
+        self._reset_sums()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return self.count
+
+    def _index(self, i):
+        """Slot of the i-th oldest reading; negative i counts from the newest."""
+        if i < 0:
+            i += self.count
+        return (self._head + i) % self.capacity
+
+    def time(self, i):
+        """Unix time of the i-th oldest reading."""
+        return self.times[self._index(i)] + EPOCH
+
+    def value(self, field, i):
+        return self.values[field][self._index(i)]
+
+    def latest(self, field):
+        return self.values[field][self._index(-1)] if self.count else None
+
+    def span(self):
+        """Hours between the oldest and newest readings."""
+        if self.count < 2:
+            return 0
+        return (self.times[self._index(-1)] - self.times[self._head]) / 3600
+
+    def add(self, t, temp, pressure, humidity, wind):
+        """Record a reading taken at unix time ``t``. Returns False, and
+        records nothing, if it is no newer than the last one."""
+        t -= EPOCH
+        if self.count and t <= self.times[self._index(-1)]:
+            return False
+        if self._n == self.window:
+            self._account(self._index(-self.window), -1)
+        if self.count == self.capacity:
+            slot = self._head
+            self._head = (self._head + 1) % self.capacity
+        else:
+            slot = self._index(self.count)
+            self.count += 1
+        self.times[slot] = t
+        values = self.values
+        values[TEMP][slot] = temp
+        values[PRESSURE][slot] = pressure
+        values[HUMIDITY][slot] = humidity
+        values[WIND][slot] = wind
+        self._added += 1
+        if self._added >= self.window or self._n == 0:
+            self._rebuild()
+        else:
+            self._account(slot, 1)
+        return True
+
+    def slope(self, field):
+        """Least-squares trend of ``field`` in units per hour over the
+        window, or None with fewer than two readings."""
+        n = self._n
+        if n < 2:
+            return None
+        d = n * self._stt - self._st * self._st
+        if d <= 0:
+            return None
+        return (n * self._sty[field] - self._st * self._sy[field]) / d
+
+    def clear(self):
+        self.count = 0
+        self._head = 0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._n = 0
+        self._added = 0
+        self._origin = 0        # sums use hours since this time
+        self._st = 0.0
+        self._stt = 0.0
+        self._ref = [0.0] * FIELDS   # and values less these
+        self._sy = [0.0] * FIELDS
+        self._sty = [0.0] * FIELDS
+
+    # Add (sign=1) or remove (sign=-1) one reading from the running sums
+    def _account(self, slot, sign):
+        h = (self.times[slot] - self._origin) / 3600
+        self._n += sign
+        self._st += sign * h
+        self._stt += sign * h * h
+        for f in range(FIELDS):
+            y = self.values[f][slot] - self._ref[f]
+            self._sy[f] += sign * y
+            self._sty[f] += sign * h * y
+
+    # Recompute the sums over the window, centred on its oldest reading
+    def _rebuild(self):
+        n = min(self.window, self.count)
+        self._reset_sums()
+        if not n:
+            return
+        first = self._index(-n)
+        self._origin = self.times[first]
+        for f in range(FIELDS):
+            self._ref[f] = self.values[f][first]
+        for i in range(-n, 0):
+            self._account(self._index(i), 1)
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(struct.calcsize(_HEADER))
+                if len(header) != struct.calcsize(_HEADER):
+                    raise ValueError("truncated")
+                magic, capacity, count, head = struct.unpack(_HEADER, header)
+                if magic != _MAGIC or capacity != self.capacity or count > capacity:
+                    print("Ignoring weather history in {}".format(self.path))
+                    return False
+                # Every array holds 4-byte items
+                for a in [self.times] + self.values:
+                    if f.readinto(a) != 4 * len(a):
+                        raise ValueError("truncated")
+        except (OSError, ValueError) as e:
+            print("No weather history: {}".format(e))
+            self.clear()
+            return False
+        self.count = count
+        self._head = head
+        self._rebuild()
+        return True
+
+    def save(self):
+        """Write the history to flash. Fails, returning False, unless boot.py
+        remounted the filesystem writable."""
+        if not self.path:
+            return False
+        try:
+            with open(self.path, "wb") as f:
+                f.write(struct.pack(_HEADER, _MAGIC, self.capacity, self.count, self._head))
+                f.write(self.times)
+                for values in self.values:
+                    f.write(values)
+        except OSError as e:
+            print("Couldn't save weather history: {}".format(e))
+            return False
+        return True